@@ -0,0 +1,6 @@
+"""Puts the benchmarks' pyodbc stand-in on the path, so the dashboard tests run without an ODBC
+driver"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks" / "stubs"))
@@ -1,10 +1,67 @@
 """Script that creates the dashbaord for the plant data"""
 
+from datetime import datetime
 from dotenv import load_dotenv
 import streamlit as st
 import altair as alt
 import pandas as pd
-from dashboard_functions import get_db_connection, load_all_data, load_last_24_data, get_unique_plant_ids, make_temperature_graph, make_moisture_graph, make_country_pie_chart, get_botanists_and_plants, make_watered_per_day_chart, make_watered_per_hour_chart
+from data_cache import RecordingCache, REFRESH_TTL
+from dashboard_functions import TIME_WINDOWS, TEMPERATURE_COLUMNS, MOISTURE_COLUMNS, get_db_connection, get_window_start, combine_with_archive, load_archive_with_dimensions, load_window_with_archive, load_plants, load_botanists_and_plants, load_waterings_per_day, load_waterings_per_hour, get_unique_plant_ids, make_temperature_graph, make_moisture_graph, make_country_pie_chart, make_watered_per_day_chart, make_watered_per_hour_chart
+
+
+@st.cache_resource
+def get_recording_cache() -> RecordingCache:
+    """Gets the recording cache shared by every session of this server"""
+    cache = RecordingCache(get_db_connection)
+    cache.start_eviction()
+    return cache
+
+
+@st.cache_data(ttl=REFRESH_TTL)
+def get_window_data(columns: tuple, start: datetime, plant_ids: tuple | None = None) -> pd.DataFrame:
+    """Gets the columns a chart needs for the recordings taken since start, from the database
+    and the archive, shared by every session asking for the same window within the TTL"""
+    conn = get_db_connection()
+    try:
+        return load_window_with_archive(
+            conn, list(columns), start,
+            plant_ids=list(plant_ids) if plant_ids is not None else None)
+    finally:
+        conn.close()
+
+
+@st.cache_data(ttl=REFRESH_TTL)
+def get_archived_data(columns: tuple, plant_ids: tuple) -> pd.DataFrame:
+    """Gets the archived readings of some plants, shared by every session within the TTL"""
+    conn = get_db_connection()
+    try:
+        return load_archive_with_dimensions(conn, list(columns), plant_ids=list(plant_ids))
+    finally:
+        conn.close()
+
+
+def with_archive(plants_data: pd.DataFrame, columns: list[str], plant_ids: list[int]) -> pd.DataFrame:
+    """Adds the archived readings of the selected plants to the cached recent readings"""
+    recent = plants_data.loc[plants_data['plant_id'].isin(plant_ids), columns]
+    # the cache can still hold readings archived since it was loaded
+    return combine_with_archive(get_archived_data(tuple(columns), tuple(plant_ids)), recent)
+
+
+@st.cache_data(ttl=REFRESH_TTL)
+def get_summaries(last_24_start: datetime) -> dict[str, pd.DataFrame]:
+    """Gets the plant list and the overview and watering aggregates, shared by every session
+    within the TTL. None of them need the recordings to be loaded."""
+    conn = get_db_connection()
+    try:
+        return {
+            "plants": load_plants(conn),
+            "botanists_and_plants": load_botanists_and_plants(conn),
+            "waterings_per_day": load_waterings_per_day(conn),
+            "waterings_per_hour": load_waterings_per_hour(conn, last_24_start),
+        }
+    finally:
+        conn.close()
+
 
 if __name__ == "__main__":
     st.set_page_config(page_title="LMNH Plant Analysis",
@@ -14,59 +71,60 @@ if __name__ == "__main__":
     st.title(
         ":bar_chart: :potted_plant: LMNH Plant Analysis :potted_plant: :bar_chart:")
 
-    connection = get_db_connection()
-
-    plants_data = load_all_data(connection)
-    plants_data_24 = load_last_24_data(connection)
-
-    plants_data['recording_taken'] = pd.to_datetime(
-        plants_data['recording_taken'])
-    plants_data['last_watered'] = pd.to_datetime(plants_data['last_watered'])
+    summaries = get_summaries(get_window_start(TIME_WINDOWS["Last 24 Hours"]))
+    plants = summaries["plants"]
 
     # -----SIDEBAR-----
 
-    st.sidebar.write(plants_data[['plant_id', 'name']].drop_duplicates())
+    st.sidebar.write(plants[['plant_id', 'name']])
     st.sidebar.header("Please Filter Here:")
 
     plant_id = st.sidebar.multiselect(
         "Select a Plant by it's ID 🪴 :",
-        options=get_unique_plant_ids(plants_data).plant_id
+        options=get_unique_plant_ids(plants).plant_id
     )
     add_selectbox = st.sidebar.selectbox(
-        "Select this box if you would like to view data for the past 24 hours",
-        ("All data", "Last 24 Hours")
+        "Select this box if you would like to view data for a recent time window",
+        tuple(TIME_WINDOWS)
     )
+    window_start = get_window_start(TIME_WINDOWS[add_selectbox])
 
     # ---OVERVIEW-----
     st.subheader("Overview", divider='rainbow')
 
     col1, col2 = st.columns(2)
 
-    num_of_plants = plants_data['name'].nunique()
+    num_of_plants = plants['name'].nunique()
     col1.metric("Total Number of Plants", num_of_plants)
-    col2.write(get_botanists_and_plants(plants_data))
+    col2.write(summaries["botanists_and_plants"])
 
     # TEMPERATURE OVERTIME
     st.subheader('Temperature overtime', divider='rainbow')
 
-    if add_selectbox == "All data":
-        st.altair_chart(make_temperature_graph(
-            plants_data, plant_id), use_container_width=True)
+    # only the all data view needs the shared recording cache, archived readings are only
+    # fetched for the plants on show
+    plants_data = get_recording_cache().get() if window_start is None else None
 
-    if add_selectbox == "Last 24 Hours":
+    if window_start is None:
+        st.altair_chart(make_temperature_graph(
+            with_archive(plants_data, TEMPERATURE_COLUMNS, plant_id), plant_id),
+            use_container_width=True)
+    else:
         st.altair_chart(make_temperature_graph(
-            plants_data_24, plant_id), use_container_width=True)
+            get_window_data(tuple(TEMPERATURE_COLUMNS), window_start, tuple(plant_id)),
+            plant_id), use_container_width=True)
 
     # MOISTURE OVERTIME
     st.subheader('Moisture overtime', divider='rainbow')
 
-    if add_selectbox == "All data":
+    if window_start is None:
         st.altair_chart(make_moisture_graph(
-            plants_data, plant_id), use_container_width=True)
-
-    if add_selectbox == "Last 24 Hours":
+            with_archive(plants_data, MOISTURE_COLUMNS, plant_id), plant_id),
+            use_container_width=True)
+    else:
         st.altair_chart(make_moisture_graph(
-            plants_data_24, plant_id), use_container_width=True)
+            get_window_data(tuple(MOISTURE_COLUMNS), window_start, tuple(plant_id)),
+            plant_id), use_container_width=True)
 
     # LAST WATERED
 
@@ -75,16 +133,16 @@ if __name__ == "__main__":
     with col1:
         st.subheader("How many plants are being watered each day?")
 
-        st.altair_chart(make_watered_per_day_chart(plants_data))
+        st.altair_chart(make_watered_per_day_chart(summaries["waterings_per_day"]))
 
     with col2:
         st.subheader(
             "How many have been watered per hour in the last 24 hours?")
 
-        st.altair_chart(make_watered_per_hour_chart(plants_data_24))
+        st.altair_chart(make_watered_per_hour_chart(summaries["waterings_per_hour"]))
 
     # COUNTRIES AND PLANTS
 
     st.subheader('The Diversity of the plants based on Country')
-    st.altair_chart(make_country_pie_chart(plants_data))
+    st.altair_chart(make_country_pie_chart(plants))
 
@@ -5,11 +5,56 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import pandas as pd
 import altair as alt
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
 import pyodbc
 
-
-LAST_24_LIMIT = (datetime.now() - timedelta(hours=24)
-                 ).strftime("%Y-%m-%d %H:%M:%S")
+from downsample import CHART_WIDTH, downsample_readings
+from recording_dtypes import ARCHIVE_COLUMNS, RECORDING_DTYPES
+
+
+# the time windows the dashboard can show, None is every recording
+TIME_WINDOWS = {
+    "All data": None,
+    "Last 24 Hours": timedelta(hours=24),
+    "Last 7 Days": timedelta(days=7),
+    "Last 30 Days": timedelta(days=30),
+}
+
+# the columns a time window query can return, with the table each one is read from
+WINDOW_COLUMNS = {
+    "recording_id": "s_alpha.recording_event.recording_id",
+    "plant_id": "s_alpha.recording_event.plant_id",
+    "botanist_id": "s_alpha.recording_event.botanist_id",
+    "soil_moisture": "s_alpha.recording_event.soil_moisture",
+    "temperature": "s_alpha.recording_event.temperature",
+    "recording_taken": "s_alpha.recording_event.recording_taken",
+    "last_watered": "s_alpha.recording_event.last_watered",
+    "name": "s_alpha.plant.name",
+    "image_url": "s_alpha.plant.image_url",
+    "first_name": "s_alpha.botanist.first_name",
+    "last_name": "s_alpha.botanist.last_name",
+    "country": "s_alpha.origin_location.country",
+}
+WINDOW_JOINS = {
+    "s_alpha.plant": """JOIN s_alpha.plant
+                ON s_alpha.plant.plant_id = s_alpha.recording_event.plant_id""",
+    "s_alpha.botanist": """JOIN s_alpha.botanist
+                ON s_alpha.botanist.botanist_id = s_alpha.recording_event.botanist_id""",
+    "s_alpha.origin_location": """JOIN s_alpha.origin_location
+                ON s_alpha.origin_location.origin_location_id = s_alpha.plant.origin_location_id""",
+}
+
+# where the pipeline's archive stage writes readings that have aged out of the database
+ARCHIVE_PATH = environ.get("ARCHIVE_PATH", "archive")
+ARCHIVE_ENDPOINT = environ.get("ARCHIVE_ENDPOINT")
+ARCHIVE_PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.string()), ("plant_id", pa.int32())]), flavor="hive")
+
+# the columns each windowed chart needs
+TEMPERATURE_COLUMNS = ["plant_id", "name", "recording_taken", "temperature"]
+MOISTURE_COLUMNS = ["plant_id", "name", "recording_taken", "soil_moisture"]
 
 
 def get_db_connection():
@@ -26,9 +71,10 @@ def get_db_connection():
         print("Error connecting to database: ", e)
 
 
-def load_all_data(conn: pyodbc.Connection) -> pd.DataFrame:
-    """Loads all recording event data as a dataframe."""
-    query = """SELECT s_alpha.recording_event.*, s_alpha.plant.name, s_alpha.plant.image_url,
+RECORDING_QUERY = """SELECT s_alpha.recording_event.recording_id, s_alpha.recording_event.plant_id,
+                s_alpha.recording_event.botanist_id, s_alpha.recording_event.soil_moisture,
+                s_alpha.recording_event.temperature, s_alpha.recording_event.recording_taken,
+                s_alpha.recording_event.last_watered, s_alpha.plant.name, s_alpha.plant.image_url,
                 s_alpha.botanist.first_name, s_alpha.botanist.last_name,
                 s_alpha.origin_location.country
                 FROM s_alpha.recording_event
@@ -37,25 +83,234 @@ def load_all_data(conn: pyodbc.Connection) -> pd.DataFrame:
                 JOIN s_alpha.botanist
                 ON s_alpha.botanist.botanist_id = s_alpha.recording_event.botanist_id
                 JOIN s_alpha.origin_location
+                ON s_alpha.origin_location.origin_location_id = s_alpha.plant.origin_location_id"""
+
+
+NEW_RECORDING_QUERY = f"""{RECORDING_QUERY}
+                WHERE s_alpha.recording_event.recording_id > ?;"""
+
+
+def compact_recordings(data: pd.DataFrame) -> pd.DataFrame:
+    """Casts recording columns to their compact dtypes"""
+    return data.astype({column: dtype for column, dtype in RECORDING_DTYPES.items()
+                        if column in data.columns})
+
+
+def load_all_data(conn: pyodbc.Connection) -> pd.DataFrame:
+    """Loads all recording event data as a dataframe."""
+    data = pd.read_sql(f"{RECORDING_QUERY};", conn)
+    return compact_recordings(data)
+
+
+def load_new_data(conn: pyodbc.Connection, last_recording_id: int) -> pd.DataFrame:
+    """Loads the recording event data added after last_recording_id as a dataframe."""
+    data = pd.read_sql(NEW_RECORDING_QUERY, conn, params=(last_recording_id,))
+    return compact_recordings(data)
+
+
+def get_window_start(window: timedelta | None, now: datetime | None = None) -> datetime | None:
+    """Gets the start of a time window ending now, rounded down to the minute so repeated
+    requests within a minute ask for the same window"""
+    if window is None:
+        return None
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    return now - window
+
+
+def build_window_query(columns: list[str], start: datetime | None = None,
+                       end: datetime | None = None,
+                       plant_ids: list[int] | None = None) -> tuple[str, list]:
+    """Builds a parameterised query for the given columns of the recordings taken between
+    start and end, optionally only for some plants. Only the tables the columns come from are joined."""
+    unknown = set(columns) - WINDOW_COLUMNS.keys()
+    if unknown:
+        raise ValueError(f"Unknown columns: {sorted(unknown)}")
+
+    tables = {WINDOW_COLUMNS[column].rsplit(".", 1)[0] for column in columns}
+    if "s_alpha.origin_location" in tables:
+        tables.add("s_alpha.plant")
+    joins = [join for table, join in WINDOW_JOINS.items() if table in tables]
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("s_alpha.recording_event.recording_taken >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("s_alpha.recording_event.recording_taken < ?")
+        params.append(end)
+    if plant_ids is not None:
+        placeholders = ", ".join("?" * len(plant_ids))
+        conditions.append(f"s_alpha.recording_event.plant_id IN ({placeholders})")
+        params.extend(plant_ids)
+
+    select = ", ".join(f"{WINDOW_COLUMNS[column]} AS {column}" for column in columns)
+    query = "\n                ".join(
+        [f"SELECT {select}", "FROM s_alpha.recording_event", *joins])
+    if conditions:
+        query += "\n                WHERE " + " AND ".join(conditions)
+    return query + ";", params
+
+
+def load_window(conn: pyodbc.Connection, columns: list[str], start: datetime | None = None,
+                end: datetime | None = None, plant_ids: list[int] | None = None) -> pd.DataFrame:
+    """Loads the given columns of the recordings taken in a time window as a dataframe."""
+    if plant_ids is not None and not plant_ids:
+        return compact_recordings(pd.DataFrame(columns=columns))
+    query, params = build_window_query(columns, start, end, plant_ids)
+    data = pd.read_sql(query, conn, params=params)
+    return compact_recordings(data)
+
+
+def load_last_24_data(conn, columns: list[str] | None = None) -> pd.DataFrame:
+    """Loads recordings data taken in the last 24 hours as a dataframe."""
+    return load_window(conn, columns or list(WINDOW_COLUMNS),
+                       get_window_start(TIME_WINDOWS["Last 24 Hours"]))
+
+
+def get_archive_dataset(archive_path: str = ARCHIVE_PATH,
+                        endpoint: str | None = ARCHIVE_ENDPOINT) -> ds.Dataset | None:
+    """Opens the Parquet archive, or returns None if nothing has been archived yet"""
+    if archive_path.startswith("s3://"):
+        filesystem, archive_path = pafs.S3FileSystem(
+            endpoint_override=endpoint), archive_path[len("s3://"):]
+    else:
+        filesystem = pafs.LocalFileSystem()
+    if filesystem.get_file_info(archive_path).type == pafs.FileType.NotFound:
+        return None
+    return ds.dataset(archive_path, filesystem=filesystem, format="parquet",
+                      partitioning=ARCHIVE_PARTITIONING)
+
+
+def load_archive(columns: list[str], start: datetime | None = None, end: datetime | None = None,
+                 plant_ids: list[int] | None = None,
+                 archive_path: str = ARCHIVE_PATH) -> pd.DataFrame:
+    """Loads the given reading columns from the archive for a time window. The date and
+    plant_id filters prune whole partitions, so only the matching files are read."""
+    dataset = get_archive_dataset(archive_path)
+    if dataset is None or (plant_ids is not None and not plant_ids):
+        return compact_recordings(pd.DataFrame(columns=columns))
+
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("date") >= start.strftime("%Y-%m-%d"))
+        conditions.append(ds.field("recording_taken") >= pd.Timestamp(start))
+    if end is not None:
+        conditions.append(ds.field("date") <= end.strftime("%Y-%m-%d"))
+        conditions.append(ds.field("recording_taken") < pd.Timestamp(end))
+    if plant_ids is not None:
+        conditions.append(ds.field("plant_id").isin(plant_ids))
+
+    condition = None
+    for part in conditions:
+        condition = part if condition is None else condition & part
+    data = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    return compact_recordings(data)
+
+
+def load_archive_with_dimensions(conn: pyodbc.Connection, columns: list[str],
+                                 start: datetime | None = None, end: datetime | None = None,
+                                 plant_ids: list[int] | None = None,
+                                 archive_path: str = ARCHIVE_PATH) -> pd.DataFrame:
+    """Loads a time window from the archive. Archived readings only hold the reading columns,
+    so any plant and botanist columns are looked up from the small dimension tables."""
+    plant_columns = [column for column in columns if column in ("name", "image_url", "country")]
+    botanist_columns = [column for column in columns if column in ("first_name", "last_name")]
+    archive_columns = list(dict.fromkeys(
+        [column for column in columns if column in ARCHIVE_COLUMNS]
+        + (["plant_id"] if plant_columns else [])
+        + (["botanist_id"] if botanist_columns else [])))
+    archived = load_archive(archive_columns, start, end, plant_ids, archive_path)
+
+    if plant_columns:
+        archived = archived.merge(load_plants(conn)[["plant_id"] + plant_columns],
+                                  on="plant_id", how="left")
+    if botanist_columns:
+        archived = archived.merge(load_botanists(conn)[["botanist_id"] + botanist_columns],
+                                  on="botanist_id", how="left")
+    return compact_recordings(archived[columns])
+
+
+def load_window_with_archive(conn: pyodbc.Connection, columns: list[str],
+                             start: datetime | None = None, end: datetime | None = None,
+                             plant_ids: list[int] | None = None,
+                             archive_path: str = ARCHIVE_PATH) -> pd.DataFrame:
+    """Loads a time window from the database and the archive together"""
+    hot = load_window(conn, columns, start, end, plant_ids)
+    archived = load_archive_with_dimensions(conn, columns, start, end, plant_ids, archive_path)
+    return combine_with_archive(archived, hot)
+
+
+def combine_with_archive(archived: pd.DataFrame, hot: pd.DataFrame) -> pd.DataFrame:
+    """Puts archived readings before the database ones, keeping one copy of any reading in both.
+    A run interrupted between writing the archive and deleting from the database leaves readings
+    in both for a while, and so does data cached from before the archive run."""
+    if archived.empty:
+        return hot
+
+    combined = pd.concat([archived, hot], ignore_index=True)
+    keys = ["plant_id", "recording_taken"]
+    if set(keys) <= set(combined.columns):
+        combined = combined.drop_duplicates(subset=keys)
+    return compact_recordings(combined)
+
+
+def load_plants(conn: pyodbc.Connection) -> pd.DataFrame:
+    """Loads every plant with its name and country of origin, without touching the recordings."""
+    query = """SELECT s_alpha.plant.plant_id, s_alpha.plant.name, s_alpha.plant.image_url,
+                s_alpha.origin_location.country
+                FROM s_alpha.plant
+                JOIN s_alpha.origin_location
                 ON s_alpha.origin_location.origin_location_id = s_alpha.plant.origin_location_id;"""
     data = pd.read_sql(query, conn)
     return data
 
 
-def load_last_24_data(conn) -> pd.DataFrame:
-    """Loads recordings data taken in the last 24 hours as a dataframe."""
-    query = """SELECT s_alpha.recording_event.*, s_alpha.plant.name, s_alpha.plant.image_url,
-                s_alpha.botanist.first_name, s_alpha.botanist.last_name,
-                s_alpha.origin_location.country
-                FROM s_alpha.recording_event
-                JOIN s_alpha.plant
-                ON s_alpha.plant.plant_id = s_alpha.recording_event.plant_id
+def load_botanists(conn: pyodbc.Connection) -> pd.DataFrame:
+    """Loads every botanist's name."""
+    query = """SELECT botanist_id, first_name, last_name
+                FROM s_alpha.botanist;"""
+    data = pd.read_sql(query, conn)
+    return data
+
+
+def load_botanists_and_plants(conn: pyodbc.Connection) -> pd.DataFrame:
+    """Loads each botanist and the plants they have recorded from the botanist_plant view,
+    together with the pairs kept from readings that have been archived."""
+    query = """SELECT s_alpha.botanist.first_name + ' ' + s_alpha.botanist.last_name AS botanist,
+                recorded.plant_id
+                FROM (SELECT botanist_id, plant_id FROM s_alpha.botanist_plant WITH (NOEXPAND)
+                    UNION
+                    SELECT botanist_id, plant_id FROM s_alpha.archived_botanist_plant) AS recorded
                 JOIN s_alpha.botanist
-                ON s_alpha.botanist.botanist_id = s_alpha.recording_event.botanist_id
-                JOIN s_alpha.origin_location
-                ON s_alpha.origin_location.origin_location_id = s_alpha.plant.origin_location_id
-                WHERE recording_taken > ?;"""
-    data = pd.read_sql(query, conn, params=(LAST_24_LIMIT,))
+                ON s_alpha.botanist.botanist_id = recorded.botanist_id
+                ORDER BY botanist, plant_id;"""
+    data = pd.read_sql(query, conn)
+    botanists_and_plants = data.groupby('botanist')['plant_id'].agg(list).reset_index()
+    botanists_and_plants.columns = ['botanist', 'plants_worked_with']
+    return botanists_and_plants
+
+
+def load_waterings_per_day(conn: pyodbc.Connection) -> pd.DataFrame:
+    """Loads how many plants were watered on each day from the plant_watering view, together
+    with the waterings kept from readings that have been archived."""
+    query = """SELECT CAST(last_watered AS DATE) AS date, COUNT(*) AS count
+                FROM (SELECT plant_id, last_watered FROM s_alpha.plant_watering WITH (NOEXPAND)
+                    UNION
+                    SELECT plant_id, last_watered FROM s_alpha.archived_plant_watering) AS waterings
+                GROUP BY CAST(last_watered AS DATE)
+                ORDER BY date;"""
+    data = pd.read_sql(query, conn)
+    return data
+
+
+def load_waterings_per_hour(conn: pyodbc.Connection, start: datetime) -> pd.DataFrame:
+    """Loads how many plants were watered in each hour of the day since start from the plant_watering view."""
+    query = """SELECT DATEPART(HOUR, last_watered) AS Hour, COUNT(*) AS count
+                FROM s_alpha.plant_watering WITH (NOEXPAND)
+                WHERE last_watered >= ?
+                GROUP BY DATEPART(HOUR, last_watered)
+                ORDER BY Hour;"""
+    data = pd.read_sql(query, conn, params=(start,))
     return data
 
 
@@ -73,45 +328,55 @@ def get_unique_plant_ids(plants_data: pd.DataFrame) -> pd.DataFrame:
 def get_botanists_and_plants(plants_data: pd.DataFrame) -> pd.DataFrame:
     """Returns a dataframe of all the botanists and the plants they work on"""
 
-    plants_data['botanist_name'] = plants_data['first_name'] + \
-        ' ' + plants_data['last_name']
+    pairs = plants_data[['first_name', 'last_name', 'plant_id']].drop_duplicates()
 
-    botanists_and_plants = plants_data.drop_duplicates(
-        subset=['botanist_name', 'plant_id'])
+    botanists_and_plants = pairs.assign(
+        botanist=pairs['first_name'].astype(str) + ' ' + pairs['last_name'].astype(str))
 
     botanists_and_plants = botanists_and_plants.groupby(
-        'botanist_name')['plant_id'].agg(list).reset_index()
+        'botanist')['plant_id'].agg(list).reset_index()
     botanists_and_plants.columns = ['botanist', 'plants_worked_with']
 
     return botanists_and_plants
 
 
-def make_temperature_graph(plants_data: pd.DataFrame, selected: list) -> alt.Chart:
-    """Makes a line chart that plots the temperature against the recording for each plant"""
-
-    plants_data = plants_data[(plants_data['plant_id'].isin(selected))]
-
-    temperature_per_reading_graph = alt.Chart(plants_data).mark_line().encode(
+def make_range_chart(readings: pd.DataFrame, value_column: str, title: str) -> alt.LayerChart:
+    """Makes a line chart of each plant's mean reading per bucket over a band from the min to the max"""
+    base = alt.Chart(readings).encode(
         x='recording_taken:T',
-        y=alt.Y('temperature:Q', title='Temperature (°C)'),
         color='name:N'
     )
+    band = base.mark_area(opacity=0.3).encode(
+        y=alt.Y(f'{value_column}_min:Q', title=title),
+        y2=f'{value_column}_max:Q'
+    )
+    line = base.mark_line().encode(
+        y=alt.Y(f'{value_column}:Q', title=title)
+    )
 
-    return temperature_per_reading_graph
+    return band + line
 
 
-def make_moisture_graph(plants_data: pd.DataFrame, selected: list) -> alt.Chart:
-    """Makes a line chart that plots the moisture against the recording for each plant"""
+def make_temperature_graph(plants_data: pd.DataFrame, selected: list,
+                           width: int = CHART_WIDTH) -> alt.LayerChart:
+    """Makes a line chart that plots the temperature against the recording for each plant,
+    downsampled to about one point per pixel"""
 
     plants_data = plants_data[(plants_data['plant_id'].isin(selected))]
+    readings = downsample_readings(plants_data, 'temperature', width)
 
-    moisture_graph = alt.Chart(plants_data).mark_line().encode(
-        x='recording_taken:T',
-        y=alt.Y('soil_moisture:Q', title='Moisture as a %'),
-        color='name:N'
-    )
+    return make_range_chart(readings, 'temperature', 'Temperature (°C)')
+
+
+def make_moisture_graph(plants_data: pd.DataFrame, selected: list,
+                        width: int = CHART_WIDTH) -> alt.LayerChart:
+    """Makes a line chart that plots the moisture against the recording for each plant,
+    downsampled to about one point per pixel"""
 
-    return moisture_graph
+    plants_data = plants_data[(plants_data['plant_id'].isin(selected))]
+    readings = downsample_readings(plants_data, 'soil_moisture', width)
+
+    return make_range_chart(readings, 'soil_moisture', 'Moisture as a %')
 
 
 def make_country_pie_chart(plants_data: pd.DataFrame) -> alt.Chart:
@@ -129,25 +394,23 @@ def make_country_pie_chart(plants_data: pd.DataFrame) -> alt.Chart:
     return plant_country_chart
 
 
-def make_watered_per_day_chart(plants_data: pd.DataFrame) -> alt.Chart:
+def make_watered_per_day_chart(waterings_per_day: pd.DataFrame) -> alt.Chart:
     """Makes a bar chart that shows how many plants are being watered each day"""
 
-    plants_data['date'] = plants_data['last_watered'].dt.date
-    chart = alt.Chart(plants_data).mark_bar().encode(
+    chart = alt.Chart(waterings_per_day).mark_bar().encode(
         x=alt.X('date:O', title='date'),
-        y=alt.Y('count():Q', title='Number of plants watered')
+        y=alt.Y('count:Q', title='Number of plants watered')
     )
 
     return chart
 
 
-def make_watered_per_hour_chart(plants_data: pd.DataFrame) -> alt.Chart:
-    """Makes a bar chart that shows how many plants are being watered each day"""
+def make_watered_per_hour_chart(waterings_per_hour: pd.DataFrame) -> alt.Chart:
+    """Makes a bar chart that shows how many plants are being watered each hour"""
 
-    plants_data['Hour'] = plants_data['last_watered'].dt.hour
-    chart = alt.Chart(plants_data).mark_bar().encode(
+    chart = alt.Chart(waterings_per_hour).mark_bar().encode(
         x=alt.X('Hour:O', title='Hour'),
-        y=alt.Y('count():Q', title='Number of plants watered')
+        y=alt.Y('count:Q', title='Number of plants watered')
     )
 
     return chart
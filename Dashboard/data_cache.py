@@ -0,0 +1,123 @@
+"""Contains the recording data cache that every dashboard session shares"""
+import logging
+from threading import Event, Lock, Thread
+import time
+from typing import Callable
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from dashboard_functions import load_all_data, load_new_data
+
+# seconds before the cache asks the database for new recordings, the pipeline runs every minute
+REFRESH_TTL = 60
+# seconds before the cache is rebuilt from scratch, picking up edits to rows it already has
+FULL_RELOAD_TTL = 60 * 60
+# seconds without a reader before the cached data is dropped to free memory
+IDLE_EVICT_AFTER = 30 * 60
+# seconds between the background checks for idle data
+EVICT_CHECK_INTERVAL = 60
+
+
+class RecordingCache:
+    """Holds one copy of the joined recording data for every session. After the first load
+    only recordings with a recording_id above the last one seen are fetched and appended."""
+
+    def __init__(self, connect: Callable, refresh_ttl: float = REFRESH_TTL,
+                 full_reload_ttl: float = FULL_RELOAD_TTL,
+                 idle_evict_after: float = IDLE_EVICT_AFTER,
+                 clock: Callable[[], float] = time.monotonic):
+        self.connect = connect
+        self.refresh_ttl = refresh_ttl
+        self.full_reload_ttl = full_reload_ttl
+        self.idle_evict_after = idle_evict_after
+        self.clock = clock
+        self.lock = Lock()
+        self.data: pd.DataFrame | None = None
+        self.last_recording_id = -1
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self.read_at = 0.0
+        self.stopped = Event()
+        self.evictor: Thread | None = None
+
+    def get(self) -> pd.DataFrame:
+        """Gets the recording data, refreshing it first if it is older than the TTL.
+        The frame is shared by every session, so callers must not change it."""
+        with self.lock:
+            now = self.clock()
+            if self.data is None or now - self.loaded_at >= self.full_reload_ttl:
+                self.reload(now)
+            elif now - self.refreshed_at >= self.refresh_ttl:
+                self.refresh(now)
+
+            self.read_at = now
+            return self.data
+
+    def reload(self, now: float) -> None:
+        """Replaces the cached data with everything in the database"""
+        conn = self.connect()
+        try:
+            self.data = load_all_data(conn)
+        finally:
+            conn.close()
+        self.last_recording_id = int(self.data['recording_id'].max()) \
+            if not self.data.empty else -1
+        self.loaded_at = self.refreshed_at = now
+        logging.info("Loaded %s recordings into the dashboard cache.", len(self.data))
+
+    def refresh(self, now: float) -> None:
+        """Appends the recordings added since the last load"""
+        conn = self.connect()
+        try:
+            new_data = load_new_data(conn, self.last_recording_id)
+        finally:
+            conn.close()
+        if not new_data.empty:
+            self.data = append_recordings(self.data, new_data)
+            self.last_recording_id = int(new_data['recording_id'].max())
+            logging.info("Appended %s recordings to the dashboard cache.", len(new_data))
+        self.refreshed_at = now
+
+    def evict(self) -> None:
+        """Drops the cached data, the next reader loads it again"""
+        self.data = None
+        self.last_recording_id = -1
+        logging.info("Evicted the idle dashboard cache.")
+
+    def evict_if_idle(self) -> bool:
+        """Drops the cached data if nobody has read it for idle_evict_after seconds"""
+        with self.lock:
+            if self.data is None or self.clock() - self.read_at < self.idle_evict_after:
+                return False
+            self.evict()
+            return True
+
+    def start_eviction(self, interval: float = EVICT_CHECK_INTERVAL) -> None:
+        """Checks for idle data every interval seconds on a daemon thread, so the memory is
+        freed while nobody is reading rather than when the next reader arrives"""
+        def evict_loop() -> None:
+            while not self.stopped.wait(interval):
+                self.evict_if_idle()
+
+        self.evictor = Thread(target=evict_loop, name="recording-cache-evictor", daemon=True)
+        self.evictor.start()
+
+    def stop_eviction(self) -> None:
+        """Stops the background idle checks"""
+        self.stopped.set()
+        if self.evictor is not None:
+            self.evictor.join()
+
+
+def append_recordings(data: pd.DataFrame, new_data: pd.DataFrame) -> pd.DataFrame:
+    """Appends new recordings, merging the categories of each categorical column so that
+    they stay categorical instead of falling back to one string object per row"""
+    columns = {}
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals(
+                [data[column], new_data[column]], ignore_order=True)
+        else:
+            columns[column] = pd.concat([data[column], new_data[column]], ignore_index=True)
+    return pd.DataFrame(columns)
@@ -0,0 +1,77 @@
+"""Contains the functions that shrink reading time series before they are sent to the browser"""
+import numpy as np
+import pandas as pd
+
+# the bucket sizes readings can be rolled up to, finest first
+RESOLUTIONS = [pd.Timedelta(minutes=1), pd.Timedelta(minutes=15),
+               pd.Timedelta(hours=1), pd.Timedelta(days=1)]
+# the charts fill the page, so assume a wide screen when sizing them
+CHART_WIDTH = 1200
+
+
+def choose_resolution(start: pd.Timestamp, end: pd.Timestamp,
+                      width: int = CHART_WIDTH) -> pd.Timedelta:
+    """Picks the finest resolution that gives at most one bucket per pixel over the time span"""
+    span = end - start
+    for resolution in RESOLUTIONS:
+        if span / resolution <= width:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def rollup(plants_data: pd.DataFrame, value_column: str,
+           resolution: pd.Timedelta) -> pd.DataFrame:
+    """Buckets each plant's readings, keeping the mean, min and max of each bucket"""
+    buckets = plants_data.assign(
+        recording_taken=plants_data['recording_taken'].dt.floor(resolution))
+    rolled = buckets.groupby(['plant_id', 'name', 'recording_taken'], observed=True)[
+        value_column].agg(['mean', 'min', 'max']).reset_index()
+    return rolled.rename(columns={'mean': value_column,
+                                  'min': f'{value_column}_min',
+                                  'max': f'{value_column}_max'})
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Gets the indices of the points kept by Largest-Triangle-Three-Buckets downsampling,
+    which keeps the peaks and troughs that an evenly spaced sample would miss"""
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, length - 1
+    # the points between the first and last are split into threshold - 2 buckets
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+
+    return kept
+
+
+def downsample_readings(plants_data: pd.DataFrame, value_column: str,
+                        width: int = CHART_WIDTH) -> pd.DataFrame:
+    """Rolls each plant's readings up to a resolution that suits the time span and chart width,
+    then uses LTTB to cap every plant at width points if the span is longer than width days"""
+    if plants_data.empty:
+        return rollup(plants_data, value_column, RESOLUTIONS[0])
+
+    resolution = choose_resolution(plants_data['recording_taken'].min(),
+                                   plants_data['recording_taken'].max(), width)
+    rolled = rollup(plants_data, value_column, resolution)
+
+    plants = []
+    for _, plant in rolled.groupby('plant_id', sort=False):
+        times = plant['recording_taken'].to_numpy(dtype='datetime64[s]').astype(float)
+        plants.append(plant.iloc[lttb(times, plant[value_column].to_numpy(), width)])
+    return pd.concat(plants, ignore_index=True)
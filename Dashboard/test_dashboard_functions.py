@@ -0,0 +1,80 @@
+"""Script that tests the functions in dashboard_functions.py"""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from dashboard_functions import build_window_query, combine_with_archive, compact_recordings
+
+START = datetime(2023, 12, 21, 10, 0, 0)
+
+
+def readings(plant_id: int, minutes: list[int]) -> pd.DataFrame:
+    """Makes temperature readings a plant took the given minutes after START"""
+    return compact_recordings(pd.DataFrame({
+        "plant_id": plant_id,
+        "name": f"Plant {plant_id}",
+        "recording_taken": [START + timedelta(minutes=minute) for minute in minutes],
+        "temperature": [20.0 + minute for minute in minutes],
+    }))
+
+
+def test_combine_with_archive_keeps_one_copy():
+    """Tests that a reading both archived and still in the database is only kept once"""
+    combined = combine_with_archive(readings(1, [0, 1, 2]), readings(1, [2, 3]))
+
+    assert combined["recording_taken"].tolist() == [
+        START + timedelta(minutes=minute) for minute in range(4)]
+    assert isinstance(combined["name"].dtype, pd.CategoricalDtype)
+
+
+def test_combine_with_archive_without_archived_readings():
+    """Tests that the database readings are returned as they are when nothing is archived"""
+    hot = readings(1, [0, 1])
+    assert combine_with_archive(hot.iloc[0:0], hot) is hot
+
+
+def test_build_window_query_only_joins_needed_tables():
+    """Tests that only the tables the columns come from are joined"""
+    query, params = build_window_query(["plant_id", "temperature", "recording_taken"])
+
+    assert "JOIN" not in query
+    assert "WHERE" not in query
+    assert params == []
+
+
+def test_build_window_query_joins_plant_for_country():
+    """Tests that asking for the country also joins the plant table it is reached through"""
+    query, _ = build_window_query(["name"])
+    assert "JOIN s_alpha.plant" in query
+    assert "JOIN s_alpha.origin_location" not in query
+
+    query, _ = build_window_query(["country"])
+    assert query.index("JOIN s_alpha.plant") < query.index("JOIN s_alpha.origin_location")
+    assert "JOIN s_alpha.botanist" not in query
+
+
+def test_build_window_query_bounds_and_plants():
+    """Tests that the window bounds and plant ids become placeholders in order"""
+    end = START + timedelta(hours=1)
+    query, params = build_window_query(["temperature"], START, end, [3, 5, 8])
+
+    assert "recording_taken >= ?" in query
+    assert "recording_taken < ?" in query
+    assert "plant_id IN (?, ?, ?)" in query
+    assert params == [START, end, 3, 5, 8]
+
+
+def test_build_window_query_start_only():
+    """Tests that a window without an end has no upper bound"""
+    query, params = build_window_query(["temperature"], start=START)
+
+    assert "recording_taken < ?" not in query
+    assert params == [START]
+
+
+def test_build_window_query_unknown_column():
+    """Tests that a column that is not in WINDOW_COLUMNS is rejected"""
+    with pytest.raises(ValueError, match="password"):
+        build_window_query(["temperature", "password"])
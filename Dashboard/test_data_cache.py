@@ -0,0 +1,115 @@
+"""Script that tests the functions in data_cache.py"""
+
+import time
+
+import pandas as pd
+import pytest
+
+import data_cache
+from data_cache import RecordingCache
+
+
+class FakeClock:
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeConnection:
+    """A connection that only needs closing"""
+
+    def close(self):
+        """Nothing to close"""
+
+
+def recordings(recording_ids: list[int]) -> pd.DataFrame:
+    """Makes recording data with the given ids"""
+    return pd.DataFrame({"recording_id": recording_ids,
+                         "temperature": [float(recording_id) for recording_id in recording_ids]})
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Serves recordings from a list and records which loads were made"""
+    database = {"recording_ids": [1, 2], "loads": []}
+
+    def load_all_data(conn):
+        database["loads"].append("all")
+        return recordings(database["recording_ids"])
+
+    def load_new_data(conn, last_recording_id):
+        database["loads"].append(("new", last_recording_id))
+        return recordings([recording_id for recording_id in database["recording_ids"]
+                           if recording_id > last_recording_id])
+
+    monkeypatch.setattr(data_cache, "load_all_data", load_all_data)
+    monkeypatch.setattr(data_cache, "load_new_data", load_new_data)
+    return database
+
+
+def make_cache(clock: FakeClock) -> RecordingCache:
+    """Makes a cache with short TTLs on the fake clock"""
+    return RecordingCache(FakeConnection, refresh_ttl=60, full_reload_ttl=600,
+                          idle_evict_after=300, clock=clock)
+
+
+def test_get_only_fetches_new_recordings_after_the_ttl(database):
+    """Tests that reads within the TTL are served from memory and later ones append"""
+    clock = FakeClock()
+    cache = make_cache(clock)
+
+    assert cache.get()["recording_id"].tolist() == [1, 2]
+    database["recording_ids"].append(3)
+    clock.now = 30
+    assert cache.get()["recording_id"].tolist() == [1, 2]
+    clock.now = 60
+    assert cache.get()["recording_id"].tolist() == [1, 2, 3]
+    assert database["loads"] == ["all", ("new", 2)]
+
+
+def test_get_reloads_after_the_full_reload_ttl(database):
+    """Tests that the data is rebuilt from scratch once the full reload TTL has passed"""
+    clock = FakeClock()
+    cache = make_cache(clock)
+    cache.get()
+
+    database["recording_ids"] = [2, 3]
+    clock.now = 600
+    assert cache.get()["recording_id"].tolist() == [2, 3]
+    assert database["loads"] == ["all", "all"]
+
+
+def test_evict_if_idle(database):
+    """Tests that data is only dropped once nobody has read it for the idle time"""
+    clock = FakeClock()
+    cache = make_cache(clock)
+    cache.get()
+
+    clock.now = 299
+    assert not cache.evict_if_idle()
+    clock.now = 300
+    assert cache.evict_if_idle()
+    assert cache.data is None
+    assert not cache.evict_if_idle()
+
+
+def test_start_eviction_frees_idle_data_without_a_reader(database):
+    """Tests that the background check evicts idle data with no get() call"""
+    clock = FakeClock()
+    cache = make_cache(clock)
+    cache.get()
+    clock.now = 300
+
+    cache.start_eviction(interval=0.01)
+    try:
+        deadline = time.monotonic() + 2
+        while cache.data is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        cache.stop_eviction()
+
+    assert cache.data is None
@@ -0,0 +1,85 @@
+"""Script that tests the functions in downsample.py"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from downsample import RESOLUTIONS, choose_resolution, downsample_readings, lttb, rollup
+
+START = pd.Timestamp(datetime(2023, 12, 21, 10, 0, 0))
+
+
+def readings(plant_id: int, times: pd.DatetimeIndex, temperatures) -> pd.DataFrame:
+    """Makes temperature readings a plant took at the given times"""
+    return pd.DataFrame({"plant_id": plant_id, "name": f"Plant {plant_id}",
+                         "recording_taken": times, "temperature": temperatures})
+
+
+def test_choose_resolution_finest_that_fits():
+    """Tests that the finest resolution giving at most width buckets is chosen"""
+    assert choose_resolution(START, START + pd.Timedelta(minutes=100), 100) == RESOLUTIONS[0]
+    assert choose_resolution(START, START + pd.Timedelta(minutes=101), 100) == RESOLUTIONS[1]
+    assert choose_resolution(START, START + pd.Timedelta(days=3), 100) == RESOLUTIONS[2]
+    assert choose_resolution(START, START + pd.Timedelta(days=5), 100) == RESOLUTIONS[3]
+
+
+def test_choose_resolution_longer_than_daily():
+    """Tests that spans too long even for daily buckets still get daily buckets"""
+    assert choose_resolution(START, START + pd.Timedelta(days=1000), 100) == RESOLUTIONS[-1]
+
+
+def test_rollup_bucket_edges():
+    """Tests that a reading on a bucket edge starts a new bucket and the last bucket is kept"""
+    times = START + pd.to_timedelta([0, 5, 14, 15, 31], unit="min")
+    rolled = rollup(readings(1, times, [10.0, 20.0, 30.0, 40.0, 50.0]),
+                    "temperature", pd.Timedelta(minutes=15))
+
+    assert rolled["recording_taken"].tolist() == [
+        START, START + pd.Timedelta(minutes=15), START + pd.Timedelta(minutes=30)]
+    assert rolled["temperature"].tolist() == [20.0, 40.0, 50.0]
+    assert rolled["temperature_min"].tolist() == [10.0, 40.0, 50.0]
+    assert rolled["temperature_max"].tolist() == [30.0, 40.0, 50.0]
+
+
+def test_lttb_keeps_first_last_and_peak():
+    """Tests that the first and last points and a lone spike survive downsampling"""
+    y = np.zeros(100)
+    y[37] = 10.0
+    kept = lttb(np.arange(100, dtype=float), y, 10)
+
+    assert len(kept) == 10
+    assert kept[0] == 0 and kept[-1] == 99
+    assert 37 in kept
+    assert (np.diff(kept) > 0).all()
+
+
+def test_lttb_small_threshold_keeps_everything():
+    """Tests that a threshold below three, or not below the length, keeps every point"""
+    x = np.arange(5, dtype=float)
+    assert lttb(x, x, 2).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 5).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_downsample_readings_caps_points_per_plant():
+    """Tests that each plant is capped at width points with its first and last bucket kept"""
+    # 20 days of readings give 21 daily buckets, more than fit in 5 pixels
+    times = pd.date_range(START, periods=20 * 24 * 4, freq="15min")
+    data = pd.concat([readings(1, times, np.sin(np.arange(len(times)))),
+                      readings(2, times, np.cos(np.arange(len(times))))], ignore_index=True)
+
+    downsampled = downsample_readings(data, "temperature", width=5)
+
+    assert sorted(downsampled["plant_id"].unique()) == [1, 2]
+    for _, plant in downsampled.groupby("plant_id"):
+        assert len(plant) == 5
+        assert plant["recording_taken"].iloc[0] == times[0].floor("D")
+        assert plant["recording_taken"].iloc[-1] == times[-1].floor("D")
+
+
+def test_downsample_readings_empty():
+    """Tests that no readings give an empty frame with the rollup columns"""
+    empty = readings(1, pd.DatetimeIndex([]), [])
+    downsampled = downsample_readings(empty, "temperature")
+    assert downsampled.empty
+    assert {"temperature", "temperature_min", "temperature_max"} <= set(downsampled.columns)
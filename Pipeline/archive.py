@@ -0,0 +1,154 @@
+"""Contains the archive stage that moves old recordings out of the database into Parquet files
+partitioned by date and plant, so the recording_event table only holds recent readings"""
+from datetime import datetime, timedelta
+import logging
+from os import environ
+from uuid import uuid4
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from recording_dtypes import ARCHIVE_COLUMNS, RECORDING_DTYPES
+
+# a local directory, or s3://bucket/prefix for S3 or an S3 compatible store such as MinIO
+ARCHIVE_PATH = environ.get("ARCHIVE_PATH", "archive")
+ARCHIVE_ENDPOINT = environ.get("ARCHIVE_ENDPOINT")
+# readings older than this many days are archived, whole days at a time
+ARCHIVE_HORIZON_DAYS = int(environ.get("ARCHIVE_HORIZON_DAYS", "30"))
+
+ARCHIVE_DTYPES = {column: RECORDING_DTYPES[column] for column in ARCHIVE_COLUMNS}
+ARCHIVE_PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.string()), ("plant_id", pa.int32())]), flavor="hive")
+# the botanist_plant and plant_watering view rows are built on the readings that are archived,
+# so their facts are copied to tables the dashboard unions with the views before the delete
+KEEP_BOTANIST_PLANTS_QUERY = """INSERT INTO s_alpha.archived_botanist_plant (botanist_id, plant_id)
+                SELECT DISTINCT botanist_id, plant_id
+                FROM s_alpha.recording_event AS archived
+                WHERE recording_taken >= ? AND recording_taken < ? AND recording_id <= ?
+                AND NOT EXISTS (SELECT 1 FROM s_alpha.archived_botanist_plant AS kept
+                    WHERE kept.botanist_id = archived.botanist_id
+                    AND kept.plant_id = archived.plant_id);"""
+KEEP_WATERINGS_QUERY = """INSERT INTO s_alpha.archived_plant_watering (plant_id, last_watered)
+                SELECT DISTINCT plant_id, last_watered
+                FROM s_alpha.recording_event AS archived
+                WHERE recording_taken >= ? AND recording_taken < ? AND recording_id <= ?
+                AND NOT EXISTS (SELECT 1 FROM s_alpha.archived_plant_watering AS kept
+                    WHERE kept.plant_id = archived.plant_id
+                    AND kept.last_watered = archived.last_watered);"""
+
+
+def get_archive_filesystem(archive_path: str = ARCHIVE_PATH,
+                           endpoint: str | None = ARCHIVE_ENDPOINT) -> tuple[pafs.FileSystem, str]:
+    """Gets the filesystem the archive lives on and the archive's path within it"""
+    if archive_path.startswith("s3://"):
+        return pafs.S3FileSystem(endpoint_override=endpoint), archive_path[len("s3://"):]
+    return pafs.LocalFileSystem(), archive_path
+
+
+def get_archive_cutoff(now: datetime | None = None,
+                       horizon_days: int = ARCHIVE_HORIZON_DAYS) -> datetime:
+    """Gets the midnight before which readings are archived"""
+    now = now or datetime.now()
+    return datetime.combine((now - timedelta(days=horizon_days)).date(), datetime.min.time())
+
+
+def fetch_oldest_recording(conn) -> datetime | None:
+    """Gets when the oldest reading still in the database was taken"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(recording_taken) FROM s_alpha.recording_event;")
+    oldest = cursor.fetchone()[0]
+    cursor.close()
+    return pd.Timestamp(oldest).to_pydatetime() if oldest is not None else None
+
+
+def fetch_recordings(conn, start: datetime, end: datetime) -> pd.DataFrame:
+    """Gets the readings taken between start and end"""
+    query = f"""SELECT {", ".join(ARCHIVE_DTYPES)}
+                FROM s_alpha.recording_event
+                WHERE recording_taken >= ? AND recording_taken < ?;"""
+    cursor = conn.cursor()
+    cursor.execute(query, (start, end))
+    rows = cursor.fetchall()
+    cursor.close()
+    return pd.DataFrame.from_records(
+        [tuple(row) for row in rows], columns=list(ARCHIVE_DTYPES)).astype(ARCHIVE_DTYPES)
+
+
+def write_partitions(recordings: pd.DataFrame, archive_path: str = ARCHIVE_PATH,
+                     run_id: str | None = None,
+                     filesystem: pafs.FileSystem | None = None) -> None:
+    """Writes readings to date=YYYY-MM-DD/plant_id=N partitions. Each run writes its own files,
+    so archiving never overwrites readings that an earlier run put in the same partition."""
+    if filesystem is None:
+        filesystem, archive_path = get_archive_filesystem(archive_path)
+    run_id = run_id or str(uuid4())
+
+    table = pa.Table.from_pandas(
+        recordings.assign(date=recordings["recording_taken"].dt.strftime("%Y-%m-%d")),
+        preserve_index=False)
+    ds.write_dataset(table, archive_path, format="parquet", filesystem=filesystem,
+                     partitioning=ARCHIVE_PARTITIONING,
+                     basename_template=f"{run_id}-{{i}}.parquet",
+                     existing_data_behavior="overwrite_or_ignore")
+
+
+def keep_view_facts(conn, start: datetime, end: datetime, max_recording_id: int) -> None:
+    """Copies which botanists recorded which plants and when plants were watered from the
+    readings about to be deleted, so the dashboard overview and watering charts keep them"""
+    cursor = conn.cursor()
+    cursor.execute(KEEP_BOTANIST_PLANTS_QUERY, (start, end, max_recording_id))
+    cursor.execute(KEEP_WATERINGS_QUERY, (start, end, max_recording_id))
+    cursor.close()
+
+
+def delete_recordings(conn, start: datetime, end: datetime, max_recording_id: int) -> int:
+    """Deletes the archived readings from the database, returning how many were deleted"""
+    query = """DELETE FROM s_alpha.recording_event
+                WHERE recording_taken >= ? AND recording_taken < ? AND recording_id <= ?;"""
+    cursor = conn.cursor()
+    cursor.execute(query, (start, end, max_recording_id))
+    deleted = cursor.rowcount
+    cursor.close()
+    return deleted
+
+
+def archive_recordings(conn, archive_path: str = ARCHIVE_PATH,
+                       horizon_days: int = ARCHIVE_HORIZON_DAYS,
+                       now: datetime | None = None, run_id: str | None = None) -> int:
+    """Moves every reading older than the horizon into the archive one day at a time, returning
+    how many were moved. A day is only deleted from the database once its files are written,
+    and each day is committed on its own so an interrupted run loses nothing."""
+    filesystem, root = get_archive_filesystem(archive_path)
+    cutoff = get_archive_cutoff(now, horizon_days)
+    run_id = run_id or str(uuid4())
+    oldest = fetch_oldest_recording(conn)
+    archived = 0
+
+    day = datetime.combine(oldest.date(), datetime.min.time()) if oldest else cutoff
+    while day < cutoff:
+        next_day = day + timedelta(days=1)
+        recordings = fetch_recordings(conn, day, next_day)
+        if not recordings.empty:
+            write_partitions(recordings, root, run_id, filesystem)
+            keep_view_facts(conn, day, next_day, int(recordings["recording_id"].max()))
+            delete_recordings(conn, day, next_day, int(recordings["recording_id"].max()))
+            conn.commit()
+            archived += len(recordings)
+            logging.info("Archived %s recordings from %s.", len(recordings), day.date())
+        day = next_day
+
+    logging.info("Archived %s recordings older than %s.", archived, cutoff)
+    return archived
+
+
+if __name__ == "__main__":
+    # only needed when run as a script, so importing archive stays cheap
+    from dotenv import load_dotenv
+    from load import get_connection
+
+    load_dotenv()
+    connection = get_connection()
+    archive_recordings(connection)
+    connection.close()
@@ -0,0 +1,8 @@
+"""Puts the benchmarks' pyodbc stand-in and SQLite database on the path, so the loader tests run
+without an ODBC driver. The stand-in's pyodbc.Error is sqlite3.Error, so the loaders handle the
+SQLite database's errors as they would the real one's."""
+from pathlib import Path
+import sys
+
+BENCHMARKS = Path(__file__).resolve().parent.parent / "benchmarks"
+sys.path[:0] = [str(BENCHMARKS / "stubs"), str(BENCHMARKS)]
@@ -1,10 +1,33 @@
 """Contains functions that extract the plant data from the plants api"""
+import asyncio
+import json
 import logging
+from math import ceil
 from multiprocessing import Pool
+from os import environ
+import time
+from typing import Callable, Iterator
+import aiohttp
 import requests
 
+from resilience import (BREAKER, BREAKER_STATE, STATS, MAX_RETRIES, FetchStats, RetryableError,
+                        backoff_delay, load_breaker, save_breaker)
+from state import read_text, state_file, write_text
+
 URL = "https://data-eng-plants-api.herokuapp.com/plants/"
 
+MAX_CONCURRENT_REQUESTS = 20
+REQUEST_TIMEOUT = 5
+
+PLANT_ID_CACHE = environ.get("PLANT_ID_CACHE", state_file("plant_ids.json"))
+MISS_LIMIT = 5
+# discovery probes grow from MISS_LIMIT ids, doubling while they keep finding plants
+MAX_PROBE_WINDOW = 1000
+PLANTS_PER_WORKER = 13
+MAX_WORKERS = 8
+
+STREAM_BATCH_SIZE = 250
+
 
 def get_plant_data(plant_range: list[int]) -> list[dict]:
     """Gets the data from the plants api"""
@@ -15,19 +38,264 @@ def get_plant_data(plant_range: list[int]) -> list[dict]:
     if not all(isinstance(x, int) for x in plant_range):
         raise TypeError('The plant range must be a list of integers')
 
-    return [requests.get(f'{URL}{plant}').json() for plant in plant_range]
+    with requests.Session() as session:
+        return [request_plant(session, plant) for plant in plant_range]
+
+
+def get_segment_data(plant_range: list[int]) -> tuple[list[dict], dict, FetchStats]:
+    """Gets a segment of plants in a pool worker, along with the worker's breaker state for
+    them and its request stats so the parent process can keep them"""
+    # a forked worker starts with the parent's discovery stats, and may be given more segments
+    STATS.reset()
+    return get_plant_data(plant_range), BREAKER.snapshot(plant_range), STATS
+
+
+def request_plant(session: requests.Session, plant_id: int, retries: int = MAX_RETRIES,
+                  timeout: float = REQUEST_TIMEOUT) -> dict:
+    """Gets a single plant from the api with retries, returning an error dict if every attempt fails"""
+    if not BREAKER.allow(plant_id):
+        return {"error": "circuit open", "plant_id": plant_id}
+    if BREAKER.is_trial(plant_id):
+        retries = 0
+
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            response = session.get(f'{URL}{plant_id}', timeout=timeout)
+            if response.status_code >= 500:
+                raise RetryableError(f'status {response.status_code}')
+            plant = response.json()
+        except (requests.RequestException, RetryableError, ValueError) as e:
+            STATS.record(plant_id, time.perf_counter() - started, False)
+            error = e
+        else:
+            STATS.record(plant_id, time.perf_counter() - started, True)
+            BREAKER.record_success(plant_id)
+            return plant
+
+        if attempt < retries:
+            time.sleep(backoff_delay(attempt))
+
+    logging.warning('Request for plant %s failed: %r', plant_id, error)
+    BREAKER.record_failure(plant_id)
+    return {"error": repr(error), "plant_id": plant_id}
+
+
+async def fetch_plant(session: aiohttp.ClientSession, plant_id: int,
+                      retries: int = MAX_RETRIES) -> dict:
+    """Gets a single plant from the api with retries, returning an error dict if every attempt fails"""
+    if not BREAKER.allow(plant_id):
+        return {"error": "circuit open", "plant_id": plant_id}
+    if BREAKER.is_trial(plant_id):
+        retries = 0
+
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            async with session.get(f'{URL}{plant_id}') as response:
+                if response.status >= 500:
+                    raise RetryableError(f'status {response.status}')
+                plant = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableError, ValueError) as e:
+            STATS.record(plant_id, time.perf_counter() - started, False)
+            error = e
+        else:
+            STATS.record(plant_id, time.perf_counter() - started, True)
+            BREAKER.record_success(plant_id)
+            return plant
+
+        if attempt < retries:
+            await asyncio.sleep(backoff_delay(attempt))
+
+    logging.warning('Request for plant %s failed: %r', plant_id, error)
+    BREAKER.record_failure(plant_id)
+    return {"error": repr(error), "plant_id": plant_id}
+
+
+async def open_session(max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                       timeout: float = REQUEST_TIMEOUT) -> aiohttp.ClientSession:
+    """Opens a pooled session, its connector limit caps how many requests are in flight at once.
+    Only connecting and reading are timed, a total timeout would also count the time a request
+    waits for a free connection and time out requests queued behind a large batch."""
+    connector = aiohttp.TCPConnector(limit=max_concurrent)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=client_timeout)
+
+
+async def get_plant_data_async(plant_range: list[int],
+                               max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                               timeout: float = REQUEST_TIMEOUT,
+                               session: aiohttp.ClientSession | None = None) -> list[dict]:
+    """Gets the data from the plants api over one pooled session, in plant_range order.
+    A long-lived session can be passed in, otherwise one is opened for this call."""
+
+    if not isinstance(plant_range, list):
+        raise TypeError('The plant range must be a list of integers')
+
+    if not all(isinstance(x, int) for x in plant_range):
+        raise TypeError('The plant range must be a list of integers')
+
+    if session is not None:
+        return await asyncio.gather(*(fetch_plant(session, plant) for plant in plant_range))
+
+    async with await open_session(max_concurrent, timeout) as session:
+        return await asyncio.gather(*(fetch_plant(session, plant) for plant in plant_range))
 
 
-def extract_main() -> list[list[dict]]:
-    """Multiprocessing to get all plants from the api quicker"""
+def stream_plant_data(plant_ids: list[int], fetch: Callable[[list[int]], list[dict]],
+                      batch_size: int = STREAM_BATCH_SIZE) -> Iterator[list[dict]]:
+    """Yields the plants one batch at a time. A batch is only fetched once the consumer
+    asks for it, so a slow transform or load holds back extraction instead of piling up."""
+    for start in range(0, len(plant_ids), batch_size):
+        yield fetch(plant_ids[start:start + batch_size])
 
-    plant_segments = [list(range(0, 13)), list(
-        range(13, 26)), list(range(26, 39)), list(range(39, 50))]
 
-    with Pool(processes=4) as pool:
+def load_plant_id_cache(cache_path: str = PLANT_ID_CACHE) -> int:
+    """Gets the highest live plant id seen by a previous run, or -1 if there is none"""
+    try:
+        return int(json.loads(read_text(cache_path))["max_plant_id"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return -1
+
+
+def save_plant_id_cache(max_plant_id: int, cache_path: str = PLANT_ID_CACHE) -> None:
+    """Stores the highest live plant id for the next run"""
+    try:
+        write_text(cache_path, json.dumps({"max_plant_id": max_plant_id}))
+    except OSError as e:
+        logging.warning('Could not write plant id cache: %r', e)
+
+
+def discover_max_plant_id(fetch: Callable[[list[int]], list[dict]], start: int = 0,
+                          miss_limit: int = MISS_LIMIT, max_window: int = MAX_PROBE_WINDOW,
+                          found: dict[int, dict] | None = None) -> int:
+    """Probes plant ids upwards from start until miss_limit error responses in a row,
+    returning the highest live id found (start - 1 if there were none). The plants found
+    are added to found so they do not have to be fetched again."""
+    max_plant_id = start - 1
+    probe_start = start
+    window = miss_limit
+
+    while probe_start - max_plant_id - 1 < miss_limit:
+        probe = list(range(probe_start, probe_start + window))
+        probed = {}
+        for plant_id, plant in zip(probe, fetch(probe)):
+            if not plant.get("error"):
+                max_plant_id = plant_id
+                probed[plant_id] = plant
+            elif plant_id - max_plant_id >= miss_limit:
+                break
+        if found is not None:
+            found.update(probed)
+        probe_start += window
+        window = min(max_window, window * 2) if probed else miss_limit
+
+    return max_plant_id
+
+
+def discover_plant_ids(fetch: Callable[[list[int]], list[dict]],
+                       cache_path: str = PLANT_ID_CACHE,
+                       found: dict[int, dict] | None = None) -> list[int]:
+    """Gets the live plant id space, only probing past the cached highest id"""
+    cached_max = load_plant_id_cache(cache_path)
+    max_plant_id = discover_max_plant_id(fetch, cached_max + 1, found=found)
+
+    if max_plant_id != cached_max:
+        logging.info('Plant ids now go up to %s', max_plant_id)
+        save_plant_id_cache(max_plant_id, cache_path)
+
+    return list(range(0, max_plant_id + 1))
+
+
+def merge_probed(plant_range: list[int], probed: dict[int, dict],
+                 fetched: list[dict]) -> list[dict]:
+    """Puts the plants found while probing back between the fetched ones, in plant_range order.
+    fetched holds the plants in plant_range that are not in probed."""
+    fetched = iter(fetched)
+    return [probed[plant] if plant in probed else next(fetched) for plant in plant_range]
+
+
+def skip_probed(fetch: Callable[[list[int]], list[dict]],
+                probed: dict[int, dict]) -> Callable[[list[int]], list[dict]]:
+    """Wraps fetch so plants already found while probing are not requested again"""
+    def fetch_unprobed(plant_range: list[int]) -> list[dict]:
+        missing = [plant for plant in plant_range if plant not in probed]
+        return merge_probed(plant_range, probed, fetch(missing) if missing else [])
+    return fetch_unprobed
+
+
+def choose_worker_count(plant_count: int) -> int:
+    """Picks how many segments to split the plant ids into"""
+    return max(1, min(MAX_WORKERS, ceil(plant_count / PLANTS_PER_WORKER)))
+
+
+def shard_plant_ids(plant_ids: list[int], workers: int) -> list[list[int]]:
+    """Splits plant ids into contiguous segments whose sizes differ by at most one"""
+    size, remainder = divmod(len(plant_ids), workers)
+    segments = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < remainder else 0)
+        segments.append(plant_ids[start:end])
+        start = end
+    return segments
+
+
+def extract_main(use_async: bool = True, max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 timeout: float = REQUEST_TIMEOUT,
+                 cache_path: str = PLANT_ID_CACHE,
+                 breaker_path: str | None = BREAKER_STATE) -> list[list[dict]]:
+    """Gets all plants from the api, either concurrently on one event loop or
+    with multiprocessing, returned as one list of plants per segment"""
+    STATS.reset()
+    load_breaker(BREAKER, breaker_path)
+
+    if use_async:
+        # one loop and session for discovery and extraction, so connections are reused
+        loop = asyncio.new_event_loop()
+        session = loop.run_until_complete(open_session(max_concurrent, timeout))
+
+        def fetch(plant_range: list[int]) -> list[dict]:
+            return loop.run_until_complete(get_plant_data_async(plant_range, session=session))
+    else:
+        fetch = get_plant_data
+
+    try:
+        probed = {}
+        plant_ids = discover_plant_ids(fetch, cache_path, probed)
+        plant_segments = shard_plant_ids(
+            plant_ids, choose_worker_count(len(plant_ids)))
+
         logging.info('Extraction Started')
-        data_segments = pool.map(get_plant_data, plant_segments)
-        logging.info('Extraction Complete')
+
+        if use_async:
+            plants = skip_probed(fetch, probed)(plant_ids)
+
+            # regroup the flat results so the output shape matches the pool mode
+            data_segments = []
+            start = 0
+            for segment in plant_segments:
+                data_segments.append(plants[start:start + len(segment)])
+                start += len(segment)
+        else:
+            unprobed_segments = [[plant for plant in segment if plant not in probed]
+                                 for segment in plant_segments]
+            with Pool(processes=len(plant_segments)) as pool:
+                results = pool.map(get_segment_data, unprobed_segments)
+            data_segments = []
+            for segment, unprobed, (fetched, breaker_state, stats) in zip(
+                    plant_segments, unprobed_segments, results):
+                BREAKER.restore(breaker_state, unprobed)
+                STATS.merge(stats)
+                data_segments.append(merge_probed(segment, probed, fetched))
+    finally:
+        if use_async:
+            loop.run_until_complete(session.close())
+            loop.close()
+        save_breaker(BREAKER, breaker_path)
+
+    logging.info('Extraction Complete')
+    logging.info('Request stats: %s', STATS.summary())
 
     return data_segments
 
@@ -0,0 +1,110 @@
+"""Contains a cache of dimension natural keys to database ids that is kept between pipeline runs"""
+import json
+import logging
+from os import environ
+
+from state import read_text, state_file, write_text
+
+KEY_CACHE_PATH = environ.get("KEY_CACHE_PATH", state_file("dimension_keys.json"))
+# the table names come from the loaders, never from input
+KEY_CHECK_QUERY = "SELECT COUNT(*), MAX({table}_id) FROM s_alpha.{table};"
+
+
+def encode_keys(ids: dict) -> list:
+    """Converts a table's ids to JSON, whose object keys can only be strings"""
+    return [[list(key) if isinstance(key, tuple) else key, table_id]
+            for key, table_id in ids.items()]
+
+
+def decode_keys(saved: list) -> dict:
+    """Converts a table's ids back from JSON, composite keys are lists there"""
+    return {tuple(key) if isinstance(key, list) else key: int(table_id)
+            for key, table_id in saved}
+
+
+class DimensionKeyCache:
+    """Maps the natural keys of each dimension table to their ids. It lives in memory for as long
+    as the process does and is saved under STATE_PATH so that short-lived runs can reuse it.
+    Each table's ids are the whole table, so check() can compare them with the database."""
+
+    def __init__(self, cache_path: str | None = KEY_CACHE_PATH, database: str | None = None):
+        self.cache_path = cache_path
+        self.database = database
+        self.tables: dict[str, dict] = {}
+        self.changed = False
+        self.load()
+
+    def get(self, table: str) -> dict:
+        """Gets the cached ids for a table"""
+        return self.tables.setdefault(table, {})
+
+    def missing(self, table: str, keys: set) -> set:
+        """Gets the keys that are not cached for a table"""
+        return keys - self.get(table).keys()
+
+    def update(self, table: str, ids: dict) -> None:
+        """Adds ids to a table's cache"""
+        self.get(table).update(ids)
+        self.changed = True
+
+    def invalidate(self, table: str | None = None) -> None:
+        """Forgets the ids for one table, or for every table"""
+        if table is None:
+            self.tables.clear()
+        else:
+            self.tables.pop(table, None)
+        self.changed = True
+
+    def check(self, connection) -> None:
+        """Forgets the ids of any table whose row count or highest id no longer matches the
+        database, such as one that schema.sql has dropped and recreated"""
+        cursor = connection.cursor()
+        try:
+            for table, ids in list(self.tables.items()):
+                if not ids:
+                    continue
+                cursor.execute(KEY_CHECK_QUERY.format(table=table))
+                count, max_id = cursor.fetchone()
+                if (count, max_id) != (len(ids), max(ids.values())):
+                    logging.warning("Dimension key cache for %s is stale, re-reading it.", table)
+                    self.invalidate(table)
+        finally:
+            cursor.close()
+
+    def load(self) -> None:
+        """Reads the cache file, ignoring it if it is missing, unreadable or for another database"""
+        if not self.cache_path:
+            return
+        try:
+            saved = json.loads(read_text(self.cache_path))
+            if saved["database"] != self.database:
+                return
+            self.tables = {table: decode_keys(ids) for table, ids in saved["tables"].items()}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            logging.warning("Could not read dimension key cache: %r", e)
+
+    def save(self) -> None:
+        """Writes the cache file if anything has changed since it was read"""
+        if not self.cache_path or not self.changed:
+            return
+        try:
+            write_text(self.cache_path, json.dumps({
+                "database": self.database,
+                "tables": {table: encode_keys(ids) for table, ids in self.tables.items()}}))
+            self.changed = False
+        except OSError as e:
+            logging.warning("Could not write dimension key cache: %r", e)
+
+
+KEY_CACHE = None
+
+
+def get_key_cache() -> DimensionKeyCache:
+    """Gets the process wide key cache, reading it from the state path the first time"""
+    global KEY_CACHE
+    if KEY_CACHE is None:
+        KEY_CACHE = DimensionKeyCache(
+            database=f'{environ.get("DB_HOST")}/{environ.get("DB_NAME")}')
+    return KEY_CACHE
@@ -1,14 +1,47 @@
 """Contains functions that upload clean data to all tables in the database."""
 import logging
 from os import environ
-import logging
+from typing import Callable, Iterable
+from uuid import uuid4
 from dotenv import load_dotenv
 import pandas as pd
 import pyodbc
 
 
-from extract import extract_main
-from transform import transform_main
+from key_cache import DimensionKeyCache, get_key_cache
+
+BATCH_SIZE = 1000
+
+STAGE_RECORDINGS_QUERY = """
+                    INSERT INTO s_alpha.recording_event_stage 
+                        (plant_id, botanist_id, soil_moisture, temperature, recording_taken, last_watered, run_id) 
+                    VALUES 
+                        (?, ?, ?, ?, ?, ?, ?)
+                    """
+
+# anti-join against the (plant_id, recording_taken) index, migrations/check_plans.py checks its plan
+INSERT_STAGED_RECORDINGS_QUERY = """
+                    INSERT INTO s_alpha.recording_event 
+                        (plant_id, botanist_id, soil_moisture, temperature, recording_taken, last_watered, run_id) 
+                    SELECT 
+                        s.plant_id, s.botanist_id, s.soil_moisture, s.temperature, s.recording_taken, s.last_watered, s.run_id
+                    FROM 
+                        s_alpha.recording_event_stage AS s
+                    WHERE 
+                        s.run_id = ?
+                        AND NOT EXISTS (
+                            SELECT 1 
+                            FROM s_alpha.recording_event AS r 
+                            WHERE r.plant_id = s.plant_id AND r.recording_taken = s.recording_taken
+                        )
+                    ;
+                    """
+
+CLEAR_STAGE_QUERY = """
+                    DELETE FROM s_alpha.recording_event_stage 
+                    WHERE run_id = ?
+                    ;
+                    """
 
 
 def get_connection() -> pyodbc.Connection | None:
@@ -26,22 +59,130 @@ def get_connection() -> pyodbc.Connection | None:
         logging.info("Error in connection.")
 
 
-def bulk_insert(connection: pyodbc.Connection, insert_query: str, insert_data: list[tuple]) -> None:
-    """Execute the insert query using executemany"""
+class BulkInsertError(Exception):
+    """Raised when a bulk insert fails, saying which rows were inserted before the failure"""
+
+    def __init__(self, message: str, inserted_rows: int, committed_rows: int,
+                 failed_rows: list[tuple]):
+        super().__init__(message)
+        self.inserted_rows = inserted_rows
+        self.committed_rows = committed_rows
+        self.failed_rows = failed_rows
+
+
+def bulk_insert(connection: pyodbc.Connection, insert_query: str, insert_data: list[tuple],
+                batch_size: int = BATCH_SIZE, commit_each_batch: bool = False,
+                commit: bool = True) -> int:
+    """Execute the insert query in batches using fast_executemany, which sends each batch as
+    one parameter array. By default everything is committed at the end, commit_each_batch keeps
+    earlier batches if a later one fails, which is what long backfills want. With commit=False
+    the caller owns the transaction and nothing is committed or rolled back here."""
     cursor = connection.cursor()
+    # only pyodbc cursors have the fast path
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+
+    inserted_rows = committed_rows = 0
     try:
-        cursor.executemany(insert_query, insert_data)
-        connection.commit()
-        print('Bulk insert was successful.')
+        for start in range(0, len(insert_data), batch_size):
+            batch = insert_data[start:start + batch_size]
+            try:
+                cursor.executemany(insert_query, batch)
+            except pyodbc.Error as e:
+                if commit:
+                    connection.rollback()
+                raise BulkInsertError(
+                    f"Bulk insert failed on rows {start} to {start + len(batch) - 1}, "
+                    f"{committed_rows} of {len(insert_data)} rows were committed: {e}",
+                    inserted_rows, committed_rows, batch) from e
+
+            inserted_rows += len(batch)
+            if commit and commit_each_batch:
+                connection.commit()
+                committed_rows = inserted_rows
+
+        if commit:
+            connection.commit()
+    finally:
+        cursor.close()
+
+    logging.info("Bulk insert of %s rows was successful.", inserted_rows)
+    return inserted_rows
+
+
+def fetch_botanist_ids(connection: pyodbc.Connection) -> dict[tuple[str, str], int]:
+    """Gets a mapping of (first_name, last_name) to botanist_id"""
+    botanist_query = """
+                    SELECT 
+                        botanist_id, first_name, last_name
+                    FROM 
+                        s_alpha.botanist
+                    ;
+                    """
+    cursor = connection.cursor()
+    rows = cursor.execute(botanist_query).fetchall()
+    cursor.close()
+    return {(first_name, last_name): botanist_id for botanist_id, first_name, last_name in rows}
 
-    except pyodbc.Error as e:
-        print('Error during bulk insert:', e)
 
+def fetch_location_ids(connection: pyodbc.Connection) -> dict[tuple[float, float], int]:
+    """Gets a mapping of (longitude, latitude) to origin_location_id"""
+    location_query = """
+                    SELECT 
+                        origin_location_id, longitude, latitude
+                    FROM 
+                        s_alpha.origin_location
+                    ;
+                    """
+    cursor = connection.cursor()
+    rows = cursor.execute(location_query).fetchall()
     cursor.close()
+    return {(float(longitude), float(latitude)): location_id
+            for location_id, longitude, latitude in rows}
 
 
-def upload_botanists(connection: pyodbc.Connection, dataframe: pd.DataFrame) -> None:
-    """Uploads the botanist data to the botanist table"""
+def fetch_plant_ids(connection: pyodbc.Connection) -> dict[str, int]:
+    """Gets a mapping of plant name to plant_id"""
+    plant_query = """
+                    SELECT 
+                        plant_id, name
+                    FROM 
+                        s_alpha.plant
+                    ;
+                    """
+    cursor = connection.cursor()
+    rows = cursor.execute(plant_query).fetchall()
+    cursor.close()
+    return {name: plant_id for plant_id, name in rows}
+
+
+def get_dimension_ids(connection: pyodbc.Connection, table: str, keys: set,
+                      fetch_ids: Callable[[pyodbc.Connection], dict],
+                      key_cache: DimensionKeyCache | None = None) -> dict:
+    """Gets the ids for a dimension table, only reading the table when a key is not cached"""
+    if key_cache is None:
+        return fetch_ids(connection)
+
+    if key_cache.missing(table, keys):
+        key_cache.update(table, fetch_ids(connection))
+    return key_cache.get(table)
+
+
+def refresh_dimension_ids(connection: pyodbc.Connection, table: str,
+                          fetch_ids: Callable[[pyodbc.Connection], dict],
+                          key_cache: DimensionKeyCache | None = None) -> dict:
+    """Re-reads the ids for a dimension table after rows have been inserted into it"""
+    ids = fetch_ids(connection)
+    if key_cache is not None:
+        key_cache.invalidate(table)
+        key_cache.update(table, ids)
+    return ids
+
+
+def upload_botanists(connection: pyodbc.Connection, dataframe: pd.DataFrame,
+                     key_cache: DimensionKeyCache | None = None,
+                     commit: bool = True) -> dict[tuple[str, str], int]:
+    """Uploads new botanists to the botanist table and returns the ids of every botanist"""
     insert_query = """
                     INSERT INTO s_alpha.botanist 
                         (first_name, last_name, email, phone_number) 
@@ -49,35 +190,29 @@ def upload_botanists(connection: pyodbc.Connection, dataframe: pd.DataFrame) ->
                         (?, ?, ?, ?)
                     """
 
-    # get data from the database to check against input for duplicates
-    botanist_query = """
-                    SELECT 
-                        first_name, last_name
-                    FROM
-                        s_alpha.botanist
-                    ;
-                    """
-    cursor = connection.cursor()
-    botanist_query_data = cursor.execute(botanist_query).fetchall()
-
-    # build input data
-    botanist_data = dataframe[["botanist_first_name",
-                               "botanist_last_name", "email", "phone_number"]]
-    botanist_tuples = list(botanist_data.itertuples(index=False, name=None))
-    # Remove duplicates
-    insert_data = list(set([i for i in botanist_tuples]))
-    for botanist in insert_data:
-        for query_botanist in botanist_query_data:
-            if botanist[0] == query_botanist[0] and botanist[1] == query_botanist[1]:
-                insert_data.pop(insert_data.index(botanist))
-                break
+    # one row per botanist that is not in the database yet
+    botanist_data = dataframe[["botanist_first_name", "botanist_last_name",
+                               "email", "phone_number"]].drop_duplicates(
+        subset=["botanist_first_name", "botanist_last_name"])
+    botanist_ids = get_dimension_ids(
+        connection, "botanist",
+        set(zip(botanist_data["botanist_first_name"], botanist_data["botanist_last_name"])),
+        fetch_botanist_ids, key_cache)
+    insert_data = [botanist for botanist in botanist_data.itertuples(index=False, name=None)
+                   if (botanist[0], botanist[1]) not in botanist_ids]
 
     if len(insert_data) > 0:
-        bulk_insert(connection, insert_query, insert_data)
+        bulk_insert(connection, insert_query, insert_data, commit=commit)
+        botanist_ids = refresh_dimension_ids(
+            connection, "botanist", fetch_botanist_ids, key_cache)
+
+    return botanist_ids
 
 
-def upload_origin_locations(connection: pyodbc.Connection, dataframe: pd.DataFrame) -> None:
-    """Uploads the location data to the origin location table"""
+def upload_origin_locations(connection: pyodbc.Connection, dataframe: pd.DataFrame,
+                            key_cache: DimensionKeyCache | None = None,
+                            commit: bool = True) -> dict[tuple[float, float], int]:
+    """Uploads new locations to the origin location table and returns the ids of every location"""
     insert_query = """
                     INSERT INTO s_alpha.origin_location 
                         (longitude, latitude, town, country, country_abbreviation, continent) 
@@ -85,49 +220,30 @@ def upload_origin_locations(connection: pyodbc.Connection, dataframe: pd.DataFra
                         (?, ?, ?, ?, ?, ?)
                     """
 
-    # get data from the database to check against input for duplicates
-    location_query = """
-                    SELECT 
-                        longitude, latitude
-                    FROM
-                        s_alpha.origin_location
-                    ;
-                    """
-    cursor = connection.cursor()
-    location_query_data = cursor.execute(location_query).fetchall()
-
-    # build input data
-    location_data = dataframe[["longitude",
-                               "latitude", "town", "country", "country_abbreviation", "continent"]]
-    location_tuples = list(location_data.itertuples(index=False, name=None))
+    # one row per location that is not in the database yet
+    location_data = dataframe[["longitude", "latitude", "town", "country",
+                               "country_abbreviation", "continent"]].astype(
+        {"longitude": float, "latitude": float}).drop_duplicates(subset=["longitude", "latitude"])
+    location_ids = get_dimension_ids(
+        connection, "origin_location",
+        set(zip(location_data["longitude"], location_data["latitude"])),
+        fetch_location_ids, key_cache)
+    insert_data = [location for location in location_data.itertuples(index=False, name=None)
+                   if (location[0], location[1]) not in location_ids]
 
-    # Remove duplicates
-    insert_data = list(set([i for i in location_tuples]))
+    if len(insert_data) > 0:
+        bulk_insert(connection, insert_query, insert_data, commit=commit)
+        location_ids = refresh_dimension_ids(
+            connection, "origin_location", fetch_location_ids, key_cache)
 
-    for location in insert_data:
-        for query_location in location_query_data:
-            if float(location[0]) == float(query_location[0]) and float(
-                    location[1]) == float(query_location[1]):
-                insert_data.pop(insert_data.index(location))
-                break
+    return location_ids
 
-    if len(insert_data) > 0:
-        bulk_insert(connection, insert_query, insert_data)
-
-
-def upload_plants(connection: pyodbc.Connection, dataframe: pd.DataFrame) -> None:
-    """Uploads the plant data to the plant table"""
-    # get database data to find origin_location_ids
-    origin_location_ids_query = """
-                                SELECT 
-                                    origin_location_id, longitude, latitude
-                                FROM 
-                                    s_alpha.origin_location
-                                ;
-                                """
-    cursor = connection.cursor()
-    location_query_data = cursor.execute(origin_location_ids_query).fetchall()
 
+def upload_plants(connection: pyodbc.Connection, dataframe: pd.DataFrame,
+                  location_ids: dict[tuple[float, float], int] | None = None,
+                  key_cache: DimensionKeyCache | None = None,
+                  commit: bool = True) -> dict[str, int]:
+    """Uploads new plants to the plant table and returns the ids of every plant"""
     insert_query = """
                     INSERT INTO s_alpha.plant 
                         (name, scientific_name, origin_location_id, image_url) 
@@ -135,97 +251,148 @@ def upload_plants(connection: pyodbc.Connection, dataframe: pd.DataFrame) -> Non
                         (?, ?, ?, ?)
                     """
 
-    # get data from the database to check against input for duplicates
-    plant_query = """
-                    SELECT 
-                        name
-                    FROM
-                        s_alpha.plant
-                    ;
-                    """
-    cursor = connection.cursor()
-    plant_query_data = cursor.execute(plant_query).fetchall()
-
-    # build input data
-    plant_tuples = []
-    for index, row in dataframe[["name", "longitude",
-                                 "latitude", "scientific_name", "image_url"]].iterrows():
-        for location in location_query_data:
-            # link origin_location_ids
-            if float(row["longitude"]) == float(location[1]) and float(
-                    row["latitude"]) == float(location[2]):
-                plant_tuples.append(
-                    (row['name'], row["scientific_name"], location[0], row["image_url"]))
-                break
-
-    # remove duplicates
-    for plant in plant_tuples:
-        for query_plant in plant_query_data:
-            if plant[0] == query_plant[0]:
-                plant_tuples.pop(plant_tuples.index(plant))
-                break
-
-    if len(plant_tuples) > 0:
-        bulk_insert(connection, insert_query,  plant_tuples)
-
-
-def upload_recording_events(connection: pyodbc.Connection, dataframe: pd.DataFrame) -> None:
-    """Uploads the recording event data to the recording event table"""
-    # get database data to link botanist_ids
-    botanist_query = """
-                    SELECT 
-                        botanist_id, first_name, last_name
-                    FROM 
-                        s_alpha.botanist
-                    ;
-                    """
-    cursor = connection.cursor()
-    botanist_query_data = cursor.execute(botanist_query).fetchall()
+    if location_ids is None:
+        location_ids = fetch_location_ids(connection)
+
+    # one row per plant that is not in the database yet, linked to its origin_location_id
+    plant_data = dataframe[["name", "scientific_name", "longitude", "latitude",
+                            "image_url"]].drop_duplicates(subset=["name"])
+    plant_ids = get_dimension_ids(connection, "plant", set(plant_data["name"]),
+                                  fetch_plant_ids, key_cache)
+    insert_data = []
+    for name, scientific_name, longitude, latitude, image_url in plant_data.itertuples(
+            index=False, name=None):
+        location_id = location_ids.get((float(longitude), float(latitude)))
+        if name not in plant_ids and location_id is not None:
+            insert_data.append((name, scientific_name, location_id, image_url))
 
-    # get database data to link plant ids
-    plant_query = """
-                    SELECT 
-                        plant_id, name
-                    FROM 
-                        s_alpha.plant
-                    ;
-                    """
-    cursor = connection.cursor()
-    plant_query_data = cursor.execute(plant_query).fetchall()
+    if len(insert_data) > 0:
+        bulk_insert(connection, insert_query, insert_data, commit=commit)
+        plant_ids = refresh_dimension_ids(connection, "plant", fetch_plant_ids, key_cache)
+
+    return plant_ids
+
+
+def build_recording_tuples(dataframe: pd.DataFrame, plant_ids: dict[str, int],
+                           botanist_ids: dict[tuple[str, str], int]
+                           ) -> tuple[list[tuple], pd.DataFrame]:
+    """Links every reading to its plant_id and botanist_id with dictionary lookups, returning
+    the recording event tuples and the readings whose plant or botanist could not be found"""
+    plant_id = dataframe["name"].map(plant_ids)
+    botanist_id = pd.Series(
+        [botanist_ids.get(botanist) for botanist in zip(
+            dataframe["botanist_first_name"], dataframe["botanist_last_name"])],
+        index=dataframe.index, dtype="float64")
+
+    matched = plant_id.notna() & botanist_id.notna()
+    readings = dataframe[matched]
+
+    recording_tuples = list(zip(
+        plant_id[matched].astype(int).tolist(),
+        botanist_id[matched].astype(int).tolist(),
+        readings["soil_moisture"].astype(float).tolist(),
+        readings["temperature"].astype(float).tolist(),
+        readings["recording_taken"].to_numpy(dtype="datetime64[us]").astype(object).tolist(),
+        readings["last_watered"].to_numpy(dtype="datetime64[us]").astype(object).tolist()))
+
+    return recording_tuples, dataframe[~matched]
+
+
+def upload_recording_events(connection: pyodbc.Connection, dataframe: pd.DataFrame,
+                            plant_ids: dict[str, int] | None = None,
+                            botanist_ids: dict[tuple[str, str], int] | None = None,
+                            run_id: str | None = None, commit: bool = True) -> pd.DataFrame:
+    """Uploads the recording event data to the recording event table, returning any readings
+    that could not be linked to a plant and botanist. Readings already stored for the same
+    plant and recording_taken are skipped, so a run can safely be loaded again."""
+    # get database data to link plant and botanist ids if they were not passed in
+    if plant_ids is None:
+        plant_ids = fetch_plant_ids(connection)
+    if botanist_ids is None:
+        botanist_ids = fetch_botanist_ids(connection)
+    if run_id is None:
+        run_id = str(uuid4())
+
+    recording_tuples, unmatched = build_recording_tuples(dataframe, plant_ids, botanist_ids)
+
+    if not unmatched.empty:
+        logging.warning("%s readings have no matching plant or botanist and were not uploaded: %s",
+                        len(unmatched.index), unmatched[["plant_id", "name", "botanist_first_name",
+                                                         "botanist_last_name"]].to_dict("records"))
+
+    # one reading per plant and recording_taken, keeping the last
+    stage_data = list({(recording[0], recording[4]): recording + (run_id,)
+                       for recording in recording_tuples}.values())
+
+    if len(stage_data) > 0:
+        try:
+            bulk_insert(connection, STAGE_RECORDINGS_QUERY, stage_data, commit=False)
+            cursor = connection.cursor()
+            inserted_rows = cursor.execute(INSERT_STAGED_RECORDINGS_QUERY, (run_id,)).rowcount
+            cursor.execute(CLEAR_STAGE_QUERY, (run_id,))
+            cursor.close()
+            if commit:
+                connection.commit()
+        except pyodbc.Error:
+            if commit:
+                connection.rollback()
+            raise
+
+        logging.info("Run %s inserted %s recording events, %s were already stored.",
+                     run_id, inserted_rows, len(stage_data) - inserted_rows)
+
+    return unmatched
+
+
+def load_run(connection: pyodbc.Connection, dataframes: Iterable[pd.DataFrame],
+             run_id: str | None = None, commit_each: bool = False) -> str:
+    """Loads each dataframe into its respective tables as it arrives and returns the run id the
+    recording events were tagged with. The whole run is committed in one transaction at the end,
+    or each dataframe is committed as it is loaded with commit_each, so no locks are held while
+    the next one is being fetched. Reloading a committed dataframe adds no rows."""
+    if run_id is None:
+        run_id = str(uuid4())
+
+    key_cache = get_key_cache()
 
-    insert_query = """
-                    INSERT INTO s_alpha.recording_event 
-                        (plant_id, botanist_id, soil_moisture, temperature, recording_taken, last_watered) 
-                    VALUES 
-                        (?, ?, ?, ?, ?, ?)
-                    """
+    try:
+        # the ids may be from before the tables were recreated or from another database
+        key_cache.check(connection)
+        for df in dataframes:
+            if df.empty:
+                continue
 
-    # build input data
-    recording_tuples = []
-    for index, row in dataframe[["name", "botanist_first_name", "botanist_last_name",
-                                 "soil_moisture", "temperature", "recording_taken",
-                                 "last_watered"]].iterrows():
-        # link plant_ids
-        for plant in plant_query_data:
-            if row["name"] == plant[1]:
-                plant_id = plant[0]
-                break
+            botanist_ids = upload_botanists(connection, df, key_cache, commit=False)
+            logging.info("Botanist data uploaded.")
 
-        # link botanist_ids
-        for botanist in botanist_query_data:
-            if row["botanist_first_name"] == botanist[1] and row[
-                    "botanist_last_name"] == botanist[2]:
-                botanist_id = botanist[0]
-                break
+            location_ids = upload_origin_locations(connection, df, key_cache, commit=False)
+            logging.info("Location data uploaded.")
 
-        recording_tuples.append((plant_id, botanist_id, row["soil_moisture"],
-                                 row["temperature"], row["recording_taken"], row["last_watered"]))
+            plant_ids = upload_plants(connection, df, location_ids, key_cache, commit=False)
+            logging.info("Plants data uploaded.")
 
-    bulk_insert(connection, insert_query, recording_tuples)
+            upload_recording_events(connection, df, plant_ids, botanist_ids, run_id,
+                                    commit=False)
+            logging.info("Recording event data uploaded.")
+            if commit_each:
+                connection.commit()
+
+        connection.commit()
+        logging.info("Run %s committed.", run_id)
+    except Exception:
+        connection.rollback()
+        # the cached ids may be stale or from the rolled back inserts
+        key_cache.invalidate()
+        raise
+    finally:
+        key_cache.save()
 
+    return run_id
 
-def load_main(df: pd.DataFrame) -> None:
-    """loads all data from the dataframe into its respective tables"""
+
+def load_main(df: pd.DataFrame, run_id: str | None = None) -> str:
+    """Loads all data from the dataframe into its respective tables in one transaction,
+    returning the run id the recording events were tagged with"""
     load_dotenv()
 
     logging.info("Getting Database Connection.")
@@ -233,24 +400,17 @@ def load_main(df: pd.DataFrame) -> None:
     conn = get_connection()
     logging.info("Connected to the Database.")
 
-    upload_botanists(conn, df)
-    logging.info("Botanist data uploaded.")
-
-    upload_origin_locations(conn, df)
-    logging.info("Location data uploaded.")
-
-    upload_plants(conn, df)
-    logging.info("Plants data uploaded.")
-
-    upload_recording_events(conn, df)
-    logging.info("Recording event data uploaded.")
-
-
-
-    conn.close()
+    try:
+        return load_run(conn, [df], run_id)
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
+    # only needed when run as a script, so importing load stays cheap
+    from extract import extract_main
+    from transform import transform_main
+
     plant_data = extract_main()
     df = transform_main(plant_data)
     load_main(df)
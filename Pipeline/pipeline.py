@@ -1,13 +1,126 @@
-"""Script combining functions from ETL to produce a pipeline that can be dockerised."""
+"""Script combining functions from ETL to produce a pipeline that can be dockerised.
+Runs once by default, or stays resident with --daemon and runs on a fixed schedule."""
+import argparse
+import asyncio
 import logging
+from math import ceil
+import time
+from typing import Callable
 
-from extract import extract_main
+from dotenv import load_dotenv
+import pyodbc
+
+from extract import (extract_main, discover_plant_ids, get_plant_data_async, open_session,
+                     skip_probed, stream_plant_data, STREAM_BATCH_SIZE)
 from transform import transform_main
-from load import load_main
+from load import load_main, load_run, get_connection
+from resilience import BREAKER, STATS, load_breaker, save_breaker
 
+RUN_INTERVAL = 60
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+
+def run_once() -> None:
+    """Runs extract, transform and load once"""
     plant_data = extract_main()
     df = transform_main(plant_data)
     load_main(df)
+
+
+def run_tick(fetch: Callable[[list[int]], list[dict]], connection: pyodbc.Connection,
+             batch_size: int = STREAM_BATCH_SIZE) -> str:
+    """Streams one run through the pipeline, each batch of plants is transformed, loaded and
+    committed before the next is fetched, so readers are not blocked while the api is called"""
+    # the stats are per run, otherwise a resident process keeps every latency it has seen
+    STATS.reset()
+    try:
+        probed = {}
+        plant_ids = discover_plant_ids(fetch, found=probed)
+        batches = stream_plant_data(plant_ids, skip_probed(fetch, probed), batch_size)
+        dataframes = (transform_main([batch]) for batch in batches)
+        return load_run(connection, dataframes, commit_each=True)
+    finally:
+        # kept so a restarted daemon does not retry plants whose circuit is open
+        save_breaker(BREAKER)
+        logging.info("Request stats: %s", STATS.summary())
+
+
+def get_live_connection(connection: pyodbc.Connection | None) -> pyodbc.Connection:
+    """Reuses the connection while it still works, otherwise opens a new one"""
+    if connection is not None:
+        try:
+            connection.cursor().execute("SELECT 1;").fetchall()
+            return connection
+        except pyodbc.Error:
+            logging.warning("Database connection lost, reconnecting.")
+            try:
+                connection.close()
+            except pyodbc.Error:
+                pass
+
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("Could not connect to the database")
+    return connection
+
+
+def wait_for_next_run(next_run: float, interval: float) -> float:
+    """Sleeps until the next scheduled run and returns when the one after it is due.
+    The schedule is kept against the first run so sleeps do not drift, and runs that were
+    missed while a slow run overran are skipped rather than run back to back."""
+    next_run += interval
+    now = time.monotonic()
+    if next_run < now:
+        missed = ceil((now - next_run) / interval)
+        logging.warning("Run overran, skipping %s scheduled runs.", missed)
+        next_run += missed * interval
+
+    time.sleep(next_run - now)
+    return next_run
+
+
+def run_forever(interval: float = RUN_INTERVAL, batch_size: int = STREAM_BATCH_SIZE) -> None:
+    """Keeps one http session and one database connection open and runs the pipeline every
+    interval seconds"""
+    load_dotenv()
+    load_breaker(BREAKER)
+    loop = asyncio.new_event_loop()
+    session = loop.run_until_complete(open_session())
+
+    def fetch(plant_range: list[int]) -> list[dict]:
+        return loop.run_until_complete(get_plant_data_async(plant_range, session=session))
+
+    connection = None
+    next_run = time.monotonic()
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                connection = get_live_connection(connection)
+                run_id = run_tick(fetch, connection, batch_size)
+                logging.info("Run %s took %.2fs.", run_id, time.monotonic() - started)
+            except Exception:
+                logging.exception("Pipeline run failed.")
+            next_run = wait_for_next_run(next_run, interval)
+    finally:
+        loop.run_until_complete(session.close())
+        loop.close()
+        if connection is not None:
+            connection.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Runs the plants ETL pipeline.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay resident and run on a schedule instead of once")
+    parser.add_argument("--interval", type=float, default=RUN_INTERVAL,
+                        help="seconds between runs in daemon mode")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH_SIZE,
+                        help="plants fetched, transformed and loaded at a time in daemon mode")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_forever(args.interval, args.batch_size)
+    else:
+        run_once()
@@ -0,0 +1 @@
+../common/recording_dtypes.py
\ No newline at end of file
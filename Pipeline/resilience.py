@@ -0,0 +1,164 @@
+"""Contains the retry, backoff and circuit breaker state used when fetching from the plants api"""
+import json
+import logging
+from os import environ
+import random
+import time
+from dataclasses import dataclass, field
+from statistics import mean
+from typing import Callable, Iterable
+
+from state import read_text, state_file, write_text
+
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4
+
+# consecutive failed fetches before a plant is skipped, and for how many seconds
+FAILURE_THRESHOLD = 3
+BREAKER_COOLDOWN = 300
+# one-shot runs and pool workers only fetch each plant once, so the breaker state is kept
+# between runs like the plant id cache
+BREAKER_STATE = environ.get("BREAKER_STATE", state_file("circuit_breaker.json"))
+
+
+class RetryableError(Exception):
+    """Raised when the api gives a response that is worth retrying, such as a 5xx"""
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Gets a full jitter exponential backoff delay in seconds for a retry attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+@dataclass
+class CircuitBreaker:
+    """Tracks consecutive failures per plant and stops calling plants that keep failing.
+    Once open, a single trial call is let through after the cooldown (half-open).
+    The clock is wall time so the open times still hold in the next process."""
+    failure_threshold: int = FAILURE_THRESHOLD
+    cooldown: float = BREAKER_COOLDOWN
+    clock: Callable[[], float] = time.time
+    failures: dict[int, int] = field(default_factory=dict)
+    opened_at: dict[int, float] = field(default_factory=dict)
+    # plants whose next call is the half-open trial, they are not kept between runs
+    trials: set[int] = field(default_factory=set)
+
+    def allow(self, plant_id: int) -> bool:
+        """Returns whether the plant endpoint should be called"""
+        opened_at = self.opened_at.get(plant_id)
+        if opened_at is None:
+            return True
+        if self.clock() - opened_at >= self.cooldown:
+            # half-open, one more failure re-opens the breaker straight away
+            self.opened_at.pop(plant_id)
+            self.failures[plant_id] = self.failure_threshold - 1
+            self.trials.add(plant_id)
+            return True
+        return False
+
+    def is_trial(self, plant_id: int) -> bool:
+        """Returns whether the allowed call is a half-open trial, which should not be retried"""
+        return plant_id in self.trials
+
+    def record_success(self, plant_id: int) -> None:
+        """Closes the breaker for a plant"""
+        self.failures.pop(plant_id, None)
+        self.opened_at.pop(plant_id, None)
+        self.trials.discard(plant_id)
+
+    def record_failure(self, plant_id: int) -> None:
+        """Counts a failed fetch, opening the breaker once the threshold is reached"""
+        self.trials.discard(plant_id)
+        self.failures[plant_id] = self.failures.get(plant_id, 0) + 1
+        if self.failures[plant_id] >= self.failure_threshold and plant_id not in self.opened_at:
+            logging.warning('Circuit opened for plant %s', plant_id)
+            self.opened_at[plant_id] = self.clock()
+
+    def snapshot(self, plant_ids: Iterable[int] | None = None) -> dict:
+        """Gets the failure counts and open times of the given plants, or of every plant"""
+        failures, opened_at = self.failures, self.opened_at
+        if plant_ids is not None:
+            plant_ids = set(plant_ids)
+            failures = {plant: count for plant, count in failures.items() if plant in plant_ids}
+            opened_at = {plant: at for plant, at in opened_at.items() if plant in plant_ids}
+        return {"failures": dict(failures), "opened_at": dict(opened_at)}
+
+    def restore(self, snapshot: dict, plant_ids: Iterable[int] | None = None) -> None:
+        """Replaces the state of the given plants, or of every plant, with a snapshot's"""
+        if plant_ids is None:
+            self.failures.clear()
+            self.opened_at.clear()
+            self.trials.clear()
+        else:
+            for plant_id in plant_ids:
+                self.failures.pop(plant_id, None)
+                self.opened_at.pop(plant_id, None)
+                self.trials.discard(plant_id)
+        # json keys are strings
+        self.failures.update({int(plant): int(count)
+                              for plant, count in snapshot.get("failures", {}).items()})
+        self.opened_at.update({int(plant): float(at)
+                               for plant, at in snapshot.get("opened_at", {}).items()})
+
+
+def load_breaker(breaker: CircuitBreaker, state_path: str | None = BREAKER_STATE) -> None:
+    """Restores the breaker state saved by a previous run, ignoring a missing or unreadable file"""
+    if not state_path:
+        return
+    try:
+        breaker.restore(json.loads(read_text(state_path)))
+    except (OSError, ValueError, AttributeError, TypeError):
+        return
+
+
+def save_breaker(breaker: CircuitBreaker, state_path: str | None = BREAKER_STATE) -> None:
+    """Stores the breaker state for the next run"""
+    if not state_path:
+        return
+    try:
+        write_text(state_path, json.dumps(breaker.snapshot()))
+    except OSError as e:
+        logging.warning('Could not write circuit breaker state: %r', e)
+
+
+@dataclass
+class FetchStats:
+    """Records the latency of every request and the number of failed requests per plant"""
+    latencies: dict[int, list[float]] = field(default_factory=dict)
+    failures: dict[int, int] = field(default_factory=dict)
+
+    def record(self, plant_id: int, latency: float, success: bool) -> None:
+        """Records one request attempt"""
+        self.latencies.setdefault(plant_id, []).append(latency)
+        if not success:
+            self.failures[plant_id] = self.failures.get(plant_id, 0) + 1
+
+    def summary(self, slowest: int = 5) -> dict:
+        """Gets the overall request counts and the plants with the highest mean latency"""
+        mean_latencies = {plant_id: mean(latencies)
+                          for plant_id, latencies in self.latencies.items()}
+        slowest_plants = sorted(mean_latencies.items(),
+                                key=lambda item: item[1], reverse=True)[:slowest]
+        return {
+            "requests": sum(len(latencies) for latencies in self.latencies.values()),
+            "failed_requests": sum(self.failures.values()),
+            "slowest_plants": slowest_plants,
+            "failures": dict(self.failures),
+        }
+
+    def merge(self, other: "FetchStats") -> None:
+        """Adds the requests recorded by another process, such as a pool worker"""
+        for plant_id, latencies in other.latencies.items():
+            self.latencies.setdefault(plant_id, []).extend(latencies)
+        for plant_id, count in other.failures.items():
+            self.failures[plant_id] = self.failures.get(plant_id, 0) + count
+
+    def reset(self) -> None:
+        """Clears the recorded stats"""
+        self.latencies.clear()
+        self.failures.clear()
+
+
+BREAKER = CircuitBreaker()
+STATS = FetchStats()
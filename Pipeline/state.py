@@ -0,0 +1,44 @@
+"""Contains the small files the pipeline keeps between runs, such as the plant id cache.
+They live under STATE_PATH, a local directory or s3://bucket/prefix, so a one-shot ECS task
+whose local disk is thrown away can keep them on S3."""
+from os import environ, makedirs, path
+
+# a local directory, or s3://bucket/prefix for S3 or an S3 compatible store such as MinIO
+STATE_PATH = environ.get("STATE_PATH", "state")
+STATE_ENDPOINT = environ.get("STATE_ENDPOINT")
+
+
+def state_file(name: str, state_path: str = STATE_PATH) -> str:
+    """Gets the path of a file kept under the state path"""
+    return f"{state_path.rstrip('/')}/{name}"
+
+
+def read_text(file_path: str, endpoint: str | None = STATE_ENDPOINT) -> str:
+    """Reads a state file, raising OSError if it is missing or cannot be read"""
+    if file_path.startswith("s3://"):
+        import pyarrow.fs as pafs
+
+        filesystem = pafs.S3FileSystem(endpoint_override=endpoint)
+        with filesystem.open_input_stream(file_path[len("s3://"):]) as state:
+            return state.read().decode("utf-8")
+
+    with open(file_path, encoding="utf-8") as state:
+        return state.read()
+
+
+def write_text(file_path: str, contents: str, endpoint: str | None = STATE_ENDPOINT) -> None:
+    """Writes a state file, creating its local directory if needed. Raises OSError on failure."""
+    if file_path.startswith("s3://"):
+        import pyarrow.fs as pafs
+
+        filesystem = pafs.S3FileSystem(endpoint_override=endpoint)
+        with filesystem.open_output_stream(file_path[len("s3://"):]) as state:
+            state.write(contents.encode("utf-8"))
+        return
+
+    directory = path.dirname(file_path)
+    if directory:
+        makedirs(directory, exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as state:
+        state.write(contents)
+
@@ -0,0 +1,88 @@
+"""Script that tests the functions in archive.py"""
+
+from datetime import datetime, timedelta
+import sqlite3
+
+import pyarrow.dataset as ds
+
+from archive import ARCHIVE_PARTITIONING, archive_recordings, get_archive_cutoff
+
+NOW = datetime(2023, 12, 21, 10, 30)
+
+
+def make_connection(days: int) -> sqlite3.Connection:
+    """Makes an in-memory database with two plants recorded every hour for the given days"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ':memory:' AS s_alpha")
+    conn.execute("""CREATE TABLE s_alpha.recording_event (
+        recording_id INTEGER PRIMARY KEY AUTOINCREMENT, plant_id INT, botanist_id INT,
+        soil_moisture FLOAT, temperature FLOAT, recording_taken TIMESTAMP, last_watered TIMESTAMP)""")
+    conn.execute("""CREATE TABLE s_alpha.archived_botanist_plant (
+        botanist_id INT, plant_id INT, PRIMARY KEY (botanist_id, plant_id))""")
+    conn.execute("""CREATE TABLE s_alpha.archived_plant_watering (
+        plant_id INT, last_watered TIMESTAMP, PRIMARY KEY (last_watered, plant_id))""")
+    start = NOW - timedelta(days=days)
+    rows = [(plant_id, 1, 30.0, 20.0, str(start + timedelta(hours=hour)), str(start))
+            for hour in range(days * 24) for plant_id in (1, 2)]
+    conn.executemany("""INSERT INTO s_alpha.recording_event
+        (plant_id, botanist_id, soil_moisture, temperature, recording_taken, last_watered)
+        VALUES (?, ?, ?, ?, ?, ?)""", rows)
+    conn.commit()
+    return conn
+
+
+def read_archive(path) -> list[dict]:
+    """Reads every archived reading"""
+    return ds.dataset(str(path), format="parquet",
+                      partitioning=ARCHIVE_PARTITIONING).to_table().to_pylist()
+
+
+def test_get_archive_cutoff_is_midnight():
+    """Tests that whole days are archived"""
+    assert get_archive_cutoff(NOW, 2) == datetime(2023, 12, 19)
+
+
+def test_archive_moves_old_readings(tmp_path):
+    """Tests that readings before the cutoff are written to the archive and deleted"""
+    conn = make_connection(5)
+    total = conn.execute("SELECT COUNT(*) FROM s_alpha.recording_event").fetchone()[0]
+
+    archived = archive_recordings(conn, str(tmp_path), horizon_days=2, now=NOW)
+
+    remaining = conn.execute("SELECT COUNT(*), MIN(recording_taken) FROM s_alpha.recording_event").fetchone()
+    assert archived + remaining[0] == total
+    assert remaining[1] >= "2023-12-19"
+    assert len(read_archive(tmp_path)) == archived
+
+
+def test_archive_is_partitioned_by_date_and_plant(tmp_path):
+    """Tests that a filter on date and plant only reads the matching files"""
+    archive_recordings(make_connection(5), str(tmp_path), horizon_days=2, now=NOW)
+
+    assert (tmp_path / "date=2023-12-17" / "plant_id=2").is_dir()
+    dataset = ds.dataset(str(tmp_path), format="parquet", partitioning=ARCHIVE_PARTITIONING)
+    files = dataset.get_fragments(filter=(ds.field("date") == "2023-12-17") &
+                                  (ds.field("plant_id") == 2))
+    assert len(list(files)) == 1
+
+
+def test_archive_again_keeps_earlier_files(tmp_path):
+    """Tests that a second run adds to the archive instead of replacing it"""
+    conn = make_connection(5)
+    first = archive_recordings(conn, str(tmp_path), horizon_days=3, now=NOW)
+    second = archive_recordings(conn, str(tmp_path), horizon_days=2, now=NOW)
+    assert len(read_archive(tmp_path)) == first + second
+
+
+def test_archive_keeps_botanist_and_watering_facts(tmp_path):
+    """Tests that the botanist and watering facts of archived readings are kept once each,
+    however many runs and readings they came from"""
+    conn = make_connection(5)
+    archive_recordings(conn, str(tmp_path), horizon_days=3, now=NOW)
+    archive_recordings(conn, str(tmp_path), horizon_days=2, now=NOW)
+
+    assert conn.execute("SELECT botanist_id, plant_id FROM s_alpha.archived_botanist_plant "
+                        "ORDER BY plant_id").fetchall() == [(1, 1), (1, 2)]
+    assert conn.execute("SELECT plant_id, last_watered FROM s_alpha.archived_plant_watering "
+                        "ORDER BY plant_id").fetchall() == [
+        (1, str(NOW - timedelta(days=5))), (2, str(NOW - timedelta(days=5)))]
@@ -1,13 +1,29 @@
 """Script that tests the functions in extract.py"""
 
+import asyncio
 import pytest
 from unittest.mock import patch
+from aioresponses import aioresponses
 
-from extract import get_plant_data
+from resilience import BREAKER, FAILURE_THRESHOLD, STATS
+from extract import (get_plant_data, get_plant_data_async, extract_main, discover_max_plant_id,
+                     discover_plant_ids, load_plant_id_cache, choose_worker_count, shard_plant_ids,
+                     stream_plant_data, open_session, merge_probed)
 
 URL = "https://data-eng-plants-api.herokuapp.com/plants/"
 
 
+@pytest.fixture(autouse=True)
+def fresh_fetch_state():
+    """Clears the shared breaker and stats, and removes backoff sleeps"""
+    BREAKER.failures.clear()
+    BREAKER.opened_at.clear()
+    BREAKER.trials.clear()
+    STATS.reset()
+    with patch('extract.backoff_delay', return_value=0):
+        yield
+
+
 def test_get_plants_data_not_a_list():
     """Tests that checks raises an error if plant range is not a list"""
 
@@ -43,3 +59,288 @@ def test_get_plants_data_success(requests_mock):
     assert requests_mock.called
     assert requests_mock.call_count == 5
     assert requests_mock.last_request.method == "GET"
+
+
+def test_get_plant_data_async_not_a_list_of_ints():
+    """Tests that the async fetcher raises an error if plant range is not a list of ints"""
+
+    with pytest.raises(TypeError):
+        asyncio.run(get_plant_data_async([1, 2, '3']))
+
+
+def test_get_plant_data_async_keeps_order():
+    """Tests that the async fetcher returns plants in the order they were requested"""
+
+    plant_range = [3, 1, 2]
+    with aioresponses() as mocked:
+        for plant in plant_range:
+            mocked.get(f"{URL}{plant}", status=200, payload={"plant_id": plant})
+
+        data = asyncio.run(get_plant_data_async(plant_range))
+
+    assert [plant["plant_id"] for plant in data] == plant_range
+
+
+def test_get_plant_data_async_failed_request():
+    """Tests that a failed request becomes an error dict instead of raising"""
+
+    with aioresponses() as mocked:
+        mocked.get(f"{URL}1", exception=asyncio.TimeoutError())
+
+        data = asyncio.run(get_plant_data_async([1]))
+
+    assert data[0]["plant_id"] == 1
+    assert "error" in data[0]
+
+
+def test_get_plant_data_async_retries_server_errors():
+    """Tests that a 5xx response is retried and the later success is returned"""
+
+    with aioresponses() as mocked:
+        mocked.get(f"{URL}1", status=503)
+        mocked.get(f"{URL}1", status=200, payload={"plant_id": 1})
+
+        data = asyncio.run(get_plant_data_async([1]))
+
+    assert data == [{"plant_id": 1}]
+    assert STATS.failures == {1: 1}
+    assert len(STATS.latencies[1]) == 2
+
+
+def test_get_plant_data_retries_then_gives_up(requests_mock):
+    """Tests that a plant that keeps failing becomes an error dict after every retry"""
+
+    requests_mock.get(f"{URL}1", status_code=500)
+
+    data = get_plant_data([1])
+
+    assert data[0]["plant_id"] == 1
+    assert "error" in data[0]
+    assert requests_mock.call_count == 3
+    assert BREAKER.failures[1] == 1
+
+
+def test_get_plant_data_skips_open_circuit(requests_mock):
+    """Tests that a plant with an open circuit is not requested"""
+
+    requests_mock.get(f"{URL}1", status_code=500)
+    for _ in range(BREAKER.failure_threshold):
+        get_plant_data([1])
+    calls = requests_mock.call_count
+
+    assert get_plant_data([1]) == [{"error": "circuit open", "plant_id": 1}]
+    assert requests_mock.call_count == calls
+
+
+def test_get_plant_data_half_open_makes_one_call(requests_mock):
+    """Tests that the trial call after the cooldown is not retried and re-opens the circuit"""
+
+    requests_mock.get(f"{URL}1", status_code=500)
+    BREAKER.failures[1] = BREAKER.failure_threshold
+    BREAKER.opened_at[1] = 0.0
+
+    data = get_plant_data([1])
+
+    assert "error" in data[0]
+    assert requests_mock.call_count == 1
+    assert get_plant_data([1]) == [{"error": "circuit open", "plant_id": 1}]
+
+
+def test_extract_main_pool_keeps_worker_stats(requests_mock, tmp_path):
+    """Tests that the requests made in pool workers are counted in the parent's stats"""
+
+    for plant in range(0, 5):
+        requests_mock.get(f"{URL}{plant}", json={"plant_id": plant})
+    requests_mock.get(f"{URL}3", status_code=500)
+    for plant in range(5, 30):
+        requests_mock.get(f"{URL}{plant}", status_code=404, json={"error": "plant not found"})
+    (tmp_path / "ids.json").write_text('{"max_plant_id": 4}')
+
+    data_segments = extract_main(use_async=False, cache_path=str(tmp_path / "ids.json"),
+                                 breaker_path=None)
+
+    assert [plant.get("plant_id") for plant in data_segments[0]] == [0, 1, 2, 3, 4]
+    # plant 3 is only requested by a worker, its three attempts all fail
+    assert STATS.failures[3] == 3
+    assert len(STATS.latencies[3]) == 3
+    assert BREAKER.failures[3] == 1
+
+
+def test_extract_main_segment_shape(tmp_path):
+    """Tests that async extraction keeps the list of segments shape"""
+
+    with aioresponses() as mocked:
+        for plant in range(0, 50):
+            mocked.get(f"{URL}{plant}", status=200,
+                       payload={"plant_id": plant}, repeat=True)
+
+        data_segments = extract_main(cache_path=str(tmp_path / "ids.json"), breaker_path=None)
+
+    assert [len(segment) for segment in data_segments] == [13, 13, 12, 12]
+    assert data_segments[1][0]["plant_id"] == 13
+
+
+def test_extract_main_does_not_refetch_probed_plants(tmp_path):
+    """Tests that plants found while discovering the ids are only requested once"""
+
+    with aioresponses() as mocked:
+        for plant in range(0, 30):
+            mocked.get(f"{URL}{plant}", status=200, payload={"plant_id": plant}, repeat=True)
+        for plant in range(30, 70):
+            mocked.get(f"{URL}{plant}", status=404, payload={"error": "plant not found"},
+                       repeat=True)
+
+        data_segments = extract_main(cache_path=str(tmp_path / "ids.json"), breaker_path=None)
+        requests = {str(url): len(calls) for (_, url), calls in mocked.requests.items()}
+
+    assert [plant["plant_id"] for segment in data_segments for plant in segment] == list(range(0, 30))
+    assert all(requests[f"{URL}{plant}"] == 1 for plant in range(0, 30))
+
+
+def test_extract_main_keeps_breaker_between_runs(tmp_path):
+    """Tests that a plant failing in separate one-shot runs has its circuit opened"""
+
+    paths = {"cache_path": str(tmp_path / "ids.json"),
+             "breaker_path": str(tmp_path / "breaker.json")}
+    with aioresponses() as mocked:
+        for plant in range(0, 10):
+            if plant == 3:
+                mocked.get(f"{URL}{plant}", status=500, repeat=True)
+            else:
+                mocked.get(f"{URL}{plant}", status=200, payload={"plant_id": plant}, repeat=True)
+        for plant in range(10, 50):
+            mocked.get(f"{URL}{plant}", status=404, payload={"error": "plant not found"},
+                       repeat=True)
+
+        for _ in range(FAILURE_THRESHOLD + 1):
+            # each run starts with a fresh process's empty breaker
+            BREAKER.failures.clear()
+            BREAKER.opened_at.clear()
+            data_segments = extract_main(**paths)
+
+    plants = [plant for segment in data_segments for plant in segment]
+    assert plants[3] == {"error": "circuit open", "plant_id": 3}
+    assert plants[4] == {"plant_id": 4}
+
+
+def fake_fetch(live_ids: set[int], requested: list[int]):
+    """Makes a fetch function that only knows about live_ids and records what was asked for"""
+    def fetch(plant_range: list[int]) -> list[dict]:
+        requested.extend(plant_range)
+        return [{"plant_id": plant} if plant in live_ids else {"error": "plant not found"}
+                for plant in plant_range]
+    return fetch
+
+
+def test_discover_max_plant_id_skips_small_gaps():
+    """Tests that probing carries on past fewer than miss_limit missing ids"""
+
+    live_ids = set(range(0, 10)) | {12, 20}
+    assert discover_max_plant_id(fake_fetch(live_ids, []), miss_limit=5) == 12
+
+
+def test_discover_max_plant_id_grows_window():
+    """Tests that probes get wider while they find plants and keep what they found"""
+
+    calls = []
+    requested = []
+    fetch = fake_fetch(set(range(0, 100)), requested)
+    found = {}
+
+    def counting_fetch(plant_range: list[int]) -> list[dict]:
+        calls.append(len(plant_range))
+        return fetch(plant_range)
+
+    assert discover_max_plant_id(counting_fetch, miss_limit=5, found=found) == 99
+    assert calls == [5, 10, 20, 40, 80]
+    assert sorted(found) == list(range(0, 100))
+
+
+def test_merge_probed_keeps_order():
+    """Tests that probed plants go back between the fetched ones in id order"""
+
+    probed = {0: {"plant_id": 0}, 2: {"plant_id": 2}}
+    fetched = [{"plant_id": 1}, {"plant_id": 3}]
+    assert [plant["plant_id"] for plant in merge_probed([0, 1, 2, 3], probed, fetched)] == [0, 1, 2, 3]
+
+
+def test_discover_plant_ids_uses_cache(tmp_path):
+    """Tests that a second run only probes above the cached highest id"""
+
+    cache_path = str(tmp_path / "ids.json")
+    live_ids = set(range(0, 30))
+
+    assert discover_plant_ids(fake_fetch(live_ids, []), cache_path) == list(range(0, 30))
+    assert load_plant_id_cache(cache_path) == 29
+
+    requested = []
+    live_ids.add(30)
+    assert discover_plant_ids(fake_fetch(live_ids, requested), cache_path) == list(range(0, 31))
+    assert min(requested) == 30
+
+
+def test_choose_worker_count():
+    """Tests that the worker count grows with the number of plants within its bounds"""
+
+    assert choose_worker_count(0) == 1
+    assert choose_worker_count(50) == 4
+    assert choose_worker_count(10000) == 8
+
+
+def test_shard_plant_ids_even_sizes():
+    """Tests that shards cover every id once with sizes that differ by at most one"""
+
+    segments = shard_plant_ids(list(range(0, 50)), 4)
+    assert [plant for segment in segments for plant in segment] == list(range(0, 50))
+    assert max(map(len, segments)) - min(map(len, segments)) <= 1
+
+
+def test_get_plant_data_async_reuses_session():
+    """Tests that a session passed in is used and left open for the next call"""
+
+    async def fetch_twice():
+        session = await open_session()
+        first = await get_plant_data_async([1], session=session)
+        second = await get_plant_data_async([2], session=session)
+        closed = session.closed
+        await session.close()
+        return first + second, closed
+
+    with aioresponses() as mocked:
+        for plant in (1, 2):
+            mocked.get(f"{URL}{plant}", status=200, payload={"plant_id": plant})
+
+        data, closed = asyncio.run(fetch_twice())
+
+    assert [plant["plant_id"] for plant in data] == [1, 2]
+    assert not closed
+
+
+def test_stream_plant_data_fetches_lazily():
+    """Tests that each batch is only fetched when the consumer asks for it"""
+
+    requested = []
+    batches = stream_plant_data(list(range(0, 5)), fake_fetch(set(range(0, 5)), requested),
+                                batch_size=2)
+
+    assert requested == []
+    assert [plant["plant_id"] for plant in next(batches)] == [0, 1]
+    assert requested == [0, 1]
+    assert [len(batch) for batch in batches] == [2, 1]
+
+
+def test_open_session_does_not_time_out_queued_requests():
+    """Tests that only connecting and reading are timed, not waiting for a free connection"""
+
+    async def get_timeout():
+        session = await open_session(max_concurrent=1, timeout=0.5)
+        timeout = session.timeout
+        await session.close()
+        return timeout
+
+    timeout = asyncio.run(get_timeout())
+
+    assert timeout.total is None
+    assert timeout.connect is None
+    assert timeout.sock_connect == 0.5
+    assert timeout.sock_read == 0.5
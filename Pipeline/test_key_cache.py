@@ -0,0 +1,76 @@
+"""Script that tests the functions in key_cache.py"""
+
+import sqlite3
+
+from key_cache import DimensionKeyCache
+
+
+def test_missing_keys():
+    """Tests that only keys without a cached id are reported as missing"""
+    cache = DimensionKeyCache(None)
+    cache.update("plant", {"Venus flytrap": 1})
+    assert cache.missing("plant", {"Venus flytrap", "Epipremnum Aureum"}) == {"Epipremnum Aureum"}
+
+
+def test_cache_persists_between_instances(tmp_path):
+    """Tests that a saved cache is read back by a new instance for the same database"""
+    cache_path = str(tmp_path / "keys.json")
+    cache = DimensionKeyCache(cache_path, database="plants")
+    cache.update("botanist", {("Carl", "Linnaeus"): 3})
+    cache.save()
+
+    assert DimensionKeyCache(cache_path, database="plants").get(
+        "botanist") == {("Carl", "Linnaeus"): 3}
+
+
+def test_cache_ignored_for_other_database(tmp_path):
+    """Tests that ids cached for one database are not used for another"""
+    cache_path = str(tmp_path / "keys.json")
+    cache = DimensionKeyCache(cache_path, database="plants")
+    cache.update("plant", {"Venus flytrap": 1})
+    cache.save()
+
+    assert DimensionKeyCache(cache_path, database="other").get("plant") == {}
+
+
+def test_invalidate_table():
+    """Tests that invalidating one table keeps the others"""
+    cache = DimensionKeyCache(None)
+    cache.update("plant", {"Venus flytrap": 1})
+    cache.update("botanist", {("Carl", "Linnaeus"): 3})
+    cache.invalidate("plant")
+    assert cache.get("plant") == {}
+    assert cache.get("botanist") == {("Carl", "Linnaeus"): 3}
+
+
+def test_cache_ignores_unexpected_file(tmp_path):
+    """Tests that a cache file that is not the expected JSON is ignored"""
+    cache_path = tmp_path / "keys.json"
+    for contents in ("not json", "[1, 2]", '{"database": "plants", "tables": {"plant": 3}}'):
+        cache_path.write_text(contents, encoding="utf-8")
+        assert DimensionKeyCache(str(cache_path), database="plants").tables == {}
+
+
+def make_plant_table(plants: list[str]) -> sqlite3.Connection:
+    """Makes an in-memory plant table holding the given plants"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ':memory:' AS s_alpha")
+    conn.execute("CREATE TABLE s_alpha.plant (plant_id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO s_alpha.plant (name) VALUES (?)", [(name,) for name in plants])
+    return conn
+
+
+def test_check_keeps_matching_table():
+    """Tests that ids matching the table's row count and highest id are kept"""
+    cache = DimensionKeyCache(None)
+    cache.update("plant", {"Venus flytrap": 1, "Corpse flower": 2})
+    cache.check(make_plant_table(["Venus flytrap", "Corpse flower"]))
+    assert cache.get("plant") == {"Venus flytrap": 1, "Corpse flower": 2}
+
+
+def test_check_forgets_recreated_table():
+    """Tests that ids cached before the table was dropped and recreated are forgotten"""
+    cache = DimensionKeyCache(None)
+    cache.update("plant", {"Venus flytrap": 4, "Corpse flower": 5})
+    cache.check(make_plant_table(["Corpse flower", "Venus flytrap"]))
+    assert cache.get("plant") == {}
@@ -0,0 +1,111 @@
+"""Script that tests the functions in load.py"""
+
+from datetime import datetime
+
+import pytest
+
+import load
+from load import BulkInsertError, build_recording_tuples, bulk_insert, load_run, upload_recording_events
+from key_cache import DimensionKeyCache
+from transform import make_dataframe
+# the SQLite stand-in for the database that the pipeline benchmark also uses, see conftest.py
+from sqlite_database import SQLiteDatabase
+from recording_database import RecordingConnection
+
+PLANTS = [
+    [0, 'Epipremnum Aureum', 'Epipremnum aureum', datetime(2023, 12, 20, 14, 3, 4),
+     datetime(2023, 12, 21, 11, 4, 30), 26.7, 27.4, 'carl.linnaeus@lnhm.co.uk', 'Carl',
+     'Linnaeus', '(146)994-1635x35992', None, '-19.32556', '-41.25528', 'Resplendor',
+     'Sao_Paulo', 'BR', 'America'],
+    [1, 'Venus flytrap', None, datetime(2023, 12, 20, 13, 54, 32),
+     datetime(2023, 12, 21, 11, 4, 31), 25.0, 12.0, 'gertrude.jekyll@lnhm.co.uk', 'Gertrude',
+     'Jekyll', '001-481-273-3691x127', None, '33.95015', '-118.03917', 'South Whittier',
+     'Los_Angeles', 'US', 'America'],
+    [2, 'Corpse flower', None, datetime(2023, 12, 20, 13, 20, 2),
+     datetime(2023, 12, 21, 11, 4, 33), 30.1, 15.2, 'carl.linnaeus@lnhm.co.uk', 'Carl',
+     'Linnaeus', '(146)994-1635x35992', None, '-19.32556', '-41.25528', 'Resplendor',
+     'Sao_Paulo', 'BR', 'America'],
+]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch) -> SQLiteDatabase:
+    """Makes an empty database and keeps the dimension key cache in memory"""
+    monkeypatch.setattr(load, "get_key_cache", lambda: DimensionKeyCache(None))
+    return SQLiteDatabase(tmp_path / "database")
+
+
+def test_build_recording_tuples_returns_unmatched():
+    """Tests that readings without a known plant or botanist are left out and returned"""
+    df = make_dataframe(PLANTS)
+    plant_ids = {'Epipremnum Aureum': 10, 'Venus flytrap': 11}
+    botanist_ids = {('Carl', 'Linnaeus'): 20}
+
+    recording_tuples, unmatched = build_recording_tuples(df, plant_ids, botanist_ids)
+
+    assert [recording[:2] for recording in recording_tuples] == [(10, 20)]
+    assert unmatched['name'].tolist() == ['Venus flytrap', 'Corpse flower']
+
+
+def test_bulk_insert_batches():
+    """Tests that rows are sent in batches and committed once at the end"""
+    conn = RecordingConnection()
+    assert bulk_insert(conn, "INSERT", [(row,) for row in range(5)], batch_size=2) == 5
+    assert [len(batch) for _, batch in conn.executed] == [2, 2, 1]
+    assert conn.commits == 1
+
+
+def test_bulk_insert_error_says_what_was_committed():
+    """Tests that a failed batch raises BulkInsertError with the rows committed before it"""
+    conn = RecordingConnection(fail_on=1)
+
+    with pytest.raises(BulkInsertError) as error:
+        bulk_insert(conn, "INSERT", [(row,) for row in range(5)], batch_size=2,
+                    commit_each_batch=True)
+
+    assert error.value.inserted_rows == 2
+    assert error.value.committed_rows == 2
+    assert error.value.failed_rows == [(2,), (3,)]
+    assert conn.rolled_back
+
+
+def test_load_run_twice_is_idempotent(database):
+    """Tests that loading the same frame again does not add any rows"""
+    df = make_dataframe(PLANTS)
+
+    for _ in range(2):
+        conn = database.connect()
+        load_run(conn, [df])
+        conn.close()
+
+    assert database.count("recording_event") == 3
+    assert database.count("plant") == 3
+    assert database.count("botanist") == 2
+    assert database.count("origin_location") == 2
+    assert database.count("recording_event_stage") == 0
+
+
+def test_upload_recording_events_skips_unmatched(database):
+    """Tests that readings whose plant is not in the database are returned and not loaded"""
+    conn = database.connect()
+    load_run(conn, [make_dataframe(PLANTS[:2])])
+
+    unmatched = upload_recording_events(conn, make_dataframe(PLANTS))
+    conn.close()
+
+    assert unmatched['name'].tolist() == ['Corpse flower']
+    assert database.count("recording_event") == 2
+
+
+def test_load_run_commit_each_keeps_earlier_batches(database):
+    """Tests that batches committed one at a time stay loaded when a later batch fails"""
+    def batches():
+        yield make_dataframe(PLANTS[:2])
+        raise ConnectionError("api went away")
+
+    conn = database.connect()
+    with pytest.raises(ConnectionError):
+        load_run(conn, batches(), commit_each=True)
+    conn.close()
+
+    assert database.count("recording_event") == 2
@@ -0,0 +1,131 @@
+"""Script that tests the functions in resilience.py"""
+
+from resilience import CircuitBreaker, FetchStats, backoff_delay, load_breaker, save_breaker
+
+
+class FakeClock:
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_backoff_delay_bounds():
+    """Tests that the jittered delay never exceeds the exponential step or the cap"""
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=0.5, cap=3)
+        assert 0 <= delay <= min(3, 0.5 * 2 ** attempt)
+
+
+def test_breaker_opens_after_threshold():
+    """Tests that a plant is blocked once it has failed threshold times in a row"""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, clock=FakeClock())
+    breaker.record_failure(1)
+    assert breaker.allow(1)
+    breaker.record_failure(1)
+    assert not breaker.allow(1)
+    assert breaker.allow(2)
+
+
+def test_breaker_success_resets_failures():
+    """Tests that a success between failures stops the breaker opening"""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, clock=FakeClock())
+    breaker.record_failure(1)
+    breaker.record_success(1)
+    breaker.record_failure(1)
+    assert breaker.allow(1)
+
+
+def test_breaker_half_open_after_cooldown():
+    """Tests that one trial call is allowed after the cooldown and a failure re-opens it"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60, clock=clock)
+    for _ in range(3):
+        breaker.record_failure(1)
+    assert not breaker.allow(1)
+
+    clock.now = 60
+    assert breaker.allow(1)
+    breaker.record_failure(1)
+    assert not breaker.allow(1)
+
+
+def test_breaker_half_open_call_is_a_trial():
+    """Tests that only the call let through after the cooldown is marked as a trial"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, clock=clock)
+    breaker.record_failure(1)
+    assert breaker.allow(1) and not breaker.is_trial(1)
+    breaker.record_failure(1)
+
+    clock.now = 60
+    assert breaker.allow(1) and breaker.is_trial(1)
+    breaker.record_success(1)
+    assert not breaker.is_trial(1)
+
+
+def test_fetch_stats_merge():
+    """Tests that merging adds another process's latencies and failures to the stats"""
+    stats, worker = FetchStats(), FetchStats()
+    stats.record(1, 0.1, False)
+    worker.record(1, 0.2, True)
+    worker.record(2, 0.3, False)
+
+    stats.merge(worker)
+    assert stats.latencies == {1: [0.1, 0.2], 2: [0.3]}
+    assert stats.failures == {1: 1, 2: 1}
+
+
+def test_fetch_stats_summary():
+    """Tests that the summary counts requests and orders plants by mean latency"""
+    stats = FetchStats()
+    stats.record(1, 0.1, True)
+    stats.record(2, 0.5, False)
+    stats.record(2, 0.3, True)
+
+    summary = stats.summary()
+    assert summary["requests"] == 3
+    assert summary["failed_requests"] == 1
+    assert summary["slowest_plants"][0][0] == 2
+    assert summary["failures"] == {2: 1}
+
+
+def test_breaker_state_round_trip(tmp_path):
+    """Tests that an open circuit is still open when loaded into a new breaker"""
+    clock = FakeClock()
+    state_path = str(tmp_path / "breaker.json")
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, clock=clock)
+    breaker.record_failure(1)
+    breaker.record_failure(1)
+    breaker.record_failure(2)
+    save_breaker(breaker, state_path)
+
+    loaded = CircuitBreaker(failure_threshold=2, cooldown=60, clock=clock)
+    load_breaker(loaded, state_path)
+    assert not loaded.allow(1)
+    assert loaded.failures == {1: 2, 2: 1}
+
+
+def test_breaker_restore_only_given_plants():
+    """Tests that a worker's snapshot only replaces the plants it fetched"""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, clock=FakeClock())
+    breaker.record_failure(1)
+    breaker.record_failure(2)
+
+    worker = CircuitBreaker(failure_threshold=2, cooldown=60, clock=FakeClock())
+    worker.record_failure(2)
+    worker.record_failure(2)
+    breaker.restore(worker.snapshot([2, 3]), [2, 3])
+
+    assert breaker.failures == {1: 1, 2: 2}
+    assert 2 in breaker.opened_at
+
+
+def test_load_breaker_missing_file(tmp_path):
+    """Tests that a missing state file leaves the breaker empty"""
+    breaker = CircuitBreaker()
+    load_breaker(breaker, str(tmp_path / "missing.json"))
+    assert breaker.failures == {}
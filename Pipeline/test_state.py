@@ -0,0 +1,25 @@
+"""Script that tests the functions in state.py"""
+
+import pytest
+
+from state import read_text, state_file, write_text
+
+
+def test_state_file_joins_path():
+    """Tests that state files go under the state path, local or on S3"""
+    assert state_file("ids.json", "state") == "state/ids.json"
+    assert state_file("ids.json", "s3://bucket/state/") == "s3://bucket/state/ids.json"
+
+
+def test_write_text_creates_directory(tmp_path):
+    """Tests that a state file can be written to a new directory and read back"""
+    file_path = state_file("ids.json", str(tmp_path / "state"))
+    write_text(file_path, '{"max_plant_id": 49}')
+    assert read_text(file_path) == '{"max_plant_id": 49}'
+
+
+def test_read_text_missing_file(tmp_path):
+    """Tests that a missing state file raises OSError"""
+    with pytest.raises(OSError):
+        read_text(str(tmp_path / "missing.json"))
+
@@ -3,7 +3,7 @@
 
 from datetime import datetime
 import pandas as pd
-from transform import make_dataframe, make_plant_dataframe, get_botanist, get_image, get_last_watered, get_location, get_recording_taken, get_scientific_name, transform_main, clean_data
+from transform import make_dataframe, make_plant_dataframe, get_botanist, get_image, get_last_watered, get_location, get_recording_taken, get_scientific_name, transform_main, clean_data, validate_data, write_rejects
 
 TEST_DICT = {'botanist': {'email': 'eliza.andrews@lnhm.co.uk', 'name': 'Eliza Andrews',
                           'phone': '(846)669-6651x75948'},
@@ -87,7 +87,7 @@ def test_make_dataframe():
 
 def test_transform_main():
     """Tests that a dataframe with the correct column names is made using transform_main()."""
-    df = transform_main([[TEST_DICT]])
+    df = transform_main([[TEST_DICT]], rejects_path=None)
     assert isinstance(df, pd.DataFrame)
     assert list(df.columns) == COLUMNS
 
@@ -125,3 +125,96 @@ def test_make_plant_dataframe():
     assert isinstance(df, pd.DataFrame)
     assert len(df.index) == 1
     assert list(df.columns) == COLUMNS
+
+
+def test_make_plant_dataframe_matches_helpers():
+    """Tests the batch columns hold the same values as the single plant helper functions."""
+    df = make_plant_dataframe([TEST_DICT, {"error": "plant not found", "plant_id": 7}])
+    assert len(df.index) == 1
+    row = df.iloc[0]
+    assert (row['botanist_first_name'], row['botanist_last_name'],
+            row['email'], row['phone_number']) == get_botanist(TEST_DICT)
+    assert (row['longitude'], row['latitude'], row['town'], row['country'],
+            row['country_abbreviation'], row['continent']) == get_location(TEST_DICT)
+    assert row['last_watered'] == get_last_watered(TEST_DICT)
+    assert row['recording_taken'] == get_recording_taken(TEST_DICT)
+    assert row['image_url'] == get_image(TEST_DICT)
+    assert row['scientific_name'] == get_scientific_name(TEST_DICT)
+
+
+def test_make_plant_dataframe_missing_optional_fields():
+    """Tests that plants without images or a scientific name get None for those columns."""
+    plant = {key: value for key, value in TEST_DICT.items()
+             if key not in ('images', 'scientific_name')}
+    df = make_plant_dataframe([plant])
+    assert df['image_url'][0] is None
+    assert df['scientific_name'][0] is None
+
+
+def test_make_plant_dataframe_missing_botanist():
+    """Tests that a plant with missing botanist details is skipped."""
+    plant = dict(TEST_DICT, botanist={'name': 'Eliza Andrews'})
+    df = make_plant_dataframe([plant, TEST_DICT])
+    assert len(df.index) == 1
+
+
+def test_transform_main_segments_match_in_process_and_pool():
+    """Tests that the pool and in-process paths build the same dataframe."""
+    plant_data = [[TEST_DICT, TEST_DICT], [{"error": "plant not found"}], [TEST_DICT]]
+    in_process = transform_main(plant_data, rejects_path=None)
+    pooled = transform_main(plant_data, processes=2, in_process_threshold=0, rejects_path=None)
+    assert len(in_process.index) == 3
+    assert list(in_process.index) == [0, 1, 2]
+    pd.testing.assert_frame_equal(in_process, pooled)
+
+
+def test_transform_main_no_plants():
+    """Tests that a run with only errors still gives a dataframe with the right columns."""
+    df = transform_main([[{"error": "plant not found"}]], rejects_path=None)
+    assert df.empty
+    assert list(df.columns) == COLUMNS
+
+
+def test_validate_data_reject_reasons():
+    """Tests that rejected rows are tagged with every rule they broke."""
+    rows = [BAD_TEMP_PLANT_LIST[0], BAD_MOISTURE_PLANT_LIST[0], TEST_PLANT_LIST[1]]
+    rows.append(BAD_TEMP_PLANT_LIST[0][:5] + [-10, 50] + BAD_TEMP_PLANT_LIST[0][7:])
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    valid, rejected = validate_data(df)
+    assert list(valid.index) == [2]
+    assert list(rejected['reject_reason']) == ['temperature not in (0, 30)',
+                                               'soil_moisture not in (0, 100)',
+                                               'temperature not in (0, 30); soil_moisture not in (0, 100)']
+
+
+def test_validate_data_custom_rules():
+    """Tests that the bounds can be changed."""
+    df = pd.DataFrame(TEST_PLANT_LIST, columns=COLUMNS)
+    valid, rejected = validate_data(df, {"temperature": (20, 30)})
+    assert len(valid.index) == 1
+    assert len(rejected.index) == 1
+
+
+def test_write_rejects_one_file_per_run(tmp_path):
+    """Tests that each run writes its own file with a header under the day it ran"""
+    _, rejected = validate_data(pd.DataFrame(BAD_TEMP_PLANT_LIST, columns=COLUMNS))
+    write_rejects(rejected, str(tmp_path), run_id="first")
+    write_rejects(rejected, str(tmp_path), run_id="second")
+
+    files = sorted(tmp_path.glob("*/*.csv"))
+    assert [file.name for file in files] == ["first.csv", "second.csv"]
+    assert files[0].parent.name == datetime.now().strftime("%Y-%m-%d")
+    saved = pd.read_csv(files[0])
+    assert len(saved.index) == 1
+    assert 'reject_reason' in saved.columns
+    assert 'rejected_at' in saved.columns
+
+
+def test_transform_main_writes_rejects(tmp_path):
+    """Tests that readings out of range are left out and written to the rejects file."""
+    hot_plant = dict(TEST_DICT, temperature=45.0)
+    df = transform_main([[TEST_DICT, hot_plant]], rejects_path=str(tmp_path / "rejects"))
+    assert len(df.index) == 1
+    [rejects_file] = (tmp_path / "rejects").glob("*/*.csv")
+    saved = pd.read_csv(rejects_file)
+    assert list(saved['reject_reason']) == ['temperature not in (0, 30)']
@@ -3,86 +3,156 @@
 from datetime import datetime
 import logging
 from multiprocessing import Pool
+from os import environ
+import time
+from uuid import uuid4
+
 import pandas as pd
-from extract import extract_main
+
+from state import state_file, write_text
 
 COLUMNS = ['plant_id', 'name', 'scientific_name', 'last_watered', 'recording_taken',
            'soil_moisture', 'temperature', 'email', 'botanist_first_name',
            'botanist_last_name', 'phone_number', 'image_url', 'longitude',
            'latitude', 'town', 'country', 'country_abbreviation', 'continent']
 
+RAW_COLUMNS = ['plant_id', 'name', 'scientific_name', 'last_watered', 'recording_taken',
+               'soil_moisture', 'temperature', 'origin_location', 'botanist.name',
+               'botanist.email', 'botanist.phone', 'images.original_url']
+
+NESTED_COLUMNS = ['scientific_name', 'origin_location', 'botanist.name']
+
+# rows missing any of these are skipped
+REQUIRED_COLUMNS = ['last_watered', 'recording_taken', 'email', 'botanist_first_name',
+                    'botanist_last_name', 'phone_number', 'longitude', 'latitude', 'town',
+                    'country', 'country_abbreviation', 'continent']
+
+RECORDING_TAKEN_FORMAT = '%Y-%m-%d %H:%M:%S'
+LAST_WATERED_FORMAT = '%a, %d %b %Y %H:%M:%S %Z'
+
+# below this many plants the whole batch is transformed in this process
+IN_PROCESS_THRESHOLD = 5000
+
 MIN_TEMP = 0
 MAX_TEMP = 30
 MIN_MOISTURE = 0
 MAX_MOISTURE = 100
 
+VALIDATION_RULES = {
+    "temperature": (MIN_TEMP, MAX_TEMP),
+    "soil_moisture": (MIN_MOISTURE, MAX_MOISTURE),
+}
+
+# kept under STATE_PATH so the rejects outlive a one-shot task's disk, one file per write in
+# a folder for each day, so a run never has to read or rewrite the ones before it
+REJECTS_PATH = environ.get("REJECTS_PATH", state_file("rejects"))
+
 
-def make_plant_dataframe(plant_data: list[dict]) -> list[list[str]]:
-    """Gets plant data and collates it into a dataframe"""
+def make_plant_dataframe(plant_data: list[dict]) -> pd.DataFrame:
+    """Gets plant data and collates it into a dataframe, one column at a time"""
 
     if not isinstance(plant_data, list):
         raise TypeError('Plant data must be a list of dictionaries')
 
-    data = []
+    plants = [plant for plant in plant_data
+              if isinstance(plant, dict) and not plant.get("error")]
+    if not plants:
+        return make_dataframe([])
+
+    raw = pd.json_normalize(plants, max_level=1).reindex(columns=RAW_COLUMNS)
+    # columns missing from every record come back as float NaN, which .str rejects
+    raw[NESTED_COLUMNS] = raw[NESTED_COLUMNS].astype(object)
+
+    # gets botanist details
+    botanist_names = raw["botanist.name"].str.split()
+
+    # gets location details, the timezone is stored as continent/country
+    location = raw["origin_location"]
+    timezone = location.str[4].str.split("/")
+
+    df = pd.DataFrame({
+        "plant_id": raw["plant_id"],
+        "name": raw["name"],
+        "scientific_name": raw["scientific_name"].str[0],
+        "last_watered": pd.to_datetime(raw["last_watered"], format=LAST_WATERED_FORMAT,
+                                       errors="coerce", utc=True).dt.tz_localize(None),
+        "recording_taken": pd.to_datetime(raw["recording_taken"], format=RECORDING_TAKEN_FORMAT,
+                                          errors="coerce"),
+        "soil_moisture": raw["soil_moisture"],
+        "temperature": raw["temperature"],
+        "email": raw["botanist.email"],
+        "botanist_first_name": botanist_names.str[0],
+        "botanist_last_name": botanist_names.str[1],
+        "phone_number": raw["botanist.phone"],
+        "image_url": raw["images.original_url"],
+        "longitude": location.str[0],
+        "latitude": location.str[1],
+        "town": location.str[2],
+        "country": timezone.str[1],
+        "country_abbreviation": location.str[3],
+        "continent": timezone.str[0],
+    }, columns=COLUMNS)
+
+    df = df.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+
+    # optional text columns use None rather than NaN so they load as NULL
+    for column in ("scientific_name", "image_url"):
+        df[column] = df[column].astype(object).where(df[column].notna(), None)
 
-    for plant in plant_data:
-        if plant.get("error"):
-            continue
+    return df
 
-        # gets botanist details
-        first_name, last_name, email, phone_number = get_botanist(plant)
 
-        image_url = get_image(plant)
+def validate_data(df: pd.DataFrame, rules: dict[str, tuple[float, float]] | None = None
+                  ) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Splits the dataframe into valid rows and rejected rows, using one mask built from
+    every (exclusive) range rule. Rejected rows get a reject_reason naming the rules they broke."""
+    rules = VALIDATION_RULES if rules is None else rules
 
-        # gets location details
-        longitude, latitude, town, country, country_abbreviation, continent = get_location(
-            plant)
+    # missing or non-numeric values fail their rule too
+    failures = pd.DataFrame({
+        f"{column} not in ({minimum}, {maximum})":
+            ~pd.to_numeric(df[column], errors="coerce").between(minimum, maximum, inclusive="neither")
+        for column, (minimum, maximum) in rules.items()
+    }, index=df.index)
+    rejected_mask = failures.any(axis=1)
 
-        if None in (first_name, last_name, email, phone_number, longitude, latitude, town, country, country_abbreviation, continent):
-            continue
+    rejected = df[rejected_mask].copy()
+    rejected["reject_reason"] = failures[rejected_mask].dot(
+        failures.columns + "; ").str.rstrip("; ")
 
-        scientific_name = get_scientific_name(plant)
+    return df[~rejected_mask], rejected
 
-        last_watered = get_last_watered(plant)
-        recording_taken = get_recording_taken(plant)
 
-        data.append([plant.get("plant_id"), plant.get(
-            "name"), scientific_name, last_watered, recording_taken, plant.get("soil_moisture"),
-            plant.get("temperature"), email, first_name, last_name, phone_number,
-            image_url, longitude, latitude, town, country, country_abbreviation, continent])
+def write_rejects(rejected: pd.DataFrame, rejects_path: str = REJECTS_PATH,
+                  run_id: str | None = None) -> None:
+    """Writes rejected rows to their own quarantine csv at rejects/<date>/<run_id>.csv, stamped
+    with when they were rejected"""
+    if rejected.empty:
+        return
 
-    return make_dataframe(data)
+    now = datetime.now()
+    file_path = f"{rejects_path.rstrip('/')}/{now:%Y-%m-%d}/{run_id or uuid4()}.csv"
+    try:
+        write_text(file_path, rejected.assign(rejected_at=now).to_csv(index=False))
+    except OSError as e:
+        logging.warning("Could not write rejected rows: %r", e)
 
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_data(df: pd.DataFrame, rules: dict[str, tuple[float, float]] | None = None) -> pd.DataFrame:
     """Cleans invalid data from the dataframe"""
-    # Removes extreme temperature values from the dataframe
-    remove_bad_temp = (pd.to_numeric(df.temperature) <= MIN_TEMP) | (
-        pd.to_numeric(df.temperature) >= MAX_TEMP)
-
-    df = df.drop(df[remove_bad_temp].index)
-
-    # Removes invalid soil_moisture values from the dataframe
-    remove_bad_moisture = (pd.to_numeric(df.soil_moisture) <= MIN_MOISTURE) | (
-        pd.to_numeric(df.soil_moisture) >= MAX_MOISTURE)
-
-    df = df.drop(df[remove_bad_moisture].index)
-
-    return df
+    return validate_data(df, rules)[0]
 
 
 def get_recording_taken(response: dict) -> datetime:
     """Converts recording_taken time to a datetime object"""
     recording_taken = response.get("recording_taken")
-    return datetime.strptime(recording_taken,
-                             '%Y-%m-%d %H:%M:%S')
+    return datetime.strptime(recording_taken, RECORDING_TAKEN_FORMAT)
 
 
 def get_last_watered(response: dict) -> datetime:
     """Converts last_watered time to a datetime object"""
     last_watered = response.get("last_watered")
-    return datetime.strptime(last_watered,
-                             '%a, %d %b %Y %H:%M:%S %Z')
+    return datetime.strptime(last_watered, LAST_WATERED_FORMAT)
 
 
 def get_image(response: dict) -> str | None:
@@ -126,23 +196,46 @@ def make_dataframe(plants: list[list]) -> pd.DataFrame:
     return pd.DataFrame(plants, columns=COLUMNS)
 
 
-def transform_main(plant_data: list[list[dict]]) -> pd.DataFrame:
-    """Takes data segments and parallel processes them to create a single dataframe."""
-    with Pool(processes=4) as pool:
-        logging.info("Transforming started.")
-        data_segments = pool.map(make_plant_dataframe, plant_data)
-        df = pd.DataFrame(columns=COLUMNS)
-
-        logging.info("Cleaning Started")
-        clean_data_segments = pool.map(clean_data, data_segments)
-        for dataframe_segment in clean_data_segments:
-            df = df._append(dataframe_segment, ignore_index=True)
+def transform_main(plant_data: list[list[dict]], processes: int = 4,
+                   in_process_threshold: int = IN_PROCESS_THRESHOLD,
+                   rejects_path: str | None = REJECTS_PATH) -> pd.DataFrame:
+    """Takes data segments and builds a single clean dataframe, only using a process pool
+    when there are enough plants to make the process start up worth it."""
+    started = time.perf_counter()
+    plant_count = sum(len(segment) for segment in plant_data)
+
+    logging.info("Transforming started.")
+    if plant_count < in_process_threshold or len(plant_data) < 2:
+        data_segments = [make_plant_dataframe(
+            [plant for segment in plant_data for plant in segment])]
+    else:
+        with Pool(processes=min(processes, len(plant_data))) as pool:
+            data_segments = pool.map(make_plant_dataframe, plant_data)
+    transformed = time.perf_counter()
+
+    data_segments = [segment for segment in data_segments if not segment.empty]
+    df = pd.concat(data_segments, ignore_index=True) if data_segments else make_dataframe([])
+    concatenated = time.perf_counter()
+
+    logging.info("Cleaning Started")
+    df, rejected = validate_data(df)
+    df = df.reset_index(drop=True)
+    logging.info("%s of %s rows rejected.", len(rejected.index),
+                 len(df.index) + len(rejected.index))
+    if rejects_path:
+        write_rejects(rejected, rejects_path)
+    cleaned = time.perf_counter()
 
     logging.info("Dataframe created and cleaned.")
+    logging.info("Transform timings for %s plants: transform %.3fs, concat %.3fs, clean %.3fs",
+                 plant_count, transformed - started, concatenated - transformed,
+                 cleaned - concatenated)
     return df
 
 
 if __name__ == "__main__":
+    from extract import extract_main
+
     plant_data = extract_main()
     dataframe = transform_main(plant_data)
     print(dataframe)
@@ -0,0 +1,95 @@
+"""Stand-in for data-eng-plants-api that serves a configurable number of plants locally.
+
+Plant ids from 0 to plants - 1 exist and every other id gets the api's 404 error body. Each
+response can be delayed and a share of them fail with a 500 so retries and the circuit breaker
+are exercised as they would be against the real api.
+"""
+import asyncio
+from datetime import datetime
+import random
+import threading
+
+from aiohttp import web
+
+BOTANISTS = [
+    {"email": "carl.linnaeus@lnhm.co.uk", "name": "Carl Linnaeus", "phone": "(146)994-1635x35992"},
+    {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "001-481-273-3691x127"},
+    {"email": "eliza.andrews@lnhm.co.uk", "name": "Eliza Andrews", "phone": "(846)669-6651x75948"},
+]
+LOCATIONS = [
+    ["-19.32556", "-41.25528", "Resplendor", "BR", "America/Sao_Paulo"],
+    ["33.95015", "-118.03917", "South Whittier", "US", "America/Los_Angeles"],
+    ["17.94979", "-94.91386", "Acayucan", "MX", "America/Mexico_City"],
+    ["51.50853", "-0.12574", "London", "GB", "Europe/London"],
+    ["13.70167", "-89.10944", "Ilopango", "SV", "America/El_Salvador"],
+]
+
+
+def make_plant(plant_id: int, recording_taken: datetime, rng: random.Random) -> dict:
+    """Makes a plant response shaped like the real api's"""
+    return {
+        "plant_id": plant_id,
+        "name": f"Plant {plant_id}",
+        "scientific_name": [f"Plantae specimen {plant_id}"],
+        "botanist": BOTANISTS[plant_id % len(BOTANISTS)],
+        "origin_location": LOCATIONS[plant_id % len(LOCATIONS)],
+        "images": {"original_url": f"https://example.com/plants/{plant_id}.jpg"},
+        "last_watered": "Wed, 20 Dec 2023 14:02:15 GMT",
+        "recording_taken": recording_taken.strftime("%Y-%m-%d %H:%M:%S"),
+        "soil_moisture": rng.uniform(20, 60),
+        "temperature": rng.uniform(10, 25),
+    }
+
+
+class FakePlantsAPI:
+    """Serves the fake api from a background thread while it is used as a context manager"""
+
+    def __init__(self, plants: int, latency: float = 0.02, error_rate: float = 0.0,
+                 seed: int = 0):
+        self.plants = plants
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.recording_taken = datetime.now()
+        self.requests = 0
+        self.url = None
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    async def get_plant(self, request: web.Request) -> web.Response:
+        """Serves one plant, an injected 500 or the api's not found error"""
+        self.requests += 1
+        plant_id = int(request.match_info["plant_id"])
+        await asyncio.sleep(self.latency)
+
+        if self.rng.random() < self.error_rate:
+            return web.json_response({"error": "server error"}, status=500)
+        if not 0 <= plant_id < self.plants:
+            return web.json_response({"error": "plant not found", "plant_id": plant_id},
+                                     status=404)
+        return web.json_response(make_plant(plant_id, self.recording_taken, self.rng))
+
+    async def start_server(self) -> None:
+        """Starts the server on a free local port"""
+        app = web.Application()
+        app.router.add_get("/plants/{plant_id}", self.get_plant)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/plants/"
+
+    def __enter__(self) -> "FakePlantsAPI":
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start_server(), self.loop).result()
+        return self
+
+    def __exit__(self, *args) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
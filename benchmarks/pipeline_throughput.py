@@ -0,0 +1,117 @@
+"""Times extract_main, transform_main and load_main end to end without the network or a database.
+
+The plants api is replaced by the local fake in `fake_plants_api.py` and the database by the
+SQLite stand-in in `sqlite_database.py`, with the stub pyodbc in `stubs/` so the loaders import
+without an ODBC driver. The pipeline code itself runs unchanged: only extract's URL, load's
+get_connection and the dimension key cache are pointed at the stand-ins. Results are appended
+to a JSON lines file tagged with the current git commit so runs can be compared.
+
+By default the plant id cache is seeded as it would be between daemon runs, use --cold to
+include discovering the plant ids from scratch.
+
+Usage: python benchmarks/pipeline_throughput.py [--plants 50 1000 10000] [--latency 0.02]
+       [--error-rate 0.01] [--cold] [--sync] [--output benchmarks/results/pipeline.jsonl]
+"""
+import argparse
+import logging
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+import time
+
+BENCHMARKS = Path(__file__).resolve().parent
+ROOT = BENCHMARKS.parent
+sys.path[:0] = [str(BENCHMARKS / "stubs"), str(ROOT / "Pipeline")]
+
+# pylint: disable=wrong-import-position
+import extract
+import key_cache
+import load
+from resilience import BREAKER, STATS
+from transform import transform_main
+
+from fake_plants_api import FakePlantsAPI
+from sqlite_database import SQLiteDatabase
+from startup import save_results
+
+RESULTS_PATH = BENCHMARKS / "results" / "pipeline.jsonl"
+PLANT_COUNTS = [50, 1000, 10000]
+
+
+def reset_pipeline_state(database: SQLiteDatabase) -> None:
+    """Clears the state the pipeline keeps between runs and points it at the database"""
+    BREAKER.failures.clear()
+    BREAKER.opened_at.clear()
+    STATS.reset()
+    key_cache.KEY_CACHE = key_cache.DimensionKeyCache(None, str(database.directory))
+    load.get_connection = database.connect
+
+
+def run_pipeline(plants: int, latency: float, error_rate: float, cold: bool,
+                 use_async: bool) -> dict:
+    """Runs the whole pipeline once against the stand-ins and returns the stage timings"""
+    with TemporaryDirectory() as directory, FakePlantsAPI(plants, latency, error_rate) as api:
+        database = SQLiteDatabase(Path(directory) / "database")
+        reset_pipeline_state(database)
+        extract.URL = api.url
+
+        plant_id_cache = str(Path(directory) / "plant_ids.json")
+        if not cold:
+            extract.save_plant_id_cache(plants - 1, plant_id_cache)
+
+        started = time.perf_counter()
+        plant_data = extract.extract_main(use_async=use_async, cache_path=plant_id_cache,
+                                          breaker_path=None)
+        extracted = time.perf_counter()
+        df = transform_main(plant_data, rejects_path=None)
+        transformed = time.perf_counter()
+        load.load_main(df)
+        loaded = time.perf_counter()
+
+        stats = STATS.summary()
+        return {
+            "extract_s": round(extracted - started, 3),
+            "transform_s": round(transformed - extracted, 3),
+            "load_s": round(loaded - transformed, 3),
+            "total_s": round(loaded - started, 3),
+            "plants_per_s": round(plants / (loaded - started), 1),
+            "api_requests": api.requests,
+            "failed_requests": stats["failed_requests"],
+            "rows_transformed": len(df.index),
+            "rows_loaded": database.count("recording_event"),
+        }
+
+
+def run_benchmark(plant_counts: list[int], latency: float, error_rate: float, cold: bool,
+                  use_async: bool) -> dict:
+    """Runs the pipeline at each plant count"""
+    results = {}
+    for plants in plant_counts:
+        results[str(plants)] = run_pipeline(plants, latency, error_rate, cold, use_async)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the pipeline against local stand-ins.")
+    parser.add_argument("--plants", type=int, nargs="+", default=PLANT_COUNTS)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds the fake api waits before each response")
+    parser.add_argument("--error-rate", type=float, default=0.01,
+                        help="share of fake api responses that are a 500")
+    parser.add_argument("--cold", action="store_true",
+                        help="discover the plant ids from scratch")
+    parser.add_argument("--sync", action="store_true",
+                        help="extract with the multiprocessing pool instead of asyncio")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = run_benchmark(args.plants, args.latency, args.error_rate, args.cold,
+                            not args.sync)
+    record = save_results(results, args.output, {
+        "latency": args.latency, "error_rate": args.error_rate,
+        "cold": args.cold, "async": not args.sync})
+    for plants, timing in record["results"].items():
+        print(f"{plants} plants: extract {timing['extract_s']}s, "
+              f"transform {timing['transform_s']}s, load {timing['load_s']}s, "
+              f"{timing['rows_loaded']} rows loaded, {timing['failed_requests']} failed requests")
@@ -0,0 +1,63 @@
+"""A connection that records the statements it is given instead of running them, for the tests
+that check what is sent to the database and when it is committed"""
+import pyodbc
+
+
+class RecordingCursor:
+    """A cursor that records its statements on its connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        """Records the statement"""
+        self.conn.record(query, params)
+
+    def executemany(self, query, params):
+        """Records the statement with its batch of parameters"""
+        self.conn.record(query, params)
+
+    def fetchall(self) -> list:
+        """Returns the connection's rows"""
+        return list(self.conn.rows)
+
+    def close(self):
+        """Nothing to close"""
+
+
+class RecordingConnection:
+    """A connection that records every statement, and which of them were committed. Statement
+    number fail_on, or any statement containing fail_query, raises pyodbc.Error instead."""
+
+    def __init__(self, fail_on: int | None = None, fail_query: str | None = None,
+                 rows: list[tuple] | None = None):
+        self.fail_on = fail_on
+        self.fail_query = fail_query
+        self.rows = rows or []
+        self.executed = []
+        self.pending = []
+        self.committed = []
+        self.commits = 0
+        self.rolled_back = False
+
+    def record(self, query, params) -> None:
+        """Records a statement, failing it if it matches fail_on or fail_query"""
+        if len(self.executed) == self.fail_on or (self.fail_query and self.fail_query in query):
+            raise pyodbc.Error("statement failed")
+        self.executed.append((query, params))
+        self.pending.append((query, params))
+
+    def cursor(self) -> RecordingCursor:
+        """Gets a recording cursor"""
+        return RecordingCursor(self)
+
+    def commit(self):
+        """Commits the recorded statements"""
+        self.committed += self.pending
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        """Forgets the statements since the last commit"""
+        self.pending = []
+        self.rolled_back = True
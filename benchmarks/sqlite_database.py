@@ -0,0 +1,67 @@
+"""Stand-in for the plants database that the loaders can run against unchanged.
+
+The tables live in a SQLite file attached as s_alpha, so the loaders' s_alpha.table names and
+`?` parameters work as they do over pyodbc. Each connect() opens a new connection to the same
+files, like pyodbc.connect does for the real database.
+"""
+from pathlib import Path
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS s_alpha.origin_location (
+    origin_location_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    longitude FLOAT NOT NULL, latitude FLOAT NOT NULL, town TEXT NOT NULL, country TEXT NOT NULL,
+    country_abbreviation TEXT NOT NULL, continent TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS s_alpha.ux_origin_location_coordinates
+    ON origin_location (longitude, latitude);
+
+CREATE TABLE IF NOT EXISTS s_alpha.plant (
+    plant_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL, scientific_name TEXT, origin_location_id INT NOT NULL, image_url TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS s_alpha.ux_plant_name ON plant (name);
+
+CREATE TABLE IF NOT EXISTS s_alpha.botanist (
+    botanist_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT NOT NULL, last_name TEXT NOT NULL, email TEXT NOT NULL,
+    phone_number TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS s_alpha.ux_botanist_name ON botanist (first_name, last_name);
+
+CREATE TABLE IF NOT EXISTS s_alpha.recording_event (
+    recording_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plant_id INT NOT NULL, botanist_id INT NOT NULL, soil_moisture FLOAT NOT NULL,
+    temperature FLOAT NOT NULL, recording_taken TIMESTAMP NOT NULL,
+    last_watered TIMESTAMP NOT NULL, run_id TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS s_alpha.ix_recording_event_plant_taken
+    ON recording_event (plant_id, recording_taken);
+
+CREATE TABLE IF NOT EXISTS s_alpha.recording_event_stage (
+    run_id TEXT NOT NULL, plant_id INT NOT NULL, botanist_id INT NOT NULL,
+    soil_moisture FLOAT NOT NULL, temperature FLOAT NOT NULL,
+    recording_taken TIMESTAMP NOT NULL, last_watered TIMESTAMP NOT NULL);
+CREATE INDEX IF NOT EXISTS s_alpha.ix_recording_event_stage_run
+    ON recording_event_stage (run_id);
+"""
+
+
+class SQLiteDatabase:
+    """A database in a directory, created with the tables the loaders use"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        conn = self.connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens a new connection with the s_alpha schema attached"""
+        conn = sqlite3.connect(self.directory / "main.db")
+        conn.execute("ATTACH DATABASE ? AS s_alpha", (str(self.directory / "s_alpha.db"),))
+        return conn
+
+    def count(self, table: str) -> int:
+        """Gets how many rows a table holds"""
+        conn = self.connect()
+        rows = conn.execute(f"SELECT COUNT(*) FROM s_alpha.{table};").fetchone()[0]
+        conn.close()
+        return rows
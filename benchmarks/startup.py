@@ -0,0 +1,104 @@
+"""Measures how long the pipeline and lambda entry points take to import and cold start.
+
+Each measurement runs in a fresh interpreter with the stub pyodbc, pymssql and boto3 modules in
+`stubs/` ahead of the real ones, so no database or AWS account is needed. The medians are
+appended to a JSON lines file tagged with the current git commit so runs can be compared.
+
+Usage: python benchmarks/startup.py [--repeats 10] [--output benchmarks/results/startup.jsonl]
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARKS = Path(__file__).resolve().parent
+ROOT = BENCHMARKS.parent
+STUBS = BENCHMARKS / "stubs"
+RESULTS_PATH = BENCHMARKS / "results" / "startup.jsonl"
+
+# name: (directory the entry point lives in, code that is timed)
+CASES = {
+    "pipeline_import": (ROOT / "Pipeline", "import pipeline"),
+    "check_vitals_import": (ROOT / "lambda", "import check_vitals"),
+    "check_vitals_handler": (ROOT / "lambda", "import check_vitals; check_vitals.handler()"),
+}
+
+TIMED_CODE = """import time
+started = time.perf_counter()
+{code}
+print(time.perf_counter() - started)
+"""
+
+STUB_ENVIRONMENT = {
+    "DB_HOST": "localhost", "DB_PORT": "1433", "DB_USER": "stub", "DB_PASSWORD": "stub",
+    "DB_NAME": "plants", "ACCESS_KEY_ID": "stub", "SECRET_ACCESS_KEY": "stub",
+}
+
+
+def time_case(directory: Path, code: str) -> tuple[float, float]:
+    """Runs the code in a new interpreter, returning the time the code took and the time
+    the whole process took, both in seconds"""
+    environment = {**os.environ, **STUB_ENVIRONMENT,
+                   "PYTHONPATH": os.pathsep.join([str(STUBS), str(directory)])}
+
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", TIMED_CODE.format(code=code)],
+                            cwd=directory, env=environment, capture_output=True,
+                            text=True, check=True)
+    process_time = time.perf_counter() - started
+
+    return float(result.stdout.strip().splitlines()[-1]), process_time
+
+
+def get_commit() -> str | None:
+    """Gets the current git commit, if there is one"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(repeats: int) -> dict:
+    """Times every case repeats times and returns the medians in milliseconds"""
+    results = {}
+    for name, (directory, code) in CASES.items():
+        timings = [time_case(directory, code) for _ in range(repeats)]
+        results[name] = {
+            "code_ms": round(statistics.median(code for code, _ in timings) * 1000, 1),
+            "process_ms": round(statistics.median(process for _, process in timings) * 1000, 1),
+        }
+    return results
+
+
+def save_results(results: dict, output: Path, settings: dict | None = None) -> dict:
+    """Appends the results to the output file along with the commit, python version and
+    any settings the benchmark was run with"""
+    record = {
+        "commit": get_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if settings:
+        record["settings"] = settings
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "a", encoding="utf-8") as output_file:
+        output_file.write(json.dumps(record) + "\n")
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times pipeline and lambda start up.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    record = save_results(run_benchmark(args.repeats), args.output)
+    for name, timing in record["results"].items():
+        print(f"{name}: {timing['code_ms']}ms in code, {timing['process_ms']}ms process")
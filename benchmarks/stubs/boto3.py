@@ -0,0 +1,22 @@
+"""Stand-in for boto3 whose SES client records emails instead of sending them."""
+
+
+class StubSESClient:
+    """Records every email it is asked to send, fail_first makes the first send raise instead"""
+
+    def __init__(self, fail_first: bool = False):
+        self.sent = []
+        self.fail_first = fail_first
+
+    def send_email(self, **kwargs) -> dict:
+        """Records the email, raising instead the first time if fail_first is set"""
+        if self.fail_first:
+            self.fail_first = False
+            raise ConnectionError("SES is unavailable")
+        self.sent.append(kwargs)
+        return {"MessageId": f"stub-{len(self.sent)}"}
+
+
+def client(*args, **kwargs) -> StubSESClient:
+    """Gets a stub SES client"""
+    return StubSESClient()
@@ -0,0 +1,47 @@
+"""Stand-in for pymssql that returns an empty result for every query."""
+
+
+class StubCursor:
+    """A cursor whose queries return no rows"""
+    description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        """Ignores the query"""
+
+    def fetchall(self) -> list:
+        """Returns no rows"""
+        return []
+
+    def close(self):
+        """Nothing to close"""
+
+
+class StubConnection:
+    """A connection that hands out stub cursors and counts commits and closes"""
+
+    def __init__(self):
+        self.commits = 0
+        self.closed = False
+
+    def cursor(self, as_dict: bool = True) -> StubCursor:
+        """Gets a stub cursor"""
+        return StubCursor()
+
+    def commit(self):
+        """Counts the commit"""
+        self.commits += 1
+
+    def close(self):
+        """Records the close"""
+        self.closed = True
+
+
+def connect(*args, **kwargs) -> StubConnection:
+    """Gets a stub connection"""
+    return StubConnection()
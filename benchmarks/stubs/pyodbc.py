@@ -0,0 +1,12 @@
+"""Stand-in for pyodbc so the pipeline can be imported and timed without an ODBC driver."""
+# the loaders catch pyodbc.Error, so the SQLite stand-in's errors are handled the same way
+from sqlite3 import Error
+
+
+class Connection:
+    """Matches pyodbc.Connection for type hints"""
+
+
+def connect(*args, **kwargs):
+    """No database is available to the startup benchmark"""
+    raise Error("pyodbc is stubbed in the benchmarks")
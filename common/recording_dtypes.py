@@ -0,0 +1,23 @@
+"""Contains the dtypes recordings are kept in by the pipeline's archive, the lambda and the
+dashboard. Each component folder links to this file and each Dockerfile copies it in from the
+common build context, so there is only one definition to change."""
+
+# the repeated plant, botanist and country strings are stored once per distinct value as
+# categoricals instead of once per reading
+RECORDING_DTYPES = {
+    "recording_id": "int32",
+    "plant_id": "int32",
+    "botanist_id": "int32",
+    "soil_moisture": "float64",
+    "temperature": "float64",
+    "recording_taken": "datetime64[ns]",
+    "last_watered": "datetime64[ns]",
+    "name": "category",
+    "image_url": "category",
+    "first_name": "category",
+    "last_name": "category",
+    "country": "category",
+}
+# the recording_event columns the archive keeps, the strings are joined back on when read
+ARCHIVE_COLUMNS = ["recording_id", "plant_id", "botanist_id", "soil_moisture", "temperature",
+                   "recording_taken", "last_watered"]
@@ -0,0 +1,172 @@
+'''Tracks which plants have an open alert so each problem is emailed once per cooldown, in a digest.'''
+from dataclasses import dataclass, asdict, field, replace
+from datetime import datetime, timedelta
+import json
+import logging
+from os import environ
+
+# an open alert is emailed again after this long if the plant is still unhealthy
+ALERT_COOLDOWN = timedelta(minutes=60)
+# healthy readings in a row before an open alert is resolved
+RESOLVE_AFTER = 3
+# alerts are batched and emailed at most this often
+DIGEST_INTERVAL = timedelta(minutes=15)
+
+ALERT_STATE_PATH = environ.get("ALERT_STATE_PATH")
+
+OPEN = "open"
+RESOLVED = "resolved"
+
+
+@dataclass
+class PlantAlert:
+    '''The alert state of one plant, details is its latest unhealthy reading.'''
+    plant_id: int
+    status: str
+    opened_at: datetime
+    last_notified: datetime | None = None
+    healthy_streak: int = 0
+    details: dict = field(default_factory=dict)
+
+
+def update_alerts(alerts: dict[int, PlantAlert], unhealthy_plants: list[dict],
+                  checked_plant_ids: set[int], now: datetime,
+                  resolve_after: int = RESOLVE_AFTER) -> dict[int, PlantAlert]:
+    '''Opens or refreshes alerts for unhealthy plants and counts healthy readings towards
+    resolving the rest. Updates alerts in place and returns the alerts that changed.'''
+    changed = {}
+
+    for plant in unhealthy_plants:
+        plant_id = plant['plant_id']
+        alert = alerts.get(plant_id)
+        if alert is None or alert.status == RESOLVED:
+            alert = PlantAlert(plant_id, OPEN, now, details=plant)
+            logging.info("Alert opened for plant %s.", plant_id)
+        else:
+            alert = replace(alert, healthy_streak=0, details=plant)
+        changed[plant_id] = alert
+
+    unhealthy_ids = {plant['plant_id'] for plant in unhealthy_plants}
+    for plant_id in checked_plant_ids - unhealthy_ids:
+        alert = alerts.get(plant_id)
+        if alert is None or alert.status == RESOLVED:
+            continue
+        # hysteresis, one healthy reading is not enough to close an alert
+        alert = replace(alert, healthy_streak=alert.healthy_streak + 1)
+        if alert.healthy_streak >= resolve_after:
+            alert = replace(alert, status=RESOLVED)
+            logging.info("Alert resolved for plant %s.", plant_id)
+        changed[plant_id] = alert
+
+    alerts.update(changed)
+    return changed
+
+
+def due_notifications(alerts: dict[int, PlantAlert], now: datetime,
+                      cooldown: timedelta = ALERT_COOLDOWN,
+                      digest_interval: timedelta = DIGEST_INTERVAL) -> list[PlantAlert]:
+    '''Gets the open alerts to put in a digest now. Nothing is due until digest_interval has
+    passed since the last digest, then every open alert that has not been sent within the
+    cooldown goes into the next one.'''
+    sent = [alert.last_notified for alert in alerts.values() if alert.last_notified]
+    if sent and now - max(sent) < digest_interval:
+        return []
+
+    return [alert for alert in alerts.values() if alert.status == OPEN and (
+        alert.last_notified is None or now - alert.last_notified >= cooldown)]
+
+
+def mark_notified(alerts: dict[int, PlantAlert], notified: list[PlantAlert],
+                  now: datetime) -> dict[int, PlantAlert]:
+    '''Records that alerts were emailed. Updates alerts in place and returns the alerts that changed.'''
+    changed = {alert.plant_id: replace(alert, last_notified=now) for alert in notified}
+    alerts.update(changed)
+    return changed
+
+
+def alert_to_dict(alert: PlantAlert) -> dict:
+    '''Converts an alert to something that can be stored as JSON.'''
+    return dict(asdict(alert), opened_at=alert.opened_at.isoformat(),
+                last_notified=alert.last_notified.isoformat() if alert.last_notified else None)
+
+
+def alert_from_dict(saved: dict) -> PlantAlert:
+    '''Converts a stored alert back to a PlantAlert.'''
+    return PlantAlert(**dict(
+        saved, opened_at=datetime.fromisoformat(saved['opened_at']),
+        last_notified=datetime.fromisoformat(saved['last_notified'])
+        if saved['last_notified'] else None))
+
+
+class FileAlertStore:
+    '''Keeps the alerts in a local JSON file, used for testing and local runs.'''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict[int, PlantAlert]:
+        '''Reads every plant's alert.'''
+        try:
+            with open(self.path, encoding="utf-8") as state_file:
+                saved = json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        return {int(plant_id): alert_from_dict(alert) for plant_id, alert in saved.items()}
+
+    def save(self, alerts: dict[int, PlantAlert], commit: bool = True) -> None:
+        '''Upserts the given alerts, the file is written straight away whatever commit is.'''
+        saved = self.load()
+        saved.update(alerts)
+        with open(self.path, "w", encoding="utf-8") as state_file:
+            json.dump({plant_id: alert_to_dict(alert) for plant_id, alert in saved.items()},
+                      state_file, default=str)
+
+
+class TableAlertStore:
+    '''Keeps the alerts in the s_alpha.plant_alert table, one row per plant.'''
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def load(self) -> dict[int, PlantAlert]:
+        '''Reads every plant's alert.'''
+        query = """SELECT plant_id, status, opened_at, last_notified, healthy_streak, details
+                FROM s_alpha.plant_alert;"""
+        with self.conn.cursor() as curr:
+            curr.execute(query)
+            rows = curr.fetchall()
+        return {row['plant_id']: PlantAlert(**dict(row, details=json.loads(row['details'])))
+                for row in rows}
+
+    def save(self, alerts: dict[int, PlantAlert], commit: bool = True) -> None:
+        '''Upserts the given alerts, leaving the transaction open for the caller when commit
+        is False.'''
+        query = """MERGE s_alpha.plant_alert AS target
+                USING (SELECT %s AS plant_id, %s AS status, %s AS opened_at,
+                    %s AS last_notified, %s AS healthy_streak, %s AS details) AS source
+                ON target.plant_id = source.plant_id
+                WHEN MATCHED THEN UPDATE SET
+                    status = source.status, opened_at = source.opened_at,
+                    last_notified = source.last_notified, healthy_streak = source.healthy_streak,
+                    details = source.details
+                WHEN NOT MATCHED THEN INSERT
+                    (plant_id, status, opened_at, last_notified, healthy_streak, details)
+                VALUES (source.plant_id, source.status, source.opened_at,
+                    source.last_notified, source.healthy_streak, source.details);"""
+        rows = [(alert.plant_id, alert.status, alert.opened_at, alert.last_notified,
+                 alert.healthy_streak, json.dumps(alert.details, default=str))
+                for alert in alerts.values()]
+        if not rows:
+            return
+        with self.conn.cursor() as curr:
+            curr.executemany(query, rows)
+        if commit:
+            self.conn.commit()
+        logging.info("Saved %s plant alerts.", len(rows))
+
+
+def get_alert_store(conn):
+    '''Uses a local file if ALERT_STATE_PATH is set, otherwise the database table.'''
+    if ALERT_STATE_PATH:
+        return FileAlertStore(ALERT_STATE_PATH)
+    return TableAlertStore(conn)
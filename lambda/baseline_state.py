@@ -0,0 +1,143 @@
+'''Keeps running temperature and soil moisture statistics for each plant so alerts do not need the reading history.'''
+from dataclasses import dataclass, asdict
+from datetime import datetime
+import json
+import logging
+from math import sqrt
+from os import environ
+
+# weight given to the newest reading in the exponentially weighted mean and variance
+EWMA_ALPHA = 0.3
+# readings a plant needs before its baseline is trusted
+MIN_READINGS = 3
+# how many standard deviations from its baseline a reading has to be to be unhealthy
+Z_THRESHOLD = 3
+# stops a very steady plant alerting on tiny changes
+MIN_TEMP_STD = 0.5
+MIN_MOISTURE_STD = 2
+
+BASELINE_STATE_PATH = environ.get("BASELINE_STATE_PATH")
+
+
+@dataclass
+class PlantBaseline:
+    '''Running statistics for one plant.'''
+    plant_id: int
+    readings: int
+    last_recording: datetime
+    temperature_mean: float
+    temperature_var: float
+    moisture_mean: float
+    moisture_var: float
+    # the recording_event id of the newest reading counted, None for baselines saved before it was kept
+    last_recording_id: int | None = None
+
+
+def ewm_update(mean: float, var: float, value: float, alpha: float = EWMA_ALPHA) -> tuple[float, float]:
+    '''Updates an exponentially weighted mean and variance with a new value.'''
+    difference = value - mean
+    increment = alpha * difference
+    return mean + increment, (1 - alpha) * (var + difference * increment)
+
+
+def z_score(value: float, mean: float, var: float, min_std: float) -> float:
+    '''Gets how many standard deviations a value is from the mean.'''
+    return (value - mean) / max(sqrt(var), min_std)
+
+
+def update_baseline(baseline: PlantBaseline | None, plant_id: int, recording_taken: datetime,
+                    temperature: float, moisture: float, recording_id: int | None = None,
+                    alpha: float = EWMA_ALPHA) -> PlantBaseline:
+    '''Adds a reading to a plant's baseline, starting one if the plant has none.'''
+    if baseline is None:
+        return PlantBaseline(plant_id, 1, recording_taken, temperature, 0.0, moisture, 0.0,
+                             recording_id)
+
+    temperature_mean, temperature_var = ewm_update(
+        baseline.temperature_mean, baseline.temperature_var, temperature, alpha)
+    moisture_mean, moisture_var = ewm_update(
+        baseline.moisture_mean, baseline.moisture_var, moisture, alpha)
+    return PlantBaseline(plant_id, baseline.readings + 1, recording_taken,
+                         temperature_mean, temperature_var, moisture_mean, moisture_var,
+                         recording_id)
+
+
+class FileBaselineStore:
+    '''Keeps the baselines in a local JSON file, used for testing and local runs.'''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict[int, PlantBaseline]:
+        '''Reads every plant's baseline.'''
+        try:
+            with open(self.path, encoding="utf-8") as state_file:
+                saved = json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        return {int(plant_id): PlantBaseline(**dict(
+            baseline, last_recording=datetime.fromisoformat(baseline["last_recording"])))
+            for plant_id, baseline in saved.items()}
+
+    def save(self, baselines: dict[int, PlantBaseline], commit: bool = True) -> None:
+        '''Upserts the given baselines, the file is written straight away whatever commit is.'''
+        saved = self.load()
+        saved.update(baselines)
+        with open(self.path, "w", encoding="utf-8") as state_file:
+            json.dump({plant_id: dict(asdict(baseline),
+                                      last_recording=baseline.last_recording.isoformat())
+                       for plant_id, baseline in saved.items()}, state_file)
+
+
+class TableBaselineStore:
+    '''Keeps the baselines in the s_alpha.plant_baseline table, one small row per plant.'''
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def load(self) -> dict[int, PlantBaseline]:
+        '''Reads every plant's baseline.'''
+        query = """SELECT plant_id, readings, last_recording, temperature_mean, temperature_var,
+                moisture_mean, moisture_var, last_recording_id
+                FROM s_alpha.plant_baseline;"""
+        with self.conn.cursor() as curr:
+            curr.execute(query)
+            rows = curr.fetchall()
+        return {row['plant_id']: PlantBaseline(**row) for row in rows}
+
+    def save(self, baselines: dict[int, PlantBaseline], commit: bool = True) -> None:
+        '''Upserts the given baselines, leaving the transaction open for the caller when commit
+        is False.'''
+        query = """MERGE s_alpha.plant_baseline AS target
+                USING (SELECT %s AS plant_id, %s AS readings, %s AS last_recording,
+                    %s AS temperature_mean, %s AS temperature_var,
+                    %s AS moisture_mean, %s AS moisture_var, %s AS last_recording_id) AS source
+                ON target.plant_id = source.plant_id
+                WHEN MATCHED THEN UPDATE SET
+                    readings = source.readings, last_recording = source.last_recording,
+                    temperature_mean = source.temperature_mean, temperature_var = source.temperature_var,
+                    moisture_mean = source.moisture_mean, moisture_var = source.moisture_var,
+                    last_recording_id = source.last_recording_id
+                WHEN NOT MATCHED THEN INSERT
+                    (plant_id, readings, last_recording, temperature_mean, temperature_var,
+                    moisture_mean, moisture_var, last_recording_id)
+                VALUES (source.plant_id, source.readings, source.last_recording,
+                    source.temperature_mean, source.temperature_var,
+                    source.moisture_mean, source.moisture_var, source.last_recording_id);"""
+        rows = [(b.plant_id, b.readings, b.last_recording, b.temperature_mean,
+                 b.temperature_var, b.moisture_mean, b.moisture_var, b.last_recording_id)
+                for b in baselines.values()]
+        if not rows:
+            return
+        with self.conn.cursor() as curr:
+            curr.executemany(query, rows)
+        if commit:
+            self.conn.commit()
+        logging.info("Saved %s plant baselines.", len(rows))
+
+
+def get_baseline_store(conn):
+    '''Uses a local file if BASELINE_STATE_PATH is set, otherwise the database table.'''
+    if BASELINE_STATE_PATH:
+        return FileBaselineStore(BASELINE_STATE_PATH)
+    return TableBaselineStore(conn)
@@ -1,13 +1,39 @@
 '''Prepares string for use in handler function.'''
 from os import environ
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-import pandas as pd
-import boto3
-from datetime import datetime
-from pymssql import connect
+
+from alert_state import get_alert_store, update_alerts, due_notifications, mark_notified
+from baseline_state import (PlantBaseline, ewm_update, get_baseline_store,
+                            MIN_READINGS, Z_THRESHOLD, MIN_TEMP_STD, MIN_MOISTURE_STD)
+from recording_dtypes import RECORDING_DTYPES
+
+# pandas, boto3 and pymssql are imported where they are used to keep cold starts short
+if TYPE_CHECKING:
+    import pandas as pd
+
+# the furthest back a run catches up on readings it has not seen, such as on the first run
+MAX_CATCH_UP = timedelta(hours=24)
+
+SES_CLIENT = None
+
+# a range seek on the primary key, migrations/check_plans.py checks its plan
+UNSEEN_READINGS_QUERY = """SELECT recording_id, plant_id, soil_moisture, temperature, recording_taken
+            FROM s_alpha.recording_event
+            WHERE recording_id > %s AND recording_taken > %s;"""
+# a range seek on the recording_taken index, for runs without any seen recording ids
+CATCH_UP_READINGS_QUERY = """SELECT recording_id, plant_id, soil_moisture, temperature, recording_taken
+            FROM s_alpha.recording_event
+            WHERE recording_taken > %s;"""
+
+# moisture outside these bounds is unhealthy whatever the baseline
+MIN_MOISTURE = 5
+MAX_MOISTURE = 60
 
 
 def get_db_connection():
+    from pymssql import connect
 
     conn = connect(
         server=environ["DB_HOST"],
@@ -23,68 +49,133 @@ def get_db_connection():
 
 
 
-def load_all_data(conn) -> pd.DataFrame:
-    """Loads all recording event data as a dataframe."""
+def fetch_typed_frame(conn, query: str, params: tuple | None = None) -> "pd.DataFrame":
+    """Runs a query and builds a dataframe with compact dtypes straight from the row tuples,
+    without making a dict for every row."""
+    import pandas as pd
 
-    query="""SELECT s_alpha.recording_event.*, s_alpha.plant.name, s_alpha.plant.image_url,
-            s_alpha.botanist.first_name, s_alpha.botanist.last_name,
-            s_alpha.origin_location.country
-            FROM s_alpha.recording_event
-            JOIN s_alpha.plant
-            ON s_alpha.plant.plant_id = s_alpha.recording_event.plant_id
-            JOIN s_alpha.botanist
-            ON s_alpha.botanist.botanist_id = s_alpha.recording_event.botanist_id
-            JOIN s_alpha.origin_location
-            ON s_alpha.origin_location.origin_location_id = s_alpha.plant.origin_location_id;"""
-    with conn.cursor() as curr:
-        curr.execute(query)
+    with conn.cursor(as_dict=False) as curr:
+        curr.execute(query, params)
+        columns = [column[0] for column in curr.description or []]
         data = curr.fetchall()
-    df = pd.DataFrame(data)
-    return df
-
-def load_current_data(connection):
-    df = load_all_data(connection)
-    current_time = datetime.now().minute
-    df = df[df['recording_taken'].dt.minute == current_time]
-    return df
-
-def generate_avg_temp(df, plant:dict):
-    name = plant.get('name')
-    plant_df = df[df['name']==name]
-    sort_by_time = plant_df.sort_values(by='recording_taken', ascending=False)
-    last_recorded_values = sort_by_time.head(3)
-    return last_recorded_values['temperature'].mean()
-
-
-# --- CURRENT PLAN FOR HEALTH CHECK
-# extract past 2-3 readings -> get average
-# threshold = avg
-# if temp is += 3˚C
-# moisture should not be below -> 0%-5% or >60% (temporary parameters that can be easily adjusted after seeing more data)
-
-
-def check_plant_vitals(df: pd.DataFrame) -> list[dict]:
-    '''Checks if a plants vitals are healthy, if not unhealthy plants are returned as a list.'''
-    unhealthy_plants = []
-    for index, plant in df.iterrows():
-        temp = plant.get('temperature')
-        moisture = plant.get('soil_moisture')
-        avg_temperature = int(generate_avg_temp(df, plant))
-        if (avg_temperature-3) >= temp or temp >= (avg_temperature+3):
-            unhealthy_plants.append({
-                'plant_id': plant['plant_id'],
-                'temperature': temp,
-                'soil_moisture': moisture,
-                'avg_temp': avg_temperature
-            })
-    return unhealthy_plants
+    df = pd.DataFrame.from_records(data, columns=columns)
+    return df.astype({column: dtype for column, dtype in RECORDING_DTYPES.items()
+                      if column in df.columns})
+
+
+def load_unseen_data(conn, baselines: dict[int, PlantBaseline], now: datetime | None = None,
+                     max_catch_up: timedelta = MAX_CATCH_UP) -> "pd.DataFrame":
+    """Loads the readings inserted since the newest one any baseline has counted. Recording ids
+    only grow, so this covers every plant with one seek on the primary key, however long ago a
+    plant last reported. Readings older than max_catch_up are left out, and until a baseline
+    holds a recording id the readings are found by when they were taken instead."""
+    since = (now or datetime.now()) - max_catch_up
+    seen_ids = [baseline.last_recording_id for baseline in baselines.values()
+                if baseline.last_recording_id is not None]
+    if seen_ids:
+        return fetch_typed_frame(conn, UNSEEN_READINGS_QUERY, (max(seen_ids), since))
+    return fetch_typed_frame(conn, CATCH_UP_READINGS_QUERY, (since,))
+
+
+def check_latest_readings(df: "pd.DataFrame", baselines: dict[int, PlantBaseline],
+                          z_threshold: float = Z_THRESHOLD, min_readings: int = MIN_READINGS,
+                          min_moisture: float = MIN_MOISTURE, max_moisture: float = MAX_MOISTURE
+                          ) -> tuple[list[dict], dict[int, PlantBaseline]]:
+    '''Checks each plant's unseen readings against its baseline and folds them into it, oldest
+    first. Every plant's first unseen reading is checked and folded at once, then every plant's
+    second and so on, so a run usually takes one step whatever the number of plants. Returns the
+    plants with an unhealthy reading, with the details of their newest unhealthy one, and the
+    baselines that changed. Readings older than a plant's baseline have already been counted
+    and are skipped.'''
+    import numpy as np
+    import pandas as pd
+
+    if df.empty:
+        return [], {}
+
+    df = df.sort_values(['plant_id', 'recording_taken'])
+    seen = pd.to_datetime(df['plant_id'].map(
+        {plant_id: baseline.last_recording for plant_id, baseline in baselines.items()}))
+    df = df[seen.isna() | (df['recording_taken'] > seen)]
+    if df.empty:
+        return [], {}
+
+    plant_ids = df['plant_id'].unique()
+    previous = [baselines.get(int(plant_id)) for plant_id in plant_ids]
+    readings = np.array([baseline.readings if baseline else 0 for baseline in previous])
+    temperature_mean, temperature_var, moisture_mean, moisture_var = (np.array(
+        [getattr(baseline, name) if baseline else 0.0 for baseline in previous])
+        for name in ('temperature_mean', 'temperature_var', 'moisture_mean', 'moisture_var'))
+
+    positions = np.searchsorted(plant_ids, df['plant_id'].to_numpy())
+    steps = df.groupby('plant_id').cumcount().to_numpy()
+    temperatures = df['temperature'].to_numpy(dtype=float)
+    moistures = df['soil_moisture'].to_numpy(dtype=float)
+
+    unhealthy = {}
+    for step in range(steps.max() + 1):
+        rows = steps == step
+        plant = positions[rows]
+        temperature, moisture = temperatures[rows], moistures[rows]
+        counted = readings[plant]
+
+        trusted = counted >= min_readings
+        temperature_z = (temperature - temperature_mean[plant]) / np.maximum(
+            np.sqrt(temperature_var[plant]), MIN_TEMP_STD)
+        moisture_z = (moisture - moisture_mean[plant]) / np.maximum(
+            np.sqrt(moisture_var[plant]), MIN_MOISTURE_STD)
+        temperature_alert = trusted & (np.abs(temperature_z) >= z_threshold)
+        moisture_alert = (trusted & (np.abs(moisture_z) >= z_threshold)) | ~(
+            (min_moisture < moisture) & (moisture < max_moisture))
+
+        started = counted > 0
+        for i in np.flatnonzero(temperature_alert | moisture_alert):
+            unhealthy[int(plant_ids[plant[i]])] = {
+                'plant_id': int(plant_ids[plant[i]]),
+                'temperature': float(temperature[i]),
+                'soil_moisture': float(moisture[i]),
+                'avg_temp': round(float(temperature_mean[plant[i]] if started[i]
+                                        else temperature[i]), 1),
+                'avg_moisture': round(float(moisture_mean[plant[i]] if started[i]
+                                            else moisture[i]), 1),
+                'temperature_alert': bool(temperature_alert[i]),
+                'moisture_alert': bool(moisture_alert[i])
+            }
+
+        # a plant without a baseline starts one at its first reading
+        mean, var = ewm_update(temperature_mean[plant], temperature_var[plant], temperature)
+        temperature_mean[plant] = np.where(started, mean, temperature)
+        temperature_var[plant] = np.where(started, var, 0.0)
+        mean, var = ewm_update(moisture_mean[plant], moisture_var[plant], moisture)
+        moisture_mean[plant] = np.where(started, mean, moisture)
+        moisture_var[plant] = np.where(started, var, 0.0)
+        readings[plant] = counted + 1
+
+    latest = df.groupby('plant_id').tail(1)
+    updated = {int(plant_id): PlantBaseline(
+        int(plant_id), int(readings[i]), latest_reading.recording_taken.to_pydatetime(),
+        float(temperature_mean[i]), float(temperature_var[i]),
+        float(moisture_mean[i]), float(moisture_var[i]), int(latest_reading.recording_id))
+        for i, (plant_id, latest_reading) in enumerate(zip(plant_ids, latest.itertuples()))}
+
+    return [unhealthy[plant_id] for plant_id in sorted(unhealthy)], updated
+
+
+def get_ses_client():
+    """Gets the SES client, creating it on the first call so warm invocations reuse it."""
+    global SES_CLIENT
+    if SES_CLIENT is None:
+        import boto3
+
+        SES_CLIENT = boto3.client('ses', region_name='eu-west-2', aws_access_key_id=environ["ACCESS_KEY_ID"],
+                                  aws_secret_access_key=environ["SECRET_ACCESS_KEY"])
+    return SES_CLIENT
 
 
 def send_email(unhealthy_plants:list[dict]):
     plant_warning  = generate_html_string(unhealthy_plants)
-    client = boto3.client('ses', region_name='eu-west-2', aws_access_key_id=environ["ACCESS_KEY_ID"],
-                           aws_secret_access_key=environ["SECRET_ACCESS_KEY"])
-   
+    client = get_ses_client()
+
     response = client.send_email(
         Destination={
             'ToAddresses': ['trainee.anurag.kaur@sigmalabs.co.uk', 'trainee.ishika.madhav@sigmalabs.co.uk']
@@ -116,6 +207,14 @@ def generate_html_string(plants:list[dict]) -> str:
         plant_id = plant.get('plant_id')
         temperature = plant.get('temperature')
         avg = plant.get('avg_temp')
+        moisture = plant.get('soil_moisture')
+
+        if plant.get('moisture_alert'):
+            warning_string += f""" <li> Plant {plant_id} has unhealthy soil moisture of {moisture}%. The average soil moisture is {plant.get('avg_moisture')}% </li>"""
+
+        if not plant.get('temperature_alert', True):
+            continue
+
         if temperature > avg:
             difference = temperature - avg
             warning_string += f""" <li> Plant {plant_id} is above optimum temperature by {difference}˚C. The average temperature is {avg}˚C but the temperature is {temperature}˚C </li>"""
@@ -130,10 +229,31 @@ def generate_html_string(plants:list[dict]) -> str:
 def handler(event=None, context=None):
     load_dotenv()
     connection = get_db_connection()
-    df = load_all_data(connection)
-    unhealthy_plants = check_plant_vitals(df)
-    if unhealthy_plants != []:
-        return send_email(unhealthy_plants)
-    return None
+    try:
+        store = get_baseline_store(connection)
+        baselines = store.load()
+        # the stored baselines stand in for the history, so only the readings since them are needed
+        df = load_unseen_data(connection, baselines)
+        unhealthy_plants, updated = check_latest_readings(df, baselines)
+
+        # only plants that are newly unhealthy or past their cooldown are emailed, in one digest
+        now = datetime.now()
+        alert_store = get_alert_store(connection)
+        alerts = alert_store.load()
+        changed = update_alerts(alerts, unhealthy_plants, set(updated), now)
+        due = due_notifications(alerts, now)
 
+        response = None
+        if due:
+            # nothing is saved before the digest is sent, so if sending fails the next run
+            # checks the same readings again and retries it
+            response = send_email([alert.details for alert in due])
+            changed.update(mark_notified(alerts, due, now))
 
+        # the baselines and alerts are committed together so they always agree
+        store.save(updated, commit=False)
+        alert_store.save(changed, commit=False)
+        connection.commit()
+        return response
+    finally:
+        connection.close()
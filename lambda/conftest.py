@@ -0,0 +1,6 @@
+"""Puts the benchmarks' boto3 and pymssql stand-ins on the path, so the handler tests use their
+stub SES client and connection"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks" / "stubs"))
@@ -0,0 +1,130 @@
+"""Script that tests the functions in alert_state.py and the alerting in the handler"""
+
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+
+# the stand-ins the startup benchmark uses, see conftest.py
+from boto3 import StubSESClient
+from pymssql import StubConnection
+
+import check_vitals
+from alert_state import (FileAlertStore, PlantAlert, OPEN, RESOLVED, due_notifications,
+                         mark_notified, update_alerts)
+from baseline_state import FileBaselineStore, update_baseline
+
+NOW = datetime(2023, 12, 21, 10, 0, 0)
+UNHEALTHY = {'plant_id': 1, 'temperature': 28.0, 'soil_moisture': 30.0, 'avg_temp': 20.0,
+             'avg_moisture': 30.0, 'temperature_alert': True, 'moisture_alert': False}
+
+
+def test_update_alerts_opens_once():
+    """Tests that a plant that stays unhealthy keeps one open alert"""
+    alerts = {}
+    update_alerts(alerts, [UNHEALTHY], {1, 2}, NOW)
+    update_alerts(alerts, [UNHEALTHY], {1, 2}, NOW + timedelta(minutes=1))
+    assert list(alerts) == [1]
+    assert alerts[1].status == OPEN
+    assert alerts[1].opened_at == NOW
+
+
+def test_update_alerts_hysteresis():
+    """Tests that an alert only resolves after enough healthy readings in a row"""
+    alerts = {}
+    update_alerts(alerts, [UNHEALTHY], {1}, NOW)
+    update_alerts(alerts, [], {1}, NOW)
+    update_alerts(alerts, [UNHEALTHY], {1}, NOW)
+    update_alerts(alerts, [], {1}, NOW, resolve_after=2)
+    assert alerts[1].status == OPEN
+    update_alerts(alerts, [], {1}, NOW, resolve_after=2)
+    assert alerts[1].status == RESOLVED
+
+
+def test_due_notifications_cooldown():
+    """Tests that an alert is not sent again until its cooldown has passed"""
+    alerts = {1: PlantAlert(1, OPEN, NOW)}
+    due = due_notifications(alerts, NOW)
+    mark_notified(alerts, due, NOW)
+    assert [alert.plant_id for alert in due] == [1]
+
+    assert due_notifications(alerts, NOW + timedelta(minutes=30)) == []
+    assert len(due_notifications(alerts, NOW + timedelta(minutes=60))) == 1
+
+
+def test_due_notifications_digest_interval():
+    """Tests that a new alert waits for the next digest instead of its own email"""
+    alerts = {1: PlantAlert(1, OPEN, NOW, last_notified=NOW),
+              2: PlantAlert(2, OPEN, NOW + timedelta(minutes=5))}
+    assert due_notifications(alerts, NOW + timedelta(minutes=5)) == []
+    due = due_notifications(alerts, NOW + timedelta(minutes=15))
+    assert [alert.plant_id for alert in due] == [2]
+
+
+def test_file_alert_store_round_trip(tmp_path):
+    """Tests that saved alerts are read back"""
+    store = FileAlertStore(str(tmp_path / "alerts.json"))
+    alert = PlantAlert(1, OPEN, NOW, last_notified=NOW, details=UNHEALTHY)
+    store.save({1: alert})
+    assert store.load() == {1: alert}
+
+
+def stub_handler(tmp_path, monkeypatch, ses, temperatures: list[float]) -> tuple[
+        FileBaselineStore, FileAlertStore, list[StubConnection]]:
+    """Points the handler at file stores holding a steady plant, the stub SES client and
+    readings with the given temperatures, one per run"""
+    baseline_store = FileBaselineStore(str(tmp_path / "baselines.json"))
+    alert_store = FileAlertStore(str(tmp_path / "alerts.json"))
+
+    baseline = None
+    for minute in range(5):
+        baseline = update_baseline(baseline, 1, NOW + timedelta(minutes=minute), 20.0, 30.0)
+    baseline_store.save({1: baseline})
+
+    readings = iter(enumerate(temperatures, start=5))
+    connections = []
+
+    def load_unseen_data(conn, baselines):
+        minute, temperature = next(readings)
+        return pd.DataFrame([{'recording_id': minute, 'plant_id': 1, 'temperature': temperature,
+                              'soil_moisture': 30.0,
+                              'recording_taken': pd.Timestamp(NOW + timedelta(minutes=minute))}])
+
+    def get_db_connection():
+        connections.append(StubConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(check_vitals, 'SES_CLIENT', ses)
+    monkeypatch.setattr(check_vitals, 'get_db_connection', get_db_connection)
+    monkeypatch.setattr(check_vitals, 'load_unseen_data', load_unseen_data)
+    monkeypatch.setattr(check_vitals, 'get_baseline_store', lambda conn: baseline_store)
+    monkeypatch.setattr(check_vitals, 'get_alert_store', lambda conn: alert_store)
+    return baseline_store, alert_store, connections
+
+
+def test_handler_sends_one_digest(tmp_path, monkeypatch):
+    """Tests that an unhealthy plant is emailed once and not on the next minute"""
+    ses = StubSESClient()
+    _, _, connections = stub_handler(tmp_path, monkeypatch, ses, [28.0, 28.5])
+
+    assert check_vitals.handler() == {'MessageId': 'stub-1'}
+    assert check_vitals.handler() is None
+    assert len(ses.sent) == 1
+    assert 'Plant 1 is above optimum temperature' in ses.sent[0]['Message']['Body']['Html']['Data']
+    assert [(conn.commits, conn.closed) for conn in connections] == [(1, True), (1, True)]
+
+
+def test_handler_keeps_state_when_sending_fails(tmp_path, monkeypatch):
+    """Tests that nothing is saved when the digest cannot be sent, so the next run retries it"""
+    ses = StubSESClient(fail_first=True)
+    baseline_store, alert_store, connections = stub_handler(
+        tmp_path, monkeypatch, ses, [28.0, 28.0])
+    baselines = baseline_store.load()
+
+    with pytest.raises(ConnectionError):
+        check_vitals.handler()
+    assert baseline_store.load() == baselines
+    assert alert_store.load() == {}
+    assert connections[0].closed and connections[0].commits == 0
+
+    assert check_vitals.handler() == {'MessageId': 'stub-1'}
+    assert alert_store.load()[1].last_notified is not None
@@ -0,0 +1,124 @@
+"""Script that tests the functions in baseline_state.py"""
+
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+
+from baseline_state import FileBaselineStore, ewm_update, update_baseline, z_score
+from check_vitals import check_latest_readings
+
+START = datetime(2023, 12, 21, 10, 0, 0)
+
+
+def test_ewm_update_constant_values():
+    """Tests that a constant value keeps its mean and has no variance"""
+    mean, var = 20.0, 0.0
+    for _ in range(10):
+        mean, var = ewm_update(mean, var, 20.0)
+    assert mean == 20.0
+    assert var == 0.0
+
+
+def test_ewm_update_moves_towards_value():
+    """Tests that the mean moves part of the way to a new value and the variance grows"""
+    mean, var = ewm_update(20.0, 0.0, 30.0, alpha=0.5)
+    assert mean == pytest.approx(25.0)
+    assert var > 0
+
+
+def test_z_score_uses_minimum_std():
+    """Tests that a zero variance does not make every change an outlier"""
+    assert z_score(21, 20, 0.0, min_std=0.5) == pytest.approx(2)
+
+
+def test_file_store_round_trip(tmp_path):
+    """Tests that saved baselines are read back and saving some keeps the rest"""
+    store = FileBaselineStore(str(tmp_path / "baselines.json"))
+    first = update_baseline(None, 1, START, 20.0, 30.0)
+    second = update_baseline(None, 2, START, 15.0, 40.0)
+    store.save({1: first, 2: second})
+    updated = update_baseline(first, 1, START + timedelta(minutes=1), 21.0, 30.0)
+    store.save({1: updated})
+
+    assert store.load() == {1: updated, 2: second}
+
+
+def reading(plant_id: int, minute: int, temperature: float, soil_moisture: float = 30) -> dict:
+    """Makes one reading row"""
+    return {'recording_id': plant_id * 1000 + minute, 'plant_id': plant_id,
+            'temperature': temperature, 'soil_moisture': soil_moisture,
+            'recording_taken': pd.Timestamp(START + timedelta(minutes=minute))}
+
+
+def test_check_latest_readings_alerts_after_baseline_builds():
+    """Tests that a spike is only reported once the plant has enough readings"""
+    baselines = {}
+    for minute in range(5):
+        unhealthy, updated = check_latest_readings(
+            pd.DataFrame([reading(1, minute, 20 + minute % 2 * 0.2)]), baselines)
+        baselines.update(updated)
+        assert unhealthy == []
+
+    unhealthy, updated = check_latest_readings(pd.DataFrame([reading(1, 5, 26)]), baselines)
+    assert [plant['plant_id'] for plant in unhealthy] == [1]
+    assert unhealthy[0]['temperature_alert']
+    assert updated[1].readings == 6
+
+
+def test_check_latest_readings_skips_seen_readings():
+    """Tests that a reading already in the baseline is not counted twice"""
+    baselines = {1: update_baseline(None, 1, START, 20.0, 30.0)}
+    unhealthy, updated = check_latest_readings(pd.DataFrame([reading(1, 0, 20)]), baselines)
+    assert unhealthy == []
+    assert updated == {}
+
+
+def test_check_latest_readings_folds_every_unseen_reading():
+    """Tests that readings stored between two runs are all checked and counted in order"""
+    baselines = {}
+    for minute in range(5):
+        baselines[1] = update_baseline(baselines.get(1), 1, START + timedelta(minutes=minute),
+                                       20.0 + minute % 2 * 0.2, 30.0)
+
+    readings = pd.DataFrame([reading(1, 7, 20), reading(1, 5, 20.2), reading(1, 6, 26)])
+    unhealthy, updated = check_latest_readings(readings, baselines)
+
+    assert [plant['temperature'] for plant in unhealthy] == [26]
+    assert updated[1].readings == 8
+    assert updated[1].last_recording == START + timedelta(minutes=7)
+    assert updated[1].last_recording_id == 1007
+
+
+
+def test_check_latest_readings_matches_folding_one_at_a_time():
+    """Tests that plants with different numbers of unseen readings end up with the same
+    baselines as folding each reading in with update_baseline"""
+    baselines = {1: update_baseline(None, 1, START, 20.0, 30.0)}
+    readings = pd.DataFrame([reading(2, 1, 15, 40), reading(1, 3, 22, 31), reading(1, 1, 21, 33),
+                             reading(1, 2, 19, 29), reading(2, 2, 16, 42)])
+
+    _, updated = check_latest_readings(readings, baselines)
+
+    expected = {1: baselines[1], 2: None}
+    for row in readings.sort_values('recording_taken').itertuples():
+        expected[row.plant_id] = update_baseline(
+            expected[row.plant_id], row.plant_id, row.recording_taken.to_pydatetime(),
+            row.temperature, row.soil_moisture, row.recording_id)
+    assert updated == expected
+
+
+def test_check_latest_readings_reports_only_unhealthy_plants():
+    """Tests that of several plants checked together only the ones out of range are reported"""
+    baselines = {}
+    for minute in range(5):
+        for plant_id in (1, 2, 3):
+            baselines[plant_id] = update_baseline(
+                baselines.get(plant_id), plant_id, START + timedelta(minutes=minute), 20.0, 30.0)
+
+    readings = pd.DataFrame([reading(1, 5, 20), reading(2, 5, 26), reading(3, 5, 20, 2)])
+    unhealthy, updated = check_latest_readings(readings, baselines)
+
+    assert [(plant['plant_id'], plant['temperature_alert'], plant['moisture_alert'])
+            for plant in unhealthy] == [(2, True, False), (3, False, True)]
+    assert unhealthy[0]['avg_temp'] == 20
+    assert sorted(updated) == [1, 2, 3]
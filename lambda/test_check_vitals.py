@@ -0,0 +1,86 @@
+"""Script that tests the functions in check_vitals.py"""
+
+from datetime import datetime, timedelta
+import pandas as pd
+
+import check_vitals
+from baseline_state import update_baseline
+from check_vitals import fetch_typed_frame, generate_html_string, load_unseen_data
+
+START = datetime(2023, 12, 21, 10, 0, 0)
+
+
+def test_generate_html_string_moisture_only():
+    """Tests that a moisture alert does not add a temperature warning"""
+    html = generate_html_string([{'plant_id': 1, 'temperature': 20, 'soil_moisture': 2,
+                                  'avg_temp': 19, 'avg_moisture': 30,
+                                  'temperature_alert': False, 'moisture_alert': True}])
+    assert 'soil moisture' in html
+    assert 'temperature' not in html
+
+
+class TupleCursor:
+    """A cursor that returns fixed rows as tuples"""
+    description = [('plant_id',), ('temperature',), ('recording_taken',), ('name',)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        """Ignores the query"""
+
+    def fetchall(self) -> list:
+        """Returns two readings for the same plant"""
+        return [(1, 20.5, START, 'Venus flytrap'), (1, 21.0, START, 'Venus flytrap')]
+
+
+class TupleConnection:
+    """A connection that hands out tuple cursors"""
+
+    def cursor(self, as_dict: bool = True) -> TupleCursor:
+        """Gets a tuple cursor"""
+        assert not as_dict
+        return TupleCursor()
+
+
+def test_fetch_typed_frame_dtypes():
+    """Tests that readings are typed and repeated strings become categoricals"""
+    df = fetch_typed_frame(TupleConnection(), "SELECT")
+    assert df['plant_id'].dtype == 'int32'
+    assert df['temperature'].dtype == 'float64'
+    assert df['recording_taken'].dtype == 'datetime64[ns]'
+    assert isinstance(df['name'].dtype, pd.CategoricalDtype)
+    assert list(df['name'].cat.categories) == ['Venus flytrap']
+
+
+def test_load_unseen_data_after_the_newest_seen_id(monkeypatch):
+    """Tests that readings are fetched after the newest recording id any baseline has counted,
+    so a plant that stopped reporting does not widen the read"""
+    calls = []
+    monkeypatch.setattr(check_vitals, 'fetch_typed_frame',
+                        lambda conn, query, query_params: calls.append((query, query_params)))
+    now = START + timedelta(hours=1)
+    baselines = {1: update_baseline(None, 1, START + timedelta(minutes=50), 20.0, 30.0, 120),
+                 2: update_baseline(None, 2, START - timedelta(hours=20), 20.0, 30.0, 7)}
+
+    load_unseen_data(None, baselines, now=now)
+
+    assert calls == [(check_vitals.UNSEEN_READINGS_QUERY, (120, now - check_vitals.MAX_CATCH_UP))]
+
+
+def test_load_unseen_data_catches_up_without_ids(monkeypatch):
+    """Tests that without any seen recording ids the readings within the catch up limit are
+    fetched by when they were taken"""
+    calls = []
+    monkeypatch.setattr(check_vitals, 'fetch_typed_frame',
+                        lambda conn, query, query_params: calls.append((query, query_params)))
+    now = START + timedelta(hours=1)
+    baselines = {1: update_baseline(None, 1, START + timedelta(minutes=50), 20.0, 30.0)}
+
+    load_unseen_data(None, baselines, now=now, max_catch_up=timedelta(minutes=30))
+    load_unseen_data(None, {}, now=now, max_catch_up=timedelta(minutes=30))
+
+    assert calls == [(check_vitals.CATCH_UP_READINGS_QUERY, (START + timedelta(minutes=30),))] * 2
@@ -0,0 +1,66 @@
+-- the staged, idempotent recording load and the state kept by the vitals lambda
+
+IF COL_LENGTH('s_alpha.recording_event', 'run_id') IS NULL
+ALTER TABLE s_alpha.recording_event ADD run_id VARCHAR(36) NULL;
+GO
+
+-- retried loads re-inserted readings before the load was idempotent, keep the first copy of each
+-- reading so the unique index can be built on an existing database
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_recording_event_plant_taken')
+DELETE duplicate
+    FROM s_alpha.recording_event AS duplicate
+    WHERE EXISTS (
+        SELECT 1 FROM s_alpha.recording_event AS kept
+        WHERE kept.plant_id = duplicate.plant_id
+        AND kept.recording_taken = duplicate.recording_taken
+        AND kept.recording_id < duplicate.recording_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_recording_event_plant_taken')
+CREATE UNIQUE INDEX ix_recording_event_plant_taken
+    ON s_alpha.recording_event (plant_id, recording_taken);
+GO
+
+IF OBJECT_ID('s_alpha.recording_event_stage', 'U') IS NULL
+CREATE TABLE s_alpha.recording_event_stage (
+    run_id VARCHAR(36) NOT NULL,
+    plant_id INT NOT NULL,
+    botanist_id INT NOT NULL,
+    soil_moisture FLOAT NOT NULL,
+    temperature FLOAT NOT NULL,
+    recording_taken DATETIME NOT NULL,
+    last_watered DATETIME NOT NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_recording_event_stage_run')
+CREATE INDEX ix_recording_event_stage_run
+    ON s_alpha.recording_event_stage (run_id);
+GO
+
+IF OBJECT_ID('s_alpha.plant_baseline', 'U') IS NULL
+CREATE TABLE s_alpha.plant_baseline (
+    plant_id INT NOT NULL,
+    readings INT NOT NULL,
+    last_recording DATETIME NOT NULL,
+    temperature_mean FLOAT NOT NULL,
+    temperature_var FLOAT NOT NULL,
+    moisture_mean FLOAT NOT NULL,
+    moisture_var FLOAT NOT NULL,
+    PRIMARY KEY (plant_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
+
+IF OBJECT_ID('s_alpha.plant_alert', 'U') IS NULL
+CREATE TABLE s_alpha.plant_alert (
+    plant_id INT NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    opened_at DATETIME NOT NULL,
+    last_notified DATETIME NULL,
+    healthy_streak INT NOT NULL,
+    details VARCHAR(1000) NOT NULL,
+    PRIMARY KEY (plant_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
@@ -0,0 +1,31 @@
+-- the time window index and the indexed views behind the dashboard summaries
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_recording_event_taken')
+CREATE INDEX ix_recording_event_taken
+    ON s_alpha.recording_event (recording_taken)
+    INCLUDE (plant_id, soil_moisture, temperature, last_watered);
+GO
+
+IF OBJECT_ID('s_alpha.botanist_plant', 'V') IS NULL
+EXEC('CREATE VIEW s_alpha.botanist_plant WITH SCHEMABINDING AS
+    SELECT botanist_id, plant_id, COUNT_BIG(*) AS readings
+    FROM s_alpha.recording_event
+    GROUP BY botanist_id, plant_id;');
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_botanist_plant')
+CREATE UNIQUE CLUSTERED INDEX ix_botanist_plant
+    ON s_alpha.botanist_plant (botanist_id, plant_id);
+GO
+
+IF OBJECT_ID('s_alpha.plant_watering', 'V') IS NULL
+EXEC('CREATE VIEW s_alpha.plant_watering WITH SCHEMABINDING AS
+    SELECT plant_id, last_watered, COUNT_BIG(*) AS readings
+    FROM s_alpha.recording_event
+    GROUP BY plant_id, last_watered;');
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_plant_watering')
+CREATE UNIQUE CLUSTERED INDEX ix_plant_watering
+    ON s_alpha.plant_watering (last_watered, plant_id);
+GO
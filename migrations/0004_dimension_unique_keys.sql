@@ -0,0 +1,95 @@
+-- the natural keys the loader matches dimension rows on, enforced and indexed.
+-- the old loader could insert a dimension row more than once, so before each unique index the
+-- duplicates are merged into the row with the lowest id and everything pointing at them is moved
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_botanist_name')
+BEGIN
+    SELECT botanist_id, MIN(botanist_id) OVER (PARTITION BY first_name, last_name) AS kept_id
+        INTO #botanist_map
+        FROM s_alpha.botanist;
+    DELETE FROM #botanist_map WHERE botanist_id = kept_id;
+
+    UPDATE recording SET botanist_id = map.kept_id
+        FROM s_alpha.recording_event AS recording
+        JOIN #botanist_map AS map ON map.botanist_id = recording.botanist_id;
+    UPDATE stage SET botanist_id = map.kept_id
+        FROM s_alpha.recording_event_stage AS stage
+        JOIN #botanist_map AS map ON map.botanist_id = stage.botanist_id;
+    DELETE botanist
+        FROM s_alpha.botanist AS botanist
+        JOIN #botanist_map AS map ON map.botanist_id = botanist.botanist_id;
+
+    DROP TABLE #botanist_map;
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_botanist_name')
+CREATE UNIQUE INDEX ux_botanist_name
+    ON s_alpha.botanist (first_name, last_name);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_origin_location_coordinates')
+BEGIN
+    SELECT origin_location_id,
+            MIN(origin_location_id) OVER (PARTITION BY longitude, latitude) AS kept_id
+        INTO #origin_location_map
+        FROM s_alpha.origin_location;
+    DELETE FROM #origin_location_map WHERE origin_location_id = kept_id;
+
+    UPDATE plant SET origin_location_id = map.kept_id
+        FROM s_alpha.plant AS plant
+        JOIN #origin_location_map AS map ON map.origin_location_id = plant.origin_location_id;
+    DELETE origin_location
+        FROM s_alpha.origin_location AS origin_location
+        JOIN #origin_location_map AS map
+            ON map.origin_location_id = origin_location.origin_location_id;
+
+    DROP TABLE #origin_location_map;
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_origin_location_coordinates')
+CREATE UNIQUE INDEX ux_origin_location_coordinates
+    ON s_alpha.origin_location (longitude, latitude);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_plant_name')
+BEGIN
+    SELECT plant_id, MIN(plant_id) OVER (PARTITION BY name) AS kept_id
+        INTO #plant_map
+        FROM s_alpha.plant;
+    DELETE FROM #plant_map WHERE plant_id = kept_id;
+
+    -- a reading both copies of a plant have would break ix_recording_event_plant_taken once
+    -- moved, keep the one already on the kept plant, otherwise the first one
+    DELETE recording
+        FROM s_alpha.recording_event AS recording
+        JOIN #plant_map AS map ON map.plant_id = recording.plant_id
+        WHERE EXISTS (
+            SELECT 1 FROM s_alpha.recording_event AS other
+            LEFT JOIN #plant_map AS other_map ON other_map.plant_id = other.plant_id
+            WHERE COALESCE(other_map.kept_id, other.plant_id) = map.kept_id
+            AND other.recording_taken = recording.recording_taken
+            AND (other_map.plant_id IS NULL OR other.recording_id < recording.recording_id));
+
+    UPDATE recording SET plant_id = map.kept_id
+        FROM s_alpha.recording_event AS recording
+        JOIN #plant_map AS map ON map.plant_id = recording.plant_id;
+    UPDATE stage SET plant_id = map.kept_id
+        FROM s_alpha.recording_event_stage AS stage
+        JOIN #plant_map AS map ON map.plant_id = stage.plant_id;
+    -- the vitals lambda rebuilds a baseline and reopens an alert for the kept plant
+    DELETE FROM s_alpha.plant_baseline WHERE plant_id IN (SELECT plant_id FROM #plant_map);
+    DELETE FROM s_alpha.plant_alert WHERE plant_id IN (SELECT plant_id FROM #plant_map);
+    DELETE plant
+        FROM s_alpha.plant AS plant
+        JOIN #plant_map AS map ON map.plant_id = plant.plant_id;
+
+    DROP TABLE #plant_map;
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_plant_name')
+CREATE UNIQUE INDEX ux_plant_name
+    ON s_alpha.plant (name);
+GO
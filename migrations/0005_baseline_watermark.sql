@@ -0,0 +1,6 @@
+-- the id of the newest reading in each plant's baseline, so the lambda only reads readings
+-- inserted since its last run instead of everything since the oldest baseline
+
+IF COL_LENGTH('s_alpha.plant_baseline', 'last_recording_id') IS NULL
+ALTER TABLE s_alpha.plant_baseline ADD last_recording_id INT NULL;
+GO
@@ -0,0 +1,21 @@
+-- the botanist and watering facts of archived readings, which the indexed views lose when
+-- archive.py deletes the readings they were built on
+
+IF OBJECT_ID('s_alpha.archived_botanist_plant', 'U') IS NULL
+CREATE TABLE s_alpha.archived_botanist_plant (
+    botanist_id INT NOT NULL,
+    plant_id INT NOT NULL,
+    PRIMARY KEY (botanist_id, plant_id),
+    FOREIGN KEY (botanist_id) REFERENCES s_alpha.botanist(botanist_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
+
+IF OBJECT_ID('s_alpha.archived_plant_watering', 'U') IS NULL
+CREATE TABLE s_alpha.archived_plant_watering (
+    plant_id INT NOT NULL,
+    last_watered DATETIME NOT NULL,
+    PRIMARY KEY (last_watered, plant_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
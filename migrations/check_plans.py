@@ -0,0 +1,113 @@
+"""Checks that the hot dashboard, lambda and loader queries use the indexes the migrations add.
+Each query's estimated plan is fetched with SHOWPLAN_XML, so nothing is actually run. Run it
+against a database with realistic data, on near empty tables a scan can be the cheapest plan.
+The queries are imported from the components, so their requirements need to be installed."""
+import logging
+from os import path
+import sys
+from datetime import datetime, timedelta
+import xml.etree.ElementTree as ET
+
+from migrate import get_connection
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+COMPONENT_DIRS = [path.join(ROOT, "Dashboard"), path.join(ROOT, "Pipeline"),
+                  path.join(ROOT, "lambda")]
+
+SHOWPLAN_NAMESPACE = {"plan": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+SCAN_OPERATORS = {"Table Scan", "Clustered Index Scan", "Index Scan"}
+# operators that read an index, so index maintenance on an insert does not count as using it
+READ_OPERATORS = SCAN_OPERATORS | {"Index Seek", "Clustered Index Seek"}
+
+
+def get_plan_checks(now: datetime | None = None) -> list[tuple[str, str, tuple, str, str]]:
+    """Gets (name, query, params, index the plan has to use, table it must not scan) for every
+    hot query, built from the query strings and builders the components run"""
+    for directory in COMPONENT_DIRS:
+        if directory not in sys.path:
+            sys.path.append(directory)
+    # pylint: disable=import-outside-toplevel
+    from check_vitals import CATCH_UP_READINGS_QUERY, UNSEEN_READINGS_QUERY
+    from dashboard_functions import NEW_RECORDING_QUERY, TEMPERATURE_COLUMNS, build_window_query
+    from load import INSERT_STAGED_RECORDINGS_QUERY
+
+    now = now or datetime.now()
+    day_query, day_params = build_window_query(TEMPERATURE_COLUMNS, now - timedelta(hours=24))
+    plant_query, plant_params = build_window_query(
+        TEMPERATURE_COLUMNS, now - timedelta(days=7), plant_ids=[1, 2])
+
+    return [
+        ("dashboard time window (dashboard_functions.build_window_query)",
+         day_query, tuple(day_params), "ix_recording_event_taken", "recording_event"),
+        ("dashboard plant window (dashboard_functions.build_window_query)",
+         plant_query, tuple(plant_params), "ix_recording_event_plant_taken", "recording_event"),
+        # the primary key has a generated name that starts with this
+        ("dashboard new recordings (dashboard_functions.load_new_data)",
+         NEW_RECORDING_QUERY, (2 ** 31 - 2,), "PK__recordin", "recording_event"),
+        # the lambda runs on pymssql, which uses %s placeholders
+        ("unseen readings (check_vitals.load_unseen_data)",
+         UNSEEN_READINGS_QUERY.replace("%s", "?"), (2 ** 31 - 2, now - timedelta(hours=24)),
+         "PK__recordin", "recording_event"),
+        ("catch up readings (check_vitals.load_unseen_data)",
+         CATCH_UP_READINGS_QUERY.replace("%s", "?"), (now - timedelta(minutes=5),),
+         "ix_recording_event_taken", "recording_event"),
+        ("staged recording insert (load.upload_recording_events)",
+         INSERT_STAGED_RECORDINGS_QUERY, ("plan-check",), "ix_recording_event_plant_taken",
+         "recording_event"),
+    ]
+
+
+def get_plan(conn, query: str, params: tuple) -> ET.Element:
+    """Gets the estimated plan for a query without running it"""
+    cursor = conn.cursor()
+    cursor.execute("SET SHOWPLAN_XML ON;")
+    try:
+        cursor.execute(query, params)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.execute("SET SHOWPLAN_XML OFF;")
+        cursor.close()
+    return ET.fromstring(plan)
+
+
+def check_plan(plan: ET.Element, index: str, table: str) -> list[str]:
+    """Gets the problems with a plan, an empty list if it reads the index and does not scan the table"""
+    problems = []
+    read_indexes = []
+    for operator in plan.findall(".//plan:RelOp", SHOWPLAN_NAMESPACE):
+        physical_op = operator.get("PhysicalOp")
+        if physical_op not in READ_OPERATORS:
+            continue
+        # only the operator's own objects, its child operators are nested further down
+        for obj in operator.findall("./*/plan:Object", SHOWPLAN_NAMESPACE):
+            read_indexes.append(obj.get("Index", ""))
+            if physical_op in SCAN_OPERATORS and obj.get("Table") == f"[{table}]":
+                problems.append(f"{physical_op} on {table} ({obj.get('Index', 'heap')})")
+
+    if not any(index in read_index for read_index in read_indexes):
+        problems.insert(0, f"does not use {index}")
+    return problems
+
+
+def check_plans(conn) -> bool:
+    """Checks every query's plan, logging the ones that do not use their index"""
+    passed = True
+    for name, query, params, index, table in get_plan_checks():
+        problems = check_plan(get_plan(conn, query, params), index, table)
+        if problems:
+            passed = False
+            logging.error("FAIL %s: %s", name, "; ".join(problems))
+        else:
+            logging.info("ok   %s uses %s", name, index)
+    return passed
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    load_dotenv()
+    connection = get_connection()
+    all_passed = check_plans(connection)
+    connection.close()
+    sys.exit(0 if all_passed else 1)
@@ -0,0 +1,7 @@
+"""Puts the benchmarks' pyodbc stand-in, recording connection and SQLite database on the path,
+so the plan check and migration tests run without an ODBC driver or SQL Server"""
+from pathlib import Path
+import sys
+
+BENCHMARKS = Path(__file__).resolve().parent.parent / "benchmarks"
+sys.path[:0] = [str(BENCHMARKS / "stubs"), str(BENCHMARKS)]
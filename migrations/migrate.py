@@ -0,0 +1,122 @@
+"""Applies the numbered SQL migrations in this folder that the database has not had yet,
+recording each one in s_alpha.schema_version so it is only ever applied once"""
+import argparse
+from dataclasses import dataclass
+import logging
+from os import environ, listdir, path
+import re
+
+MIGRATIONS_DIR = path.dirname(path.abspath(__file__))
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+# sqlcmd's batch separator, the driver cannot run it so batches are sent one at a time
+BATCH_SEPARATOR = re.compile(r"^\s*GO\s*$", re.IGNORECASE | re.MULTILINE)
+
+VERSION_TABLE_QUERY = """IF OBJECT_ID('s_alpha.schema_version', 'U') IS NULL
+                CREATE TABLE s_alpha.schema_version (
+                    version INT NOT NULL,
+                    name VARCHAR(200) NOT NULL,
+                    applied_at DATETIME NOT NULL DEFAULT GETDATE(),
+                    PRIMARY KEY (version)
+                );"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    """A migration file, applied in version order"""
+    version: int
+    name: str
+    path: str
+
+
+def list_migrations(directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    """Gets every migration file in the folder in version order"""
+    migrations = []
+    for file_name in listdir(directory):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2),
+                                        path.join(directory, file_name)))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Two migrations have the same version number")
+    return migrations
+
+
+def split_batches(sql: str) -> list[str]:
+    """Splits a migration into the batches between its GO lines"""
+    return [batch.strip() for batch in BATCH_SEPARATOR.split(sql) if batch.strip()]
+
+
+def get_applied_versions(conn) -> set[int]:
+    """Gets the versions already applied, creating the version table the first time"""
+    cursor = conn.cursor()
+    cursor.execute(VERSION_TABLE_QUERY)
+    conn.commit()
+    cursor.execute("SELECT version FROM s_alpha.schema_version;")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def apply_migration(conn, migration: Migration) -> None:
+    """Runs a migration and records it in one transaction, rolling back if any batch fails"""
+    with open(migration.path, encoding="utf-8") as migration_file:
+        batches = split_batches(migration_file.read())
+
+    cursor = conn.cursor()
+    try:
+        for batch in batches:
+            cursor.execute(batch)
+        cursor.execute("INSERT INTO s_alpha.schema_version (version, name) VALUES (?, ?);",
+                       (migration.version, migration.name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        logging.error("Migration %04d_%s failed and was rolled back.",
+                      migration.version, migration.name)
+        raise
+    finally:
+        cursor.close()
+    logging.info("Applied migration %04d_%s.", migration.version, migration.name)
+
+
+def migrate(conn, directory: str = MIGRATIONS_DIR, dry_run: bool = False) -> list[Migration]:
+    """Applies every pending migration in order and returns them. A dry run only lists them."""
+    applied = get_applied_versions(conn)
+    pending = [migration for migration in list_migrations(directory)
+               if migration.version not in applied]
+
+    for migration in pending:
+        if dry_run:
+            logging.info("Pending migration %04d_%s.", migration.version, migration.name)
+        else:
+            apply_migration(conn, migration)
+
+    if not pending:
+        logging.info("The database schema is up to date.")
+    return pending
+
+
+def get_connection():
+    """Connects to the database"""
+    import pyodbc
+
+    conn_str = f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={environ["DB_HOST"]};DATABASE={environ["DB_NAME"]};UID={environ["DB_USER"]};PWD={environ["DB_PASSWORD"]}'
+    return pyodbc.connect(conn_str)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="list the pending migrations without applying them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    connection = get_connection()
+    migrate(connection, dry_run=args.dry_run)
+    connection.close()
@@ -0,0 +1,69 @@
+"""Script that tests the functions in check_plans.py"""
+
+import xml.etree.ElementTree as ET
+
+from check_plans import check_plan, get_plan_checks
+
+PLAN = """<ShowPlanXML xmlns="http://schemas.microsoft.com/sqlserver/2004/07/showplan">
+  <RelOp PhysicalOp="{operator}">
+    <IndexScan>
+      <Object Schema="[s_alpha]" Table="[recording_event]" Index="[{index}]" />
+    </IndexScan>
+  </RelOp>
+</ShowPlanXML>"""
+
+
+def test_check_plan_seek_passes():
+    """Tests that a seek on the expected index has no problems"""
+    plan = ET.fromstring(PLAN.format(operator="Index Seek", index="ix_recording_event_taken"))
+    assert check_plan(plan, "ix_recording_event_taken", "recording_event") == []
+
+
+def test_check_plan_scan_fails():
+    """Tests that scanning the table is reported even when the index is used"""
+    plan = ET.fromstring(PLAN.format(operator="Index Scan", index="ix_recording_event_taken"))
+    assert check_plan(plan, "ix_recording_event_taken", "recording_event") == [
+        "Index Scan on recording_event ([ix_recording_event_taken])"]
+
+
+def test_check_plan_other_index_fails():
+    """Tests that a plan that does not touch the expected index is reported"""
+    plan = ET.fromstring(PLAN.format(operator="Index Seek", index="ix_other"))
+    assert check_plan(plan, "ix_recording_event_taken", "recording_event") == [
+        "does not use ix_recording_event_taken"]
+
+
+def test_check_plan_index_maintenance_does_not_count():
+    """Tests that an insert writing to the index is not taken as the plan reading it"""
+    plan = ET.fromstring("""<ShowPlanXML xmlns="http://schemas.microsoft.com/sqlserver/2004/07/showplan">
+  <RelOp PhysicalOp="Clustered Index Insert">
+    <Update>
+      <Object Schema="[s_alpha]" Table="[recording_event]" Index="[ix_recording_event_plant_taken]" />
+      <RelOp PhysicalOp="Table Scan">
+        <TableScan>
+          <Object Schema="[s_alpha]" Table="[recording_event_stage]" />
+        </TableScan>
+      </RelOp>
+    </Update>
+  </RelOp>
+</ShowPlanXML>""")
+    assert check_plan(plan, "ix_recording_event_plant_taken", "recording_event") == [
+        "does not use ix_recording_event_plant_taken"]
+
+
+def test_plan_checks_use_the_component_queries():
+    """Tests that the checks are built from the queries the components run, with one parameter
+    per placeholder"""
+    checks = get_plan_checks()
+    # get_plan_checks puts the components on the path
+    from check_vitals import CATCH_UP_READINGS_QUERY, UNSEEN_READINGS_QUERY
+    from load import INSERT_STAGED_RECORDINGS_QUERY
+
+    queries = [query for _, query, _, _, _ in checks]
+
+    assert INSERT_STAGED_RECORDINGS_QUERY in queries
+    assert UNSEEN_READINGS_QUERY.replace("%s", "?") in queries
+    assert CATCH_UP_READINGS_QUERY.replace("%s", "?") in queries
+    assert "JOIN s_alpha.plant" in queries[0]
+    for name, query, params, _, _ in checks:
+        assert query.count("?") == len(params), name
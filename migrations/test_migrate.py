@@ -0,0 +1,175 @@
+"""Script that tests the functions in migrate.py"""
+
+import re
+
+import pyodbc
+import pytest
+
+# shared with the loader tests, see conftest.py
+from recording_database import RecordingConnection
+from sqlite_database import SQLiteDatabase
+from migrate import MIGRATIONS_DIR, list_migrations, migrate, split_batches
+
+
+def executed_queries(conn: RecordingConnection) -> list[str]:
+    """Gets the SQL of every statement sent to a recording connection"""
+    return [query for query, _ in conn.executed]
+
+
+def committed_versions(conn: RecordingConnection) -> set[int]:
+    """Gets the migration versions whose schema_version rows were committed"""
+    return {params[0] for query, params in conn.committed
+            if query.startswith("INSERT INTO s_alpha.schema_version")}
+
+
+def write_migrations(directory, migrations: dict[str, str]) -> None:
+    """Writes migration files into a folder"""
+    for file_name, sql in migrations.items():
+        (directory / file_name).write_text(sql, encoding="utf-8")
+
+
+def test_split_batches():
+    """Tests that batches are split on GO lines only"""
+    sql = "CREATE TABLE a (go_time INT);\nGO\n\nCREATE INDEX ix ON a (go_time);\n  go  \n"
+    assert split_batches(sql) == ["CREATE TABLE a (go_time INT);", "CREATE INDEX ix ON a (go_time);"]
+
+
+def test_list_migrations_in_version_order(tmp_path):
+    """Tests that migrations are ordered by version and other files are ignored"""
+    write_migrations(tmp_path, {"0002_second.sql": "", "0001_first.sql": "", "notes.txt": ""})
+    assert [migration.name for migration in list_migrations(str(tmp_path))] == ["first", "second"]
+
+
+def test_repo_migrations_are_numbered_from_one():
+    """Tests that the shipped migrations have consecutive version numbers"""
+    versions = [migration.version for migration in list_migrations(MIGRATIONS_DIR)]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_migrate_only_applies_pending(tmp_path):
+    """Tests that applied migrations are skipped and the rest are recorded"""
+    write_migrations(tmp_path, {"0001_first.sql": "SELECT 1;\nGO\n",
+                                "0002_second.sql": "SELECT 2;\nGO\nSELECT 3;\nGO\n"})
+    conn = RecordingConnection(rows=[(1,)])
+
+    applied = migrate(conn, str(tmp_path))
+
+    queries = executed_queries(conn)
+    assert [migration.version for migration in applied] == [2]
+    assert "SELECT 1;" not in queries
+    assert queries.index("SELECT 2;") < queries.index("SELECT 3;")
+    assert committed_versions(conn) == {2}
+
+
+def test_failed_migration_is_rolled_back(tmp_path):
+    """Tests that a failing migration is not recorded and later ones are not run"""
+    write_migrations(tmp_path, {"0001_first.sql": "SELECT 1;", "0002_broken.sql": "FAIL;",
+                                "0003_third.sql": "SELECT 3;"})
+    conn = RecordingConnection(fail_query="FAIL")
+
+    with pytest.raises(pyodbc.Error):
+        migrate(conn, str(tmp_path))
+
+    assert committed_versions(conn) == {1}
+    assert conn.rolled_back
+    assert "SELECT 3;" not in executed_queries(conn)
+
+
+def test_dry_run_applies_nothing(tmp_path):
+    """Tests that a dry run lists the pending migrations without running them"""
+    write_migrations(tmp_path, {"0001_first.sql": "SELECT 1;"})
+    conn = RecordingConnection()
+    assert len(migrate(conn, str(tmp_path), dry_run=True)) == 1
+    assert committed_versions(conn) == set()
+
+
+def to_sqlite(batch: str) -> str:
+    """Rewrites the T-SQL the duplicate removal batches use into SQLite, so they can run on the
+    stand-in database. Only the constructs these migrations use are handled."""
+    batch = re.sub(r"IF NOT EXISTS \(SELECT 1 FROM sys\.indexes WHERE name = '\w+'\)\s*", "",
+                   batch)
+    batch = re.sub(r"^\s*(BEGIN|END)\s*$", "", batch, flags=re.MULTILINE)
+    batch = re.sub(r"SELECT (.+?)\s+INTO #(\w+)\s+FROM",
+                   r"CREATE TEMP TABLE \2 AS SELECT \1 FROM", batch, flags=re.DOTALL)
+    # SQLite has no joins in DELETE, and UPDATE ... FROM names the target table directly
+    batch = re.sub(
+        r"DELETE (\w+)\s+FROM (\S+) AS \1\s+JOIN (#\w+ AS \w+)\s+ON (.+?)(?:\s+WHERE (.+?))?;",
+        lambda match: (f"DELETE FROM {match[2]} AS {match[1]} WHERE EXISTS (SELECT 1 FROM "
+                       f"{match[3]} WHERE {match[4]}{f' AND {match[5]}' if match[5] else ''});"),
+        batch, flags=re.DOTALL)
+    batch = re.sub(r"UPDATE (\w+) SET (.+?)\s+FROM (\S+) AS \1\s+JOIN (#\w+ AS \w+) ON (.+?);",
+                   r"UPDATE \3 AS \1 SET \2 FROM \4 WHERE \5;", batch, flags=re.DOTALL)
+    batch = re.sub(r"DELETE (\w+)\s+FROM (\S+) AS \1", r"DELETE FROM \2 AS \1", batch)
+    batch = re.sub(r"CREATE UNIQUE INDEX (\w+)\s+ON s_alpha\.",
+                   r"CREATE UNIQUE INDEX s_alpha.\1 ON ", batch)
+    return batch.replace("#", "")
+
+
+def seed_duplicates(conn) -> None:
+    """Drops the stand-in's unique indexes and adds the duplicate rows the old loader could make.
+    Plant 3 copies plant 1, botanist 3 copies botanist 1 and location 2 copies location 1."""
+    for index in ("ux_botanist_name", "ux_origin_location_coordinates", "ux_plant_name",
+                  "ix_recording_event_plant_taken"):
+        conn.execute(f"DROP INDEX s_alpha.{index};")
+    conn.executescript("""
+        CREATE TABLE s_alpha.plant_baseline (plant_id INT NOT NULL);
+        CREATE TABLE s_alpha.plant_alert (plant_id INT NOT NULL);
+        INSERT INTO s_alpha.botanist VALUES (1, 'Carl', 'Linnaeus', 'carl@lnhm.co.uk', '1'),
+            (2, 'Gertrude', 'Jekyll', 'gertrude@lnhm.co.uk', '2'),
+            (3, 'Carl', 'Linnaeus', 'carl@lnhm.co.uk', '1');
+        INSERT INTO s_alpha.origin_location VALUES
+            (1, 1.5, 2.5, 'Resplendor', 'BR', 'BR', 'America'),
+            (2, 1.5, 2.5, 'Resplendor', 'BR', 'BR', 'America'),
+            (3, 3.5, 4.5, 'South Whittier', 'US', 'US', 'America');
+        INSERT INTO s_alpha.plant VALUES (1, 'Venus flytrap', NULL, 2, NULL),
+            (2, 'Corpse flower', NULL, 1, NULL), (3, 'Venus flytrap', NULL, 3, NULL);
+        -- 2 is a retried copy of 1, 3 clashes with 1 once plant 3 is merged into plant 1
+        INSERT INTO s_alpha.recording_event VALUES
+            (1, 1, 3, 30.0, 20.0, '2023-12-21 10:00:00', '2023-12-21 09:00:00', NULL),
+            (2, 1, 1, 30.0, 20.0, '2023-12-21 10:00:00', '2023-12-21 09:00:00', NULL),
+            (3, 3, 1, 31.0, 21.0, '2023-12-21 10:00:00', '2023-12-21 09:00:00', NULL),
+            (4, 3, 1, 32.0, 22.0, '2023-12-21 10:01:00', '2023-12-21 09:00:00', NULL);
+        INSERT INTO s_alpha.recording_event_stage VALUES
+            ('run', 3, 3, 32.0, 22.0, '2023-12-21 10:02:00', '2023-12-21 09:00:00');
+        INSERT INTO s_alpha.plant_baseline VALUES (1), (3);
+        INSERT INTO s_alpha.plant_alert VALUES (3);
+        """)
+
+
+def test_unique_indexes_remove_duplicates_first(tmp_path):
+    """Tests that running the migrations on a database with duplicates merges them into the
+    lowest id and then builds every unique index"""
+    conn = SQLiteDatabase(tmp_path).connect()
+    seed_duplicates(conn)
+
+    created = []
+    for migration in list_migrations(MIGRATIONS_DIR):
+        with open(migration.path, encoding="utf-8") as migration_file:
+            batches = split_batches(migration_file.read())
+        for position, batch in enumerate(batches):
+            match = re.search(r"CREATE UNIQUE INDEX (\w+)", batch)
+            if match:
+                # the batch before each unique index removes the duplicates it would fail on
+                conn.executescript(to_sqlite(batches[position - 1]))
+                conn.executescript(to_sqlite(batch))
+                created.append(match.group(1))
+
+    def rows(query: str) -> list[tuple]:
+        return conn.execute(query).fetchall()
+
+    indexes = {name for (name,) in conn.execute(
+        "SELECT name FROM s_alpha.sqlite_master WHERE type = 'index';")}
+    assert set(created) == {"ix_recording_event_plant_taken", "ux_botanist_name",
+                            "ux_origin_location_coordinates", "ux_plant_name"}
+    assert set(created) <= indexes
+    assert rows("SELECT botanist_id FROM s_alpha.botanist ORDER BY 1;") == [(1,), (2,)]
+    assert rows("SELECT origin_location_id FROM s_alpha.origin_location ORDER BY 1;") == [
+        (1,), (3,)]
+    assert rows("SELECT plant_id, origin_location_id FROM s_alpha.plant ORDER BY 1;") == [
+        (1, 1), (2, 1)]
+    assert rows("""SELECT recording_id, plant_id, botanist_id
+                   FROM s_alpha.recording_event ORDER BY 1;""") == [(1, 1, 1), (4, 1, 1)]
+    assert rows("SELECT plant_id, botanist_id FROM s_alpha.recording_event_stage;") == [(1, 1)]
+    assert rows("SELECT plant_id FROM s_alpha.plant_baseline;") == [(1,)]
+    assert rows("SELECT plant_id FROM s_alpha.plant_alert;") == []
+    conn.close()
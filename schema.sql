@@ -1,7 +1,21 @@
+-- drops and recreates every table, use migrations/migrate.py to update an existing database
 USE plants;
 GO
 
+-- the indexed views need these when they are created, sqlcmd leaves QUOTED_IDENTIFIER off without -I
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
 
+DROP TABLE IF EXISTS s_alpha.schema_version;
+DROP VIEW IF EXISTS s_alpha.botanist_plant;
+DROP VIEW IF EXISTS s_alpha.plant_watering;
+DROP TABLE IF EXISTS s_alpha.archived_botanist_plant;
+DROP TABLE IF EXISTS s_alpha.archived_plant_watering;
+DROP TABLE IF EXISTS s_alpha.plant_alert;
+DROP TABLE IF EXISTS s_alpha.plant_baseline;
+DROP TABLE IF EXISTS s_alpha.recording_event_stage;
 DROP TABLE IF EXISTS s_alpha.recording_event;
 DROP TABLE IF EXISTS s_alpha.plant;
 DROP TABLE IF EXISTS s_alpha.botanist;
@@ -43,6 +57,18 @@ CREATE TABLE s_alpha.botanist (
     );
 GO
 
+CREATE UNIQUE INDEX ux_botanist_name
+    ON s_alpha.botanist (first_name, last_name);
+GO
+
+CREATE UNIQUE INDEX ux_origin_location_coordinates
+    ON s_alpha.origin_location (longitude, latitude);
+GO
+
+CREATE UNIQUE INDEX ux_plant_name
+    ON s_alpha.plant (name);
+GO
+
 CREATE TABLE s_alpha.recording_event (
     recording_id INT NOT NULL IDENTITY(1, 1),
     plant_id INT NOT NULL,
@@ -51,8 +77,98 @@ CREATE TABLE s_alpha.recording_event (
     temperature FLOAT NOT NULL,
     recording_taken DATETIME NOT NULL,
     last_watered DATETIME NOT NULL,
+    run_id VARCHAR(36) NULL,
     PRIMARY KEY (recording_id),
     FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id),
     FOREIGN KEY (botanist_id) REFERENCES s_alpha.botanist(botanist_id)
     );
 GO
+
+CREATE UNIQUE INDEX ix_recording_event_plant_taken
+    ON s_alpha.recording_event (plant_id, recording_taken);
+GO
+
+CREATE INDEX ix_recording_event_taken
+    ON s_alpha.recording_event (recording_taken)
+    INCLUDE (plant_id, soil_moisture, temperature, last_watered);
+GO
+
+-- indexed views, SQL Server keeps them up to date as the pipeline inserts recordings
+CREATE VIEW s_alpha.botanist_plant WITH SCHEMABINDING AS
+    SELECT botanist_id, plant_id, COUNT_BIG(*) AS readings
+    FROM s_alpha.recording_event
+    GROUP BY botanist_id, plant_id;
+GO
+
+CREATE UNIQUE CLUSTERED INDEX ix_botanist_plant
+    ON s_alpha.botanist_plant (botanist_id, plant_id);
+GO
+
+CREATE VIEW s_alpha.plant_watering WITH SCHEMABINDING AS
+    SELECT plant_id, last_watered, COUNT_BIG(*) AS readings
+    FROM s_alpha.recording_event
+    GROUP BY plant_id, last_watered;
+GO
+
+CREATE UNIQUE CLUSTERED INDEX ix_plant_watering
+    ON s_alpha.plant_watering (last_watered, plant_id);
+GO
+
+-- the view rows of readings moved to the archive, archive.py keeps them before deleting
+CREATE TABLE s_alpha.archived_botanist_plant (
+    botanist_id INT NOT NULL,
+    plant_id INT NOT NULL,
+    PRIMARY KEY (botanist_id, plant_id),
+    FOREIGN KEY (botanist_id) REFERENCES s_alpha.botanist(botanist_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
+
+CREATE TABLE s_alpha.archived_plant_watering (
+    plant_id INT NOT NULL,
+    last_watered DATETIME NOT NULL,
+    PRIMARY KEY (last_watered, plant_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
+
+CREATE TABLE s_alpha.recording_event_stage (
+    run_id VARCHAR(36) NOT NULL,
+    plant_id INT NOT NULL,
+    botanist_id INT NOT NULL,
+    soil_moisture FLOAT NOT NULL,
+    temperature FLOAT NOT NULL,
+    recording_taken DATETIME NOT NULL,
+    last_watered DATETIME NOT NULL
+    );
+GO
+
+CREATE INDEX ix_recording_event_stage_run
+    ON s_alpha.recording_event_stage (run_id);
+GO
+
+CREATE TABLE s_alpha.plant_baseline (
+    plant_id INT NOT NULL,
+    readings INT NOT NULL,
+    last_recording DATETIME NOT NULL,
+    temperature_mean FLOAT NOT NULL,
+    temperature_var FLOAT NOT NULL,
+    moisture_mean FLOAT NOT NULL,
+    moisture_var FLOAT NOT NULL,
+    last_recording_id INT NULL,
+    PRIMARY KEY (plant_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
+
+CREATE TABLE s_alpha.plant_alert (
+    plant_id INT NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    opened_at DATETIME NOT NULL,
+    last_notified DATETIME NULL,
+    healthy_streak INT NOT NULL,
+    details VARCHAR(1000) NOT NULL,
+    PRIMARY KEY (plant_id),
+    FOREIGN KEY (plant_id) REFERENCES s_alpha.plant(plant_id)
+    );
+GO
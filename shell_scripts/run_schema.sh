@@ -1,3 +1,3 @@
 source .env
 
-sqlcmd -S $DB_HOST -U $DB_USER -P $DB_PASSWORD -i schema.sql
\ No newline at end of file
+python3 migrations/migrate.py